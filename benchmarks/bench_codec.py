@@ -0,0 +1,67 @@
+"""
+Micro-benchmark of the per-request codec overhead: body parsing, schema validation and response serialization.
+
+Compares the previous path (stdlib json, a fresh schema instance per request) with the compiled codec.
+
+Usage: python benchmarks/bench_codec.py [--repeat N]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from codec import JSON_BACKEND, compiled_schema, dumps, loads  # noqa: E402
+from schemas import MoveLRequestSchema, MoveLSRequestSchema  # noqa: E402
+
+
+def make_movels_body(waypoints):
+    coordinates_list = [[random.uniform(-0.5, 0.5) for _ in range(6)] for _ in range(waypoints)]
+    return json.dumps({"coordinates_list": coordinates_list, "acceleration": 0.1, "velocity": 0.1}).encode("utf-8")
+
+
+def make_movel_body():
+    return json.dumps({"coordinates_and_angles": [0.1, 0.2, 0.3, 0.0, 3.14, 0.0], "acceleration": 0.1,
+                       "velocity": 0.1, "pose_object": True, "relative": False}).encode("utf-8")
+
+
+def before(body, schema_class, response):
+    data = schema_class().load(json.loads(body))
+    return json.dumps({"status": response or data})
+
+
+def after(body, schema_class, response):
+    data = compiled_schema(schema_class).load(loads(body))
+    return dumps({"status": response or data})
+
+
+def measure(function, body, schema_class, response, repeat):
+    number = max(1, repeat)
+    return min(timeit.repeat(lambda: function(body, schema_class, response), number=number, repeat=3)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200, help="iterations per case for the smallest body")
+    args = parser.parse_args()
+
+    pose = [0.1, 0.2, 0.3, 0.0, 3.14, 0.0]
+    cases = [("movel", make_movel_body(), MoveLRequestSchema, args.repeat)]
+    for waypoints in (10, 100, 1000, 10000):
+        cases.append((f"movels x{waypoints}", make_movels_body(waypoints), MoveLSRequestSchema,
+                      max(1, args.repeat * 10 // waypoints)))
+
+    print(f"JSON backend: {JSON_BACKEND}")
+    print(f"{'case':<16}{'before (ms)':>14}{'after (ms)':>14}{'speedup':>10}")
+    for name, body, schema_class, repeat in cases:
+        assert before(body, schema_class, pose) is not None and after(body, schema_class, pose) is not None
+        old = measure(before, body, schema_class, pose, repeat) * 1000
+        new = measure(after, body, schema_class, pose, repeat) * 1000
+        print(f"{name:<16}{old:>14.3f}{new:>14.3f}{old / new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Benchmark of the pcap analyzer on a synthetic capture.
+
+Writes a capture of an API sending movel commands and sequence programs to a robot on 30002, with the robot state on
+30002 at 10 Hz, an RTDE runtime state recipe on 30004 and realtime data on 30003 at 125 Hz, and with some segments
+out of order or retransmitted. Every program starts and ends after a random latency the benchmark knows. It then runs
+the analyzer on the capture and reports its throughput, its peak memory and how far the latencies it measured are from
+the injected ones, which must be within an RTDE sample period.
+
+Usage: python benchmarks/bench_pcap_analyzer.py --seconds 600
+"""
+import argparse
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pcap_analyzer import PcapAnalyzer  # noqa: E402
+
+ROBOT, CLIENT = bytes([10, 0, 0, 10]), bytes([10, 0, 0, 2])
+RTDE_PERIOD = 0.008
+STATE_PERIOD = 0.1
+SEGMENT_SIZE = 1448
+
+
+class CaptureWriter:
+
+    def __init__(self, path):
+        self._file = open(path, "wb")
+        self._file.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+        self._sequences = {}
+        self.packets = 0
+
+    def write(self, timestamp, source, source_port, destination, destination_port, payload, sequence=None):
+        key = (source, source_port, destination, destination_port)
+        if sequence is None:
+            sequence = self._sequences.get(key, 1000)
+            self._sequences[key] = sequence + len(payload)
+        tcp = struct.pack("!HHIIBBHHH", source_port, destination_port, sequence, 0, 5 << 4, 0x18, 65535, 0, 0)
+        ip = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(tcp) + len(payload), 0, 0, 64, 6, 0, source,
+                         destination)
+        frame = b"\x00" * 12 + b"\x08\x00" + ip + tcp + payload
+        seconds = int(timestamp)
+        self._file.write(struct.pack("<IIII", seconds, int((timestamp - seconds) * 1e6), len(frame), len(frame)))
+        self._file.write(frame)
+        self.packets += 1
+        return sequence
+
+    def close(self):
+        self._file.close()
+
+
+def robot_state(running):
+    mode = struct.pack("!iBQ????????B", 47, 0, 0, True, True, True, False, False, running, False, 7, 0) + bytes(22)
+    joints = struct.pack("!iB", 251, 1) + bytes(246)
+    body = mode + joints
+    return struct.pack("!iB", 5 + len(body), 16) + body
+
+
+def rtde(kind, payload):
+    return struct.pack("!HB", 3 + len(payload), ord(kind)) + payload
+
+
+def command(index):
+    if index % 3:
+        return f"movel(p[{0.1 + index % 7 / 100}, -0.4, 0.3, 0, 3.14, 0], 0.5, 0.25)\n".encode("utf-8")
+    steps = "".join(f"  movel(p[{0.1 + step / 100}, -0.4, 0.3, 0, 3.14, 0], 0.5, 0.25)\n" for step in range(60))
+    return f"def sequenceProg():\n{steps}  if True:\n    sleep(0.1)\n  end\nend\n".encode("utf-8")
+
+
+def write_capture(path, seconds, seed):
+    rng = random.Random(seed)
+    writer = CaptureWriter(path)
+    secondary, realtime, rtde_port = (CLIENT, 50000, ROBOT, 30002), (CLIENT, 50001, ROBOT, 30003), \
+        (CLIENT, 50002, ROBOT, 30004)
+    writer.write(0.0, *rtde_port, rtde("V", struct.pack("!H", 2)))
+    writer.write(0.001, *rtde_port, rtde("O", struct.pack("!d", 125) + b"timestamp,runtime_state"))
+    writer.write(0.002, ROBOT, 30004, CLIENT, 50002, rtde("O", b"\x01DOUBLE,UINT32"))
+    programs, t, index = [], 1.0, 0
+    while t < seconds - 3:
+        start = t + rng.uniform(0.02, 0.06)
+        end = start + rng.uniform(0.3, 1.5)
+        programs.append((t, start, end, command(index)))
+        t, index = end + rng.uniform(0.05, 0.5), index + 1
+    realtime_data = bytes(1108)
+    program, tick = 0, 0
+    while tick * RTDE_PERIOD < seconds:
+        now = tick * RTDE_PERIOD
+        if program < len(programs) and programs[program][0] < now:
+            sent_at, _, _, script = programs[program]
+            segments = [script[offset:offset + SEGMENT_SIZE] for offset in range(0, len(script), SEGMENT_SIZE)]
+            sequences = [writer.write(sent_at, *secondary, segment) for segment in segments[:1]]
+            if len(segments) > 1:
+                # The rest of a long program arrives out of order, with the first segment retransmitted.
+                base = sequences[0] + len(segments[0])
+                offsets = [base + sum(len(segment) for segment in segments[1:i]) for i in range(1, len(segments))]
+                for segment, sequence in reversed(list(zip(segments[1:], offsets))):
+                    writer.write(sent_at, *secondary, segment, sequence=sequence)
+                writer.write(sent_at, *secondary, segments[0], sequence=sequences[0])
+                writer.write(sent_at, *secondary, b"", sequence=base + sum(len(segment) for segment in segments[1:]))
+                writer._sequences[secondary] = offsets[-1] + len(segments[-1])
+            program += 1
+        running = any(start <= now < end for _, start, end, _ in programs[max(program - 2, 0):program + 1])
+        writer.write(now, ROBOT, 30004, CLIENT, 50002,
+                     rtde("U", b"\x01" + struct.pack("!dI", now, 2 if running else 1)))
+        writer.write(now, ROBOT, 30003, CLIENT, 50001, realtime_data)
+        if tick % round(STATE_PERIOD / RTDE_PERIOD) == 0:
+            writer.write(now, ROBOT, 30002, CLIENT, 50000, robot_state(running))
+        tick += 1
+    writer.close()
+    return writer.packets, programs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=600, help="duration of the synthetic capture")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.gettempdir(), f"bench_pcap_analyzer_{os.getpid()}.pcap")
+    try:
+        packets, programs = write_capture(path, args.seconds, args.seed)
+        size = os.path.getsize(path)
+        analyzer = PcapAnalyzer()
+        start = time.perf_counter()
+        analyzer.analyze(path)
+        report = analyzer.get_report()
+        elapsed = time.perf_counter() - start
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+    robot = report["robots"]["10.0.0.10"]
+    print(f"capture: {packets} packets, {size / 1e6:.1f} MB, {len(programs)} programs")
+    print(f"analyzed in {elapsed:.2f} s: {packets / elapsed:.0f} packets/s, {size / 1e6 / elapsed:.1f} MB/s")
+    if resource is not None:
+        scale = 1 if sys.platform == "darwin" else 1024
+        print(f"peak memory: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6:.0f} MB")
+    print(f"completed {robot['completed']}/{len(programs)}, unmatched {robot['unmatched']}, "
+          f"state sampled at {robot['state_rate']:.0f} Hz")
+    for name, injected in (("command_to_start", [start - sent for sent, start, _, _ in programs]),
+                           ("start_to_end", [end - start for _, start, end, _ in programs])):
+        measured = robot["latency"][name]
+        print(f"{name}: injected p50 {np.median(injected) * 1000:.1f} ms, measured p50 {measured['p50'] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark of the shared memory state snapshot.
+
+Publishes states from this process, as fast as possible or at --rate, while --readers other processes read them, and
+reports the consistent reads per second of every reader, the reads retried because a write was in progress and the
+torn reads, which must be zero.
+
+Usage: python benchmarks/bench_snapshot.py --readers 2 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from state_snapshot import SNAPSHOT_DTYPE, StateSnapshotReader, StateSnapshotWriter  # noqa: E402
+
+
+def read(name, seconds, started, results):
+    reader = StateSnapshotReader(name)
+    out = np.empty((), dtype=SNAPSHOT_DTYPE)
+    reads = torn = 0
+    started.wait()
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        snapshot = reader.read(out)
+        if snapshot is None:
+            continue
+        reads += 1
+        # Every field of a state holds the same number, a torn read mixes two states.
+        if (snapshot["pose"] != snapshot["timestamp"]).any() or (snapshot["joints"] != snapshot["timestamp"]).any():
+            torn += 1
+    results.put((reads / seconds, reader.retries, torn))
+    reader.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=2, help="reader processes")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--rate", type=float, default=0, help="states per second to publish, 0 for as fast as possible")
+    args = parser.parse_args()
+
+    writer = StateSnapshotWriter(f"bench_snapshot_{os.getpid()}")
+    context = multiprocessing.get_context("spawn")
+    started = context.Event()
+    results = context.Queue()
+    readers = [context.Process(target=read, args=(writer.name, args.seconds, started, results))
+               for _ in range(args.readers)]
+    for reader in readers:
+        reader.start()
+    writer.publish(0.0, [0.0] * 6, [0.0] * 6)
+    # Let the readers attach before timing.
+    time.sleep(1)
+    started.set()
+    published = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < args.seconds:
+        published += 1
+        writer.publish(published, [published] * 6, [published] * 6)
+        if args.rate:
+            time.sleep(1 / args.rate)
+    elapsed = time.perf_counter() - start
+    stats = [results.get() for _ in readers]
+    for reader in readers:
+        reader.join()
+    writer.close()
+
+    print(f"published {published / elapsed:.0f} states/s")
+    print(f"{'reader':<8}{'reads/s':>14}{'retries':>10}{'torn':>6}")
+    for index, (rate, retries, torn) in enumerate(stats):
+        print(f"{index:<8}{rate:>14.0f}{retries:>10}{torn:>6}")
+
+
+if __name__ == "__main__":
+    main()
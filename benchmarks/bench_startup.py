@@ -0,0 +1,57 @@
+"""
+Benchmark of the cold start of the entry points.
+
+Imports the top level imports of every entry point in a new interpreter, several times, and reports the median wall
+time and the time spent importing. An entry point slower than its budget makes the benchmark exit with an error, so it
+guards against a heavy dependency being imported at startup again.
+
+Usage: python benchmarks/bench_startup.py --runs 5 --budget proxy_server=500
+"""
+import argparse
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from startup_profile import DIRECTORY, time_imports  # noqa: E402
+
+ENTRY_POINTS = ("main", "socket_server", "proxy_server", "socket_listener", "start")
+# Budgets in milliseconds, about twice the measured cold start of every entry point.
+DEFAULT_BUDGETS = {"main": 1200, "socket_server": 1000, "proxy_server": 600, "socket_listener": 300, "start": 300}
+
+
+def parse_budget(value):
+    name, milliseconds = value.split("=")
+    if name not in ENTRY_POINTS:
+        raise argparse.ArgumentTypeError(f"Unknown entry point {name}")
+    return name, float(milliseconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="cold starts per entry point")
+    parser.add_argument("--budget", type=parse_budget, action="append", default=[],
+                        help="maximum median wall time of an entry point in ms, as name=ms")
+    args = parser.parse_args()
+    budgets = {**DEFAULT_BUDGETS, **dict(args.budget)}
+
+    failed = []
+    print(f"{'entry point':<18}{'wall (ms)':>12}{'imports (ms)':>14}{'modules':>10}{'budget (ms)':>14}")
+    for name in ENTRY_POINTS:
+        walls, imports = [], []
+        for _ in range(args.runs):
+            elapsed, records = time_imports(os.path.join(DIRECTORY, f"{name}.py"))
+            walls.append(elapsed * 1000)
+            imports.append(sum(record[1] for record in records if record[2] == 0) / 1000)
+        wall = statistics.median(walls)
+        print(f"{name:<18}{wall:>12.0f}{statistics.median(imports):>14.0f}{len(records):>10}{budgets[name]:>14.0f}")
+        if wall > budgets[name]:
+            failed.append(name)
+    if failed:
+        print(f"Over budget: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark of the stop path of the REST API.
+
+Runs the API in this process with the robot service writing to one end of a socket pair instead of the robot. For
+every stop, it keeps the robot busy with a motion that runs until it is cancelled and --queued motions waiting behind
+it. It then posts to /<BOT_NAME>/stop, checks that the running motion was cancelled and the queue flushed, and that the
+stop command reached the other end of the socket. It reports the stop latency from the request sent to the stop
+command read on the other end, the latency the API measured and the round trip of the request. The benchmark exits
+with an error if the 99th percentile of the latency to the wire is over the budget, so a stop that waits behind
+motions again is caught.
+
+Usage: python benchmarks/bench_stop.py --stops 200 --queued 4 --budget-ms 5
+"""
+import argparse
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ENVIRONMENT", "dev")
+os.environ.setdefault("BOT_NAME", "ur")
+os.environ.setdefault("STATE_SNAPSHOT", "False")
+# Queue the motions of every stop whatever the admission limit of the API.
+os.environ.setdefault("MOTION_QUEUE_MAX_DEPTH", "1000")
+
+import main as api  # noqa: E402
+from logger import Logger  # noqa: E402
+from motion_dispatcher import MotionCancelledError  # noqa: E402
+from urx_service import DefaultUrxEService, UrxEService  # noqa: E402
+
+
+def make_service(robot_socket):
+    """
+        Make the robot service with its socket to the robot replaced by robot_socket, without connecting to a robot.
+    """
+    service = DefaultUrxEService.__new__(DefaultUrxEService)
+    UrxEService.__init__(service, Logger("bench_stop"))
+    service._s = robot_socket
+    service._send_lock = threading.Lock()
+    return service
+
+
+def read_commands(robot_end, received):
+    """
+        Read the commands written to the robot socket and the time they were read at.
+    """
+    while True:
+        data = robot_end.recv(4096)
+        if not data:
+            return
+        received.append((time.perf_counter(), data))
+
+
+def run_motion(dispatcher, until_cancelled, outcomes):
+    def motion():
+        while until_cancelled and not dispatcher.is_cancelled():
+            time.sleep(0.001)
+
+    try:
+        dispatcher.run(motion)
+        outcomes.append("cancelled" if until_cancelled else "completed")
+    except MotionCancelledError:
+        outcomes.append("flushed")
+
+
+def busy(dispatcher, queued, outcomes):
+    """
+        Start a motion that runs until it is cancelled and queue motions behind it.
+    """
+    threads = [threading.Thread(target=run_motion, args=(dispatcher, True, outcomes))]
+    threads[0].start()
+    while not dispatcher.get_stats()["running"]:
+        time.sleep(0.0005)
+    for _ in range(queued):
+        threads.append(threading.Thread(target=run_motion, args=(dispatcher, False, outcomes)))
+        threads[-1].start()
+    while dispatcher.get_stats()["queued"] < queued:
+        time.sleep(0.0005)
+    return threads
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stops", type=int, default=200)
+    parser.add_argument("--queued", type=int, default=4, help="motions queued behind the running one at every stop")
+    parser.add_argument("--budget-ms", type=float, default=5,
+                        help="maximum 99th percentile of the latency from the request to the stop command read")
+    args = parser.parse_args()
+
+    service_end, robot_end = socket.socketpair()
+    received = []
+    threading.Thread(target=read_commands, args=(robot_end, received), daemon=True).start()
+    api.urx_service = make_service(service_end)
+    client = api.app.test_client()
+    dispatcher = api.urx_service._dispatcher
+    wire_latencies, latencies, round_trips = [], [], []
+    for _ in range(args.stops):
+        outcomes = []
+        threads = busy(dispatcher, args.queued, outcomes)
+        received.clear()
+        start = time.perf_counter()
+        response = client.post(f"/{api.BOT_NAME}/stop", json={"mode": "joint"})
+        round_trips.append((time.perf_counter() - start) * 1000)
+        body = response.get_json()
+        for thread in threads:
+            thread.join()
+        if (response.status_code != 200 or not body["running"] or body["flushed"] != args.queued
+                or sorted(outcomes) != ["cancelled"] + ["flushed"] * args.queued):
+            print(f"Stop did not cancel the running motion and flush the queue: {body}, {outcomes}")
+            sys.exit(1)
+        deadline = time.perf_counter() + 1
+        while not received and time.perf_counter() < deadline:
+            time.sleep(0.0001)
+        if not received or not received[0][1].startswith(b"stopj("):
+            print(f"Stop command not received by the robot socket: {received}")
+            sys.exit(1)
+        wire_latencies.append((received[0][0] - start) * 1000)
+        latencies.append(body["latency"] * 1000)
+
+    print(f"{'':<12}{'p50 (ms)':>10}{'p99 (ms)':>10}{'max (ms)':>10}")
+    for name, values in (("to wire", wire_latencies), ("in API", latencies), ("round trip", round_trips)):
+        print(f"{name:<12}{statistics.median(values):>10.3f}{percentile(values, 0.99):>10.3f}{max(values):>10.3f}")
+    print(f"motions: {dispatcher.get_stats()}")
+    if percentile(wire_latencies, 0.99) > args.budget_ms:
+        print(f"Stop latency over budget: {percentile(wire_latencies, 0.99):.3f} ms > {args.budget_ms} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Benchmark of the trajectory pre-validation of movels bodies.
+
+Usage: python benchmarks/bench_trajectory.py
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trajectory import TrajectoryValidator  # noqa: E402
+
+
+def make_coordinates_list(waypoints):
+    t = np.linspace(0, 2 * np.pi, waypoints)
+    poses = np.column_stack((0.4 + 0.1 * np.cos(t), 0.1 * np.sin(t), np.full(waypoints, 0.3),
+                             np.zeros(waypoints), np.full(waypoints, np.pi), np.zeros(waypoints)))
+    return poses.tolist()
+
+
+def main():
+    validator = TrajectoryValidator()
+    print(f"{'waypoints':<12}{'validate (ms)':>16}")
+    for waypoints in (10, 100, 1000, 10000, 100000):
+        coordinates_list = make_coordinates_list(waypoints)
+        number = max(1, 10000 // waypoints)
+        seconds = min(timeit.repeat(lambda: validator.validate_movels(coordinates_list, 0.1, 0.1), number=number,
+                                    repeat=3)) / number
+        print(f"{waypoints:<12}{seconds * 1000:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
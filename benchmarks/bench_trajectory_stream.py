@@ -0,0 +1,58 @@
+"""
+Benchmark of the parsing and spooling of streamed trajectories.
+
+Parses NDJSON and CSV trajectories from 1000 to 1000000 waypoints, validates them and writes them to the spool file
+as the trajectory endpoint does, then reads them back in chunks. Reports the waypoints per second and the peak
+memory traced while spooling, which must not grow with the trajectory.
+
+Usage: python benchmarks/bench_trajectory_stream.py
+"""
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trajectory import TrajectoryValidator  # noqa: E402
+from trajectory_stream import read_chunks, read_waypoints, spool_trajectory  # noqa: E402
+
+CHUNK_SIZE = 500
+
+
+def make_body(waypoints, stream_format):
+    t = np.linspace(0, 2 * np.pi, waypoints)
+    poses = np.column_stack((0.4 + 0.1 * np.cos(t), 0.1 * np.sin(t), np.full(waypoints, 0.3),
+                             np.zeros(waypoints), np.full(waypoints, np.pi), np.zeros(waypoints)))
+    if stream_format == "ndjson":
+        lines = (f"[{', '.join(f'{value:.6f}' for value in pose)}]\n" for pose in poses)
+    else:
+        lines = (f"{','.join(f'{value:.6f}' for value in pose)}\n" for pose in poses)
+    return "".join(lines).encode("utf-8")
+
+
+def main():
+    validator = TrajectoryValidator()
+    print(f"{'format':<8}{'waypoints':>12}{'waypoints/s':>14}{'peak (KiB)':>12}")
+    for stream_format in ("ndjson", "csv"):
+        for waypoints in (1000, 10000, 100000, 1000000):
+            stream = io.BytesIO(make_body(waypoints, stream_format))
+            tracemalloc.start()
+            start = time.perf_counter()
+            path, count = spool_trajectory(read_waypoints(stream, stream_format), validator, 0.1, 0.1)
+            try:
+                chunks = sum(1 for _ in read_chunks(path, CHUNK_SIZE))
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+                os.remove(path)
+            assert count == waypoints and chunks == -(-waypoints // CHUNK_SIZE)
+            print(f"{stream_format:<8}{waypoints:>12}{waypoints / elapsed:>14.0f}{peak / 1024:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Load generator for the telemetry fan-out of socket_server.py.
+
+Connects a number of subscribers, some of them slow, to a running socket server, publishes frames to their topic
+and reports the rate every subscriber received and the frames the server dropped for the slow ones.
+
+Usage: python benchmarks/load_fanout.py --clients 12 --slow-clients 2 --rate 500 --seconds 10
+"""
+import argparse
+import os
+import random
+import threading
+import time
+
+import requests
+import socketio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class Subscriber:
+
+    def __init__(self, url, topic, delay, rate=None, aggregation="latest"):
+        self.received = 0
+        self.bytes = 0
+        self._delay = delay
+        # The client handles every frame in a thread of its own, a slow subscriber handles them one at a time.
+        self._lock = threading.Lock()
+        self._client = socketio.Client()
+        self._client.on("telemetry", self.__on_frame)
+        self._client.connect(url, transports=["websocket"])
+        self._client.call("subscribe", {"topic": topic, "rate": rate, "aggregation": aggregation, "ack": True})
+
+    def __on_frame(self, topic, payload):
+        self.received += 1
+        self.bytes += len(payload) if isinstance(payload, str) else 0
+        if self._delay:
+            with self._lock:
+                time.sleep(self._delay)
+
+    def close(self):
+        self._client.disconnect()
+
+
+def publish(url, topic, rate, seconds, payload_size, numeric):
+    client = socketio.Client()
+    client.connect(url, transports=["websocket"])
+    # Numeric frames are lists of floats of about the same encoded size, which mean and minmax can aggregate. Other
+    # frames are text, as the attachments of binary frames handled in threads of their own could be reassembled out
+    # of order under load.
+    payload = [random.random() for _ in range(max(payload_size // 20, 1))] if numeric \
+        else os.urandom(payload_size // 2 + 1).hex()[:payload_size]
+    published = 0
+    start = time.perf_counter()
+    next_frame = start
+    while time.perf_counter() - start < seconds:
+        client.emit("publish", {"topic": topic, "payload": payload})
+        published += 1
+        if rate:
+            next_frame += 1 / rate
+            delay = next_frame - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    elapsed = time.perf_counter() - start
+    client.disconnect()
+    return published, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=f"http://{os.getenv('WEBSOCKET_HOST')}:{os.getenv('WEBSOCKET_PORT')}")
+    parser.add_argument("--topic", default=f"{os.getenv('BOT_NAME')}/state")
+    parser.add_argument("--clients", type=int, default=12, help="number of subscribers")
+    parser.add_argument("--slow-clients", type=int, default=2, help="subscribers that take --slow-delay per frame")
+    parser.add_argument("--slow-delay", type=float, default=0.05, help="seconds a slow subscriber takes per frame")
+    parser.add_argument("--rate", type=float, default=0, help="frames per second to publish, 0 for as fast as possible")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--payload-size", type=int, default=1024, help="bytes per frame")
+    parser.add_argument("--subscriber-rate", type=float, default=None,
+                        help="frames per second each subscriber asks for, every frame by default")
+    parser.add_argument("--aggregation", choices=["latest", "mean", "minmax"], default="latest",
+                        help="how the subscribers reduce the frames of each period, mean and minmax publish numbers")
+    args = parser.parse_args()
+
+    subscribers = [Subscriber(args.url, args.topic, args.slow_delay if index < args.slow_clients else 0,
+                              args.subscriber_rate, args.aggregation)
+                   for index in range(args.clients)]
+    result = {}
+    publisher = threading.Thread(target=lambda: result.update(
+        zip(("published", "elapsed"), publish(args.url, args.topic, args.rate, args.seconds, args.payload_size,
+                                            args.aggregation != "latest"))))
+    publisher.start()
+    publisher.join()
+    # Let the frames in flight arrive before reading the counters.
+    time.sleep(1)
+    stats = requests.get(f"{args.url}/stats").json()
+    received = [(subscriber.received, subscriber.bytes) for subscriber in subscribers]
+    for subscriber in subscribers:
+        subscriber.close()
+
+    published, elapsed = result["published"], result["elapsed"]
+    dropped = sum(client["dropped"] for client in stats["clients"].values())
+    print(f"published {published} frames of {args.payload_size} bytes in {elapsed:.1f} s "
+          f"({published / elapsed:.0f} frames/s), server dropped {dropped} frames")
+    print(f"{'subscriber':<12}{'kind':<8}{'frames/s':>12}{'MB/s':>10}")
+    for index, (frames, size) in enumerate(received):
+        kind = "slow" if index < args.slow_clients else "fast"
+        print(f"{index:<12}{kind:<8}{frames / elapsed:>12.0f}{size / elapsed / 1e6:>10.2f}")
+    if len(received) > args.slow_clients:
+        delivered = sum(frames for frames, _ in received[args.slow_clients:]) / elapsed
+        print(f"fast subscribers received {delivered:.0f} frames/s in total")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import math
+
+from marshmallow import fields, missing as missing_, RAISE
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    JSON_BACKEND = "orjson"
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(obj):
+        """
+            Serialize an object to JSON.
+
+            Parameters
+            ----------
+            obj : object
+                The object to serialize. Numpy arrays and scalars are supported.
+
+            Returns
+            -------
+            bytes
+                The UTF-8 encoded JSON document.
+        """
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+
+    loads = orjson.loads
+else:
+    import json
+
+    JSON_BACKEND = "json"
+
+    def _default(obj):
+        if hasattr(obj, "tolist"):
+            return obj.tolist()
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    def dumps(obj):
+        """
+            Serialize an object to JSON.
+
+            Parameters
+            ----------
+            obj : object
+                The object to serialize. Numpy arrays and scalars are supported.
+
+            Returns
+            -------
+            bytes
+                The UTF-8 encoded JSON document.
+        """
+        return json.dumps(obj, separators=(",", ":"), default=_default).encode("utf-8")
+
+    loads = json.loads
+
+
+class _Fallback(Exception):
+    """
+        Raised by a compiled converter when the payload needs the full marshmallow treatment.
+    """
+
+
+def _with_validators(field, convert):
+    validators = list(field.validators)
+    if not validators:
+        return convert
+
+    def validated(value):
+        value = convert(value)
+        for validator in validators:
+            try:
+                result = validator(value)
+            except Exception:
+                raise _Fallback
+            if result is False:
+                raise _Fallback
+        return value
+
+    return validated
+
+
+def _float_list(value):
+    if type(value) is not list:
+        raise _Fallback
+    for item in value:
+        if type(item) is not float and type(item) is not int:
+            raise _Fallback
+    value = list(map(float, value))
+    # A single sum catches NaN and infinity anywhere in the list; overflowing finite values also end up in
+    # marshmallow, which then accepts them.
+    if not -math.inf < sum(value) < math.inf:
+        raise _Fallback
+    return value
+
+
+def _compile_field(field):
+    """
+        Build a converter for a marshmallow field that accepts only the well-formed case.
+
+        Parameters
+        ----------
+        field : marshmallow.fields.Field
+            The bound field to compile.
+
+        Returns
+        -------
+        callable or None
+            A function converting a raw JSON value to the loaded value, raising ``_Fallback`` for anything it does
+            not handle. None if the field type is not supported at all.
+    """
+    if field.data_key is not None or field.attribute is not None:
+        return None
+    if isinstance(field, fields.Float):
+        if field.as_string:
+            return None
+
+        def convert(value):
+            if type(value) is float or type(value) is int:
+                value = float(value)
+                if -math.inf < value < math.inf:
+                    return value
+            raise _Fallback
+    elif isinstance(field, fields.Integer):
+        if field.as_string:
+            return None
+
+        def convert(value):
+            if type(value) is int:
+                return value
+            raise _Fallback
+    elif isinstance(field, fields.Boolean):
+        def convert(value):
+            if type(value) is bool:
+                return value
+            raise _Fallback
+    elif isinstance(field, fields.String):
+        def convert(value):
+            if type(value) is str:
+                return value
+            raise _Fallback
+    elif isinstance(field, fields.List):
+        inner_field = field.inner
+        if isinstance(inner_field, fields.Float) and not inner_field.as_string and not inner_field.validators \
+                and inner_field.data_key is None and inner_field.attribute is None:
+            convert = _float_list
+        else:
+            inner = _compile_field(inner_field)
+            if inner is None:
+                return None
+
+            def convert(value):
+                if type(value) is not list:
+                    raise _Fallback
+                return [inner(item) for item in value]
+    else:
+        return None
+    return _with_validators(field, convert)
+
+
+class CompiledSchema:
+    """
+        A marshmallow schema instantiated once, with its fields compiled into plain converters.
+
+        Well-formed payloads are loaded by the compiled converters, which skip marshmallow's per-element dispatch
+        and error bookkeeping. Anything else (wrong types, missing or unknown fields, failed validators) is handed
+        to the schema itself, so the result and the error messages are exactly the ones marshmallow produces.
+        Schemas with schema-level hooks are always loaded by marshmallow.
+    """
+
+    def __init__(self, schema_class):
+        self._schema = schema_class()
+        self._fields = self.__compile()
+
+    def __compile(self):
+        if any(self._schema._hooks.values()) or self._schema.unknown != RAISE:
+            return None
+        compiled = []
+        for name, field in self._schema.load_fields.items():
+            convert = _compile_field(field)
+            if convert is None:
+                return None
+            compiled.append((name, convert, field.required, field.load_default))
+        return compiled
+
+    def is_compiled(self):
+        return self._fields is not None
+
+    def load(self, payload):
+        """
+            Load and validate a decoded JSON payload.
+
+            Parameters
+            ----------
+            payload : object
+                The decoded JSON body.
+
+            Returns
+            -------
+            dict
+                The loaded data.
+
+            Raises
+            ------
+            ValidationError
+                If the payload does not match the schema.
+        """
+        if self._fields is not None and type(payload) is dict:
+            try:
+                return self.__load_compiled(payload)
+            except _Fallback:
+                pass
+        return self._schema.load(payload)
+
+    def __load_compiled(self, payload):
+        data = {}
+        seen = 0
+        for name, convert, required, default in self._fields:
+            if name in payload:
+                value = payload[name]
+                if value is None:
+                    raise _Fallback
+                data[name] = convert(value)
+                seen += 1
+            elif required:
+                raise _Fallback
+            elif default is not missing_:
+                data[name] = default() if callable(default) else default
+        if seen != len(payload):
+            raise _Fallback
+        return data
+
+
+_compiled_schemas = {}
+
+
+def compiled_schema(schema_class):
+    """
+        Get the compiled version of a schema, compiling it on first use.
+
+        Parameters
+        ----------
+        schema_class : type
+            The marshmallow schema class.
+
+        Returns
+        -------
+        CompiledSchema
+            The cached compiled schema.
+    """
+    compiled = _compiled_schemas.get(schema_class)
+    if compiled is None:
+        compiled = _compiled_schemas.setdefault(schema_class, CompiledSchema(schema_class))
+    return compiled
@@ -0,0 +1,87 @@
+import math
+
+import numpy as np
+
+from trajectory import rotation_vectors_to_quaternions
+
+# How the wait for a motion ends: when its program ends, or when the robot settled at its target.
+COMPLETION_MODES = ("program", "converged")
+
+
+class TargetConvergence:
+    """
+        Tells whether the robot settled at the target of a motion, from the state it streams: the tool pose, or the
+        joint positions for a joint target, within tolerance of the target, with every joint slower than the speed
+        tolerance.
+
+        The controller keeps the program running for a while after the robot reached its target, a motion that
+        completes on convergence returns that much sooner.
+    """
+
+    def __init__(self, target, pose_object, read_pose, read_joints, read_speeds, position_tolerance,
+                 rotation_tolerance, joint_tolerance, speed_tolerance):
+        """
+            Parameters
+            ----------
+            target : list
+                The absolute target, a pose (x, y, z, rx, ry, rz) or joint positions.
+            pose_object : bool
+                A flag indicating whether the target is a pose or joint positions.
+            read_pose : callable
+                Returns the current pose of the robot.
+            read_joints : callable
+                Returns the current joint positions of the robot.
+            read_speeds : callable
+                Returns the current joint speeds of the robot in rad/s.
+            position_tolerance : float
+                The distance to a pose target in meters below which the tool reached it.
+            rotation_tolerance : float
+                The angle to a pose target in radians below which the tool reached it.
+            joint_tolerance : float
+                The largest joint distance to a joint target in radians below which the robot reached it.
+            speed_tolerance : float
+                The joint speed in rad/s below which a joint is still.
+        """
+        self._target = np.asarray(target, dtype=float)
+        self._pose_object = pose_object
+        self._read_pose = read_pose
+        self._read_joints = read_joints
+        self._read_speeds = read_speeds
+        self._position_tolerance = position_tolerance
+        self._rotation_tolerance = rotation_tolerance
+        self._joint_tolerance = joint_tolerance
+        self._speed_tolerance = speed_tolerance
+
+    def is_moving(self):
+        """
+            Tell whether a joint is faster than the speed tolerance.
+        """
+        return float(np.max(np.abs(np.asarray(self._read_speeds(), dtype=float)))) >= self._speed_tolerance
+
+    def get_error(self):
+        """
+            Get the distance of the robot to the target.
+
+            Returns
+            -------
+            dict
+                The position and rotation errors in meters and radians for a pose target, the largest joint error
+                in radians for a joint target.
+        """
+        if not self._pose_object:
+            return {"joints": float(np.max(np.abs(np.asarray(self._read_joints(), dtype=float) - self._target)))}
+        pose = np.asarray(self._read_pose(), dtype=float)
+        quaternions = rotation_vectors_to_quaternions(np.vstack((pose[3:], self._target[3:])))
+        return {"position": float(np.linalg.norm(pose[:3] - self._target[:3])),
+                "rotation": 2 * math.acos(min(1.0, abs(float(quaternions[0] @ quaternions[1]))))}
+
+    def is_converged(self):
+        """
+            Tell whether the robot is still and within tolerance of the target.
+        """
+        if self.is_moving():
+            return False
+        error = self.get_error()
+        if not self._pose_object:
+            return error["joints"] < self._joint_tolerance
+        return error["position"] < self._position_tolerance and error["rotation"] < self._rotation_tolerance
@@ -0,0 +1,145 @@
+import socket
+import threading
+import time
+
+ROBOTIQ_SOCKET_PORT = 63352
+
+# Values of the OBJ variable while GTO is set.
+OBJECT_MOVING = 0
+OBJECT_DETECTED_OPENING = 1
+OBJECT_DETECTED_CLOSING = 2
+OBJECT_AT_POSITION = 3
+
+
+class RobotiqGripper:
+    """
+        Client of the gripper socket served by the Robotiq URCap on the robot controller.
+
+        Commands sent through this socket do not run a URScript program, so they neither interrupt nor wait for
+        the program the arm is running, and the gripper status can be read at any time.
+    """
+
+    def __init__(self, host, port=ROBOTIQ_SOCKET_PORT, timeout=2.0, speed=255, force=50):
+        self._host = host
+        self._port = port
+        self._timeout = timeout
+        self._speed = speed
+        self._force = force
+        self._socket = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """
+            Connect to the gripper socket.
+        """
+        self._socket = socket.create_connection((self._host, self._port), timeout=self._timeout)
+
+    def close(self):
+        """
+            Close the gripper socket.
+        """
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def __request(self, command):
+        with self._lock:
+            self._socket.sendall(command.encode("ascii") + b"\n")
+            return self._socket.recv(1024).decode("ascii").strip()
+
+    def __get(self, variable):
+        reply = self.__request(f"GET {variable}")
+        name, value = reply.split()
+        if name != variable:
+            raise RuntimeError(f"Unexpected gripper reply to GET {variable}: {reply}")
+        return int(value)
+
+    def get_position(self):
+        """
+            Get the current position of the gripper, from 0 (open) to 255 (closed).
+        """
+        return self.__get("POS")
+
+    def get_object_status(self):
+        """
+            Get the object detection status (OBJ) of the gripper.
+        """
+        return self.__get("OBJ")
+
+    def is_stopped_at(self, position):
+        """
+            Check whether the gripper took a move request to a position and stopped moving.
+        """
+        return self.__get("PRE") == position and self.get_object_status() != OBJECT_MOVING
+
+    def move(self, position, speed=None, force=None):
+        """
+            Start moving the gripper to a position without waiting for it.
+
+            Parameters
+            ----------
+            position : int
+                The position to move to, from 0 (open) to 255 (closed).
+            speed : int, optional
+                The speed from 0 to 255. Default is the gripper speed.
+            force : int, optional
+                The force from 0 to 255. Default is the gripper force.
+        """
+        speed = self._speed if speed is None else speed
+        force = self._force if force is None else force
+        reply = self.__request(f"SET POS {position} SPE {speed} FOR {force} GTO 1")
+        if reply != "ack":
+            raise RuntimeError(f"Gripper rejected the move to {position}: {reply}")
+
+    def wait_for_motion(self, position, timeout, poll_interval=0.005):
+        """
+            Wait for the gripper to take a move request and stop moving.
+
+            Parameters
+            ----------
+            position : int
+                The requested position, used to know when the request has been taken.
+            timeout : float
+                The time limit in seconds.
+            poll_interval : float, optional
+                The time between status reads in seconds. Default is 0.005.
+
+            Returns
+            -------
+            dict
+                The final position, whether an object was detected and the object status code.
+
+            Raises
+            ------
+            RuntimeError
+                If the gripper does not stop within the timeout.
+        """
+        deadline = time.time() + timeout
+        # Until the request echo (PRE) matches, OBJ still describes the previous move.
+        while self.__get("PRE") != position:
+            if time.time() > deadline:
+                raise RuntimeError(f"Timeout waiting for the gripper to take the move to {position}")
+            time.sleep(poll_interval)
+        object_status = self.get_object_status()
+        while object_status == OBJECT_MOVING:
+            if time.time() > deadline:
+                raise RuntimeError(f"Timeout waiting for the gripper to reach {position}")
+            time.sleep(poll_interval)
+            object_status = self.get_object_status()
+        return {
+            "position": self.get_position(),
+            "object_detected": object_status in (OBJECT_DETECTED_OPENING, OBJECT_DETECTED_CLOSING),
+            "object_status": object_status
+        }
+
+    def move_and_wait(self, position, timeout, speed=None, force=None):
+        """
+            Move the gripper to a position and return as soon as it stops.
+
+            Returns
+            -------
+            dict
+                The final position, whether an object was detected and the object status code.
+        """
+        self.move(position, speed, force)
+        return self.wait_for_motion(position, timeout)
@@ -0,0 +1,199 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class IdempotencyKeyConflictError(Exception):
+    """
+        Raised when an idempotency key is reused for a different request.
+    """
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "done", "response", "completed_at", "deadline")
+
+    def __init__(self, fingerprint, deadline):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.response = None
+        self.completed_at = None
+        self.deadline = deadline
+
+
+class IdempotencyCache:
+    """
+        A bounded cache of in-flight and completed responses keyed by idempotency key.
+
+        The first request with a key executes; any retry with the same key either waits for that execution to
+        finish or gets its stored response, so the robot never runs the same command twice. Completed entries
+        expire after ``ttl`` seconds and the oldest completed entries are evicted once ``max_entries`` is reached.
+        In-flight entries are never evicted, but an execution that neither completes nor abandons its key within
+        ``lease`` seconds, like one of a worker process that died, loses its claim. Once an execution abandons or
+        loses its claim, a single waiting retry claims the key again and the others wait for it.
+    """
+
+    def __init__(self, max_entries=1024, ttl=600, lease=300):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._lease = lease
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._in_flight_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expired_claims = 0
+
+    def execute(self, key, fingerprint, function, store=None):
+        """
+            Execute a function once per idempotency key.
+
+            Parameters
+            ----------
+            key : str
+                The idempotency key sent by the client.
+            fingerprint : hashable
+                Identifies the request the key was first used with.
+            function : callable
+                Produces the response. Only called if there is no stored or in-flight response for the key.
+            store : callable, optional
+                Tells whether a response is stored. A response it rejects, like a request shed under load, is
+                returned without being stored, so a retry executes again. Default is storing every response.
+
+            Returns
+            -------
+            tuple
+                The response and a flag indicating whether it was replayed from the cache.
+
+            Raises
+            ------
+            IdempotencyKeyConflictError
+                If the key was already used with a different fingerprint.
+        """
+        while True:
+            owner, response = self.begin(key, fingerprint)
+            if owner:
+                break
+            if response is not None:
+                return response, True
+            # The execution that claimed the key gave it up without a response, the first retry to claim it again
+            # executes and the others keep waiting for it.
+        try:
+            response = function()
+        except BaseException:
+            self.abandon(key)
+            raise
+        if store is not None and not store(response):
+            self.abandon(key)
+        else:
+            self.complete(key, response)
+        return response, False
+
+    def begin(self, key, fingerprint):
+        """
+            Claim the execution of a key, or wait for the execution that claimed it.
+
+            The caller that gets the ownership must execute the request and then call complete or abandon within the
+            lease. This lets the request execute in another process than the one holding the cache.
+
+            Returns
+            -------
+            tuple
+                Whether the caller owns the execution, and the stored response if another execution completed. Neither
+                means the other execution gave up its claim, and the caller should begin again.
+
+            Raises
+            ------
+            IdempotencyKeyConflictError
+                If the key was already used with a different fingerprint.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.__expire(now)
+            entry = self._entries.get(key)
+            if entry is not None and entry.fingerprint != fingerprint:
+                raise IdempotencyKeyConflictError(f"Idempotency-Key {key} was already used for a different request")
+            if entry is None:
+                self._misses += 1
+                self._entries[key] = _Entry(fingerprint, now + self._lease)
+                return True, None
+            if entry.done.is_set():
+                self._hits += 1
+            else:
+                self._in_flight_hits += 1
+            timeout = max(entry.deadline - now, 0.0)
+        if not entry.done.wait(timeout):
+            with self._lock:
+                self.__expire(time.monotonic())
+        return False, entry.response
+
+    def complete(self, key, response):
+        """
+            Store the response of an execution claimed with begin and release the requests waiting for it.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.completed_at is not None:
+                return
+            entry.response = response
+            entry.completed_at = time.monotonic()
+            self._entries.move_to_end(key)
+            self.__evict()
+        entry.done.set()
+
+    def abandon(self, key):
+        """
+            Forget an execution claimed with begin that failed, one of the requests waiting for it claims the key again.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.completed_at is not None:
+                return
+            del self._entries[key]
+        entry.done.set()
+
+    def __expire(self, now):
+        expired = [key for key, entry in self._entries.items()
+                   if entry.completed_at is not None and now - entry.completed_at > self._ttl]
+        for key in expired:
+            del self._entries[key]
+        stale = [key for key, entry in self._entries.items() if entry.completed_at is None and now >= entry.deadline]
+        for key in stale:
+            # The execution that claimed the key is gone, one of the requests waiting for it claims the key again.
+            self._entries.pop(key).done.set()
+            self._expired_claims += 1
+
+    def __evict(self):
+        if len(self._entries) <= self._max_entries:
+            return
+        for key in [key for key, entry in self._entries.items() if entry.completed_at is not None]:
+            del self._entries[key]
+            self._evictions += 1
+            if len(self._entries) <= self._max_entries:
+                break
+
+    def get_stats(self):
+        """
+            Get the hit and miss counters of the cache.
+
+            Returns
+            -------
+            dict
+                The counters, the hit rate and the number of stored and in-flight entries.
+        """
+        with self._lock:
+            in_flight = sum(1 for entry in self._entries.values() if entry.completed_at is None)
+            lookups = self._hits + self._in_flight_hits + self._misses
+            return {
+                "hits": self._hits,
+                "in_flight_hits": self._in_flight_hits,
+                "misses": self._misses,
+                "hit_rate": (self._hits + self._in_flight_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "in_flight": in_flight,
+                "evictions": self._evictions,
+                "expired_claims": self._expired_claims,
+                "max_entries": self._max_entries,
+                "ttl": self._ttl,
+                "lease": self._lease
+            }
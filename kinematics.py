@@ -0,0 +1,315 @@
+import math
+import os
+
+import numpy as np
+
+# Standard Denavit-Hartenberg parameters of the UR5e in meters and radians.
+UR5E_DH_D = np.array([0.1625, 0.0, 0.0, 0.1333, 0.0997, 0.0996])
+UR5E_DH_A = np.array([0.0, -0.425, -0.3922, 0.0, 0.0, 0.0])
+UR5E_DH_ALPHA = np.array([np.pi / 2, 0.0, 0.0, np.pi / 2, -np.pi / 2, 0.0])
+
+# Batches larger than this are computed in chunks, bounding the memory of the intermediate transforms.
+BATCH_SIZE = int(os.getenv("KINEMATICS_BATCH_SIZE", 50000))
+
+_EPSILON = 1e-9
+
+
+def dh_transforms(theta, d, a, alpha):
+    """
+        Build Denavit-Hartenberg link transforms for arrays of joint angles.
+
+        Parameters
+        ----------
+        theta : numpy.ndarray
+            The joint angles in radians, of any shape.
+        d, a, alpha : float
+            The DH parameters of the link.
+
+        Returns
+        -------
+        numpy.ndarray
+            An array of shape ``theta.shape + (4, 4)``.
+    """
+    ct, st = np.cos(theta), np.sin(theta)
+    ca, sa = np.cos(alpha), np.sin(alpha)
+    transforms = np.zeros(np.shape(theta) + (4, 4))
+    transforms[..., 0, 0] = ct
+    transforms[..., 0, 1] = -st * ca
+    transforms[..., 0, 2] = st * sa
+    transforms[..., 0, 3] = a * ct
+    transforms[..., 1, 0] = st
+    transforms[..., 1, 1] = ct * ca
+    transforms[..., 1, 2] = -ct * sa
+    transforms[..., 1, 3] = a * st
+    transforms[..., 2, 1] = sa
+    transforms[..., 2, 2] = ca
+    transforms[..., 2, 3] = d
+    transforms[..., 3, 3] = 1.0
+    return transforms
+
+
+def invert_transforms(transforms):
+    """
+        Invert an array of homogeneous transforms.
+    """
+    rotation_t = np.swapaxes(transforms[..., :3, :3], -1, -2)
+    inverse = np.zeros_like(transforms)
+    inverse[..., :3, :3] = rotation_t
+    inverse[..., :3, 3] = -np.einsum("...ij,...j->...i", rotation_t, transforms[..., :3, 3])
+    inverse[..., 3, 3] = 1.0
+    return inverse
+
+
+def rotation_vectors_to_matrices(rotation_vectors):
+    """
+        Convert an (N, 3) array of rotation vectors to (N, 3, 3) rotation matrices (Rodrigues formula).
+    """
+    angles = np.linalg.norm(rotation_vectors, axis=1)
+    safe_angles = np.where(angles > _EPSILON, angles, 1.0)
+    axes = rotation_vectors / safe_angles[:, None]
+    skew = np.zeros((len(rotation_vectors), 3, 3))
+    skew[:, 0, 1], skew[:, 0, 2] = -axes[:, 2], axes[:, 1]
+    skew[:, 1, 0], skew[:, 1, 2] = axes[:, 2], -axes[:, 0]
+    skew[:, 2, 0], skew[:, 2, 1] = -axes[:, 1], axes[:, 0]
+    sin = np.where(angles > _EPSILON, np.sin(angles), 0.0)[:, None, None]
+    cos = np.where(angles > _EPSILON, 1 - np.cos(angles), 0.0)[:, None, None]
+    return np.eye(3) + sin * skew + cos * (skew @ skew)
+
+
+def matrices_to_rotation_vectors(matrices):
+    """
+        Convert an (N, 3, 3) array of rotation matrices to (N, 3) rotation vectors with angles in [0, pi].
+    """
+    m = matrices
+    trace = m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2]
+    case = np.argmax(np.column_stack((trace, m[:, 0, 0], m[:, 1, 1], m[:, 2, 2])), axis=1)
+    quaternions = np.empty((len(m), 4))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = np.sqrt(np.maximum(1 + trace, 0.0)) * 2
+        candidate = np.column_stack((s / 4, (m[:, 2, 1] - m[:, 1, 2]) / s, (m[:, 0, 2] - m[:, 2, 0]) / s,
+                                     (m[:, 1, 0] - m[:, 0, 1]) / s))
+        quaternions[case == 0] = candidate[case == 0]
+        s = np.sqrt(np.maximum(1 + m[:, 0, 0] - m[:, 1, 1] - m[:, 2, 2], 0.0)) * 2
+        candidate = np.column_stack(((m[:, 2, 1] - m[:, 1, 2]) / s, s / 4, (m[:, 0, 1] + m[:, 1, 0]) / s,
+                                     (m[:, 0, 2] + m[:, 2, 0]) / s))
+        quaternions[case == 1] = candidate[case == 1]
+        s = np.sqrt(np.maximum(1 - m[:, 0, 0] + m[:, 1, 1] - m[:, 2, 2], 0.0)) * 2
+        candidate = np.column_stack(((m[:, 0, 2] - m[:, 2, 0]) / s, (m[:, 0, 1] + m[:, 1, 0]) / s, s / 4,
+                                     (m[:, 1, 2] + m[:, 2, 1]) / s))
+        quaternions[case == 2] = candidate[case == 2]
+        s = np.sqrt(np.maximum(1 - m[:, 0, 0] - m[:, 1, 1] + m[:, 2, 2], 0.0)) * 2
+        candidate = np.column_stack(((m[:, 1, 0] - m[:, 0, 1]) / s, (m[:, 0, 2] + m[:, 2, 0]) / s,
+                                     (m[:, 1, 2] + m[:, 2, 1]) / s, s / 4))
+        quaternions[case == 3] = candidate[case == 3]
+    quaternions *= np.where(quaternions[:, 0] < 0, -1.0, 1.0)[:, None]
+    vector = quaternions[:, 1:]
+    norms = np.linalg.norm(vector, axis=1)
+    angles = 2 * np.arctan2(norms, quaternions[:, 0])
+    scale = np.where(norms > _EPSILON, angles / np.where(norms > _EPSILON, norms, 1.0), 2.0)
+    return vector * scale[:, None]
+
+
+def poses_to_transforms(poses):
+    """
+        Convert an (N, 6) array of poses (x, y, z, rx, ry, rz) to (N, 4, 4) homogeneous transforms.
+    """
+    poses = np.asarray(poses, dtype=float).reshape(-1, 6)
+    transforms = np.zeros((len(poses), 4, 4))
+    transforms[:, :3, :3] = rotation_vectors_to_matrices(poses[:, 3:])
+    transforms[:, :3, 3] = poses[:, :3]
+    transforms[:, 3, 3] = 1.0
+    return transforms
+
+
+def transforms_to_poses(transforms):
+    """
+        Convert an (N, 4, 4) array of homogeneous transforms to (N, 6) poses (x, y, z, rx, ry, rz).
+    """
+    return np.column_stack((transforms[:, :3, 3], matrices_to_rotation_vectors(transforms[:, :3, :3])))
+
+
+def forward_kinematics_transforms(joints):
+    """
+        Compute the flange transforms of an array of joint configurations.
+
+        Parameters
+        ----------
+        joints : array_like
+            An (N, 6) array of joint positions in radians.
+
+        Returns
+        -------
+        numpy.ndarray
+            An (N, 4, 4) array of flange transforms in the base frame.
+    """
+    joints = np.asarray(joints, dtype=float).reshape(-1, 6)
+    transforms = dh_transforms(joints[:, 0], UR5E_DH_D[0], UR5E_DH_A[0], UR5E_DH_ALPHA[0])
+    for i in range(1, 6):
+        transforms = transforms @ dh_transforms(joints[:, i], UR5E_DH_D[i], UR5E_DH_A[i], UR5E_DH_ALPHA[i])
+    return transforms
+
+
+def forward_kinematics(joints, tcp=None):
+    """
+        Compute the TCP poses of an array of joint configurations.
+
+        Parameters
+        ----------
+        joints : array_like
+            An (N, 6) array of joint positions in radians.
+        tcp : array_like, optional
+            The TCP offset from the flange as a pose (x, y, z, rx, ry, rz). Default is no offset.
+
+        Returns
+        -------
+        numpy.ndarray
+            An (N, 6) array of poses (x, y, z, rx, ry, rz) in meters and radians.
+    """
+    transforms = forward_kinematics_transforms(joints)
+    if tcp is not None:
+        transforms = transforms @ poses_to_transforms(tcp)[0]
+    return transforms_to_poses(transforms)
+
+
+def inverse_kinematics(poses, tcp=None):
+    """
+        Compute all the analytic inverse kinematics solutions of an array of TCP poses.
+
+        Each pose has up to 8 solutions (shoulder left/right, wrist up/down, elbow up/down). Unreachable
+        combinations are returned as NaN rows. At a wrist singularity joint 6 is set to zero.
+
+        Parameters
+        ----------
+        poses : array_like
+            An (N, 6) array of poses (x, y, z, rx, ry, rz) in meters and radians.
+        tcp : array_like, optional
+            The TCP offset from the flange as a pose (x, y, z, rx, ry, rz). Default is no offset.
+
+        Returns
+        -------
+        numpy.ndarray
+            An (N, 8, 6) array of joint positions in radians, wrapped to [-pi, pi].
+    """
+    d, a = UR5E_DH_D, UR5E_DH_A
+    targets = poses_to_transforms(poses)
+    if tcp is not None:
+        targets = targets @ invert_transforms(poses_to_transforms(tcp)[0])
+    # One column per combination of the three binary branches, broadcast against the N targets.
+    shoulder = np.array([1, 1, 1, 1, -1, -1, -1, -1], dtype=float)
+    wrist = np.array([1, 1, -1, -1, 1, 1, -1, -1], dtype=float)
+    elbow = np.array([1, -1, 1, -1, 1, -1, 1, -1], dtype=float)
+    t = targets[:, None, :, :]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        wrist_center = targets[:, :3, 3] - d[5] * targets[:, :3, 2]
+        radius = np.hypot(wrist_center[:, 0], wrist_center[:, 1])
+        theta1 = (np.arctan2(wrist_center[:, 1], wrist_center[:, 0])[:, None]
+                  + shoulder * np.arccos(d[3] / radius)[:, None] + np.pi / 2)
+        s1, c1 = np.sin(theta1), np.cos(theta1)
+
+        theta5 = wrist * np.arccos((t[..., 0, 3] * s1 - t[..., 1, 3] * c1 - d[3]) / d[5])
+        s5 = np.sin(theta5)
+        singular = np.abs(s5) < _EPSILON
+        s5 = np.where(singular, 1.0, s5)
+        theta6 = np.arctan2((-t[..., 0, 1] * s1 + t[..., 1, 1] * c1) / s5, (t[..., 0, 0] * s1 - t[..., 1, 0] * c1) / s5)
+        # At a wrist singularity joints 4 and 6 are coupled, so joint 6 is arbitrarily kept at zero.
+        theta6 = np.where(singular, 0.0, theta6)
+
+        t01 = dh_transforms(theta1, d[0], a[0], UR5E_DH_ALPHA[0])
+        t45 = dh_transforms(theta5, d[4], a[4], UR5E_DH_ALPHA[4])
+        t56 = dh_transforms(theta6, d[5], a[5], UR5E_DH_ALPHA[5])
+        t14 = invert_transforms(t01) @ t @ invert_transforms(t56) @ invert_transforms(t45)
+        # Joints 2 and 3 form a planar two-link arm in the xy plane of frame 1.
+        p14x, p14y = t14[..., 0, 3], t14[..., 1, 3]
+        theta3 = elbow * np.arccos((p14x ** 2 + p14y ** 2 - a[1] ** 2 - a[2] ** 2) / (2 * a[1] * a[2]))
+        theta2 = np.arctan2(p14y, p14x) - np.arctan2(a[2] * np.sin(theta3), a[1] + a[2] * np.cos(theta3))
+
+        t12 = dh_transforms(theta2, d[1], a[1], UR5E_DH_ALPHA[1])
+        t23 = dh_transforms(theta3, d[2], a[2], UR5E_DH_ALPHA[2])
+        t34 = invert_transforms(t23) @ invert_transforms(t12) @ t14
+        theta4 = np.arctan2(t34[..., 1, 0], t34[..., 0, 0])
+
+    solutions = np.stack((theta1, theta2, theta3, theta4, theta5, theta6), axis=-1)
+    solutions = np.mod(solutions + np.pi, 2 * np.pi) - np.pi
+    solutions[np.isnan(solutions).any(axis=-1)] = np.nan
+    return solutions
+
+
+def closest_solutions(solutions, reference):
+    """
+        Pick, for each target, the solution closest to a reference joint configuration.
+
+        Every joint is shifted by multiples of 2 pi to the equivalent angle nearest to the reference, so the
+        result stays within the +-2 pi joint range whenever the reference does.
+
+        Parameters
+        ----------
+        solutions : numpy.ndarray
+            An (N, 8, 6) array as returned by ``inverse_kinematics``.
+        reference : array_like
+            The reference joint positions, either (6,) or (N, 6).
+
+        Returns
+        -------
+        numpy.ndarray
+            An (N, 6) array of joint positions. Rows are NaN when a target has no solution.
+    """
+    reference = np.broadcast_to(np.asarray(reference, dtype=float), (len(solutions), 6))[:, None, :]
+    shifted = solutions + 2 * np.pi * np.round((reference - solutions) / (2 * np.pi))
+    distances = np.sum((shifted - reference) ** 2, axis=-1)
+    distances = np.where(np.isnan(distances), np.inf, distances)
+    best = np.argmin(distances, axis=1)
+    closest = shifted[np.arange(len(solutions)), best]
+    closest[np.isinf(distances[np.arange(len(solutions)), best])] = np.nan
+    return closest
+
+
+def solve_inverse_kinematics(poses, reference, tcp=None, all_solutions=False):
+    """
+        Solve the inverse kinematics of a batch of poses into plain lists.
+
+        Parameters
+        ----------
+        poses : array_like
+            An (N, 6) array of poses (x, y, z, rx, ry, rz) in meters and radians.
+        reference : array_like
+            The joint positions used to pick the closest solution of each pose.
+        tcp : array_like, optional
+            The TCP offset from the flange as a pose (x, y, z, rx, ry, rz). Default is no offset.
+        all_solutions : bool, optional
+            A flag indicating whether to return every solution instead of the closest one. Default is False.
+
+        Returns
+        -------
+        list
+            For each pose, the closest joint positions or None if unreachable. With ``all_solutions``, the list of
+            every valid solution of each pose.
+    """
+    solutions = batch_inverse_kinematics(poses, tcp)
+    if all_solutions:
+        return [[solution for solution in target.tolist() if not math.isnan(solution[0])] for target in solutions]
+    closest = closest_solutions(solutions, reference)
+    return [None if math.isnan(joints[0]) else joints for joints in closest.tolist()]
+
+
+def _run_batched(function, values, *args):
+    values = np.asarray(values, dtype=float).reshape(-1, 6)
+    if len(values) <= BATCH_SIZE:
+        return function(values, *args)
+    # Computed in process: a pool would have to fork this multithreaded server or spawn workers re-importing it.
+    return np.concatenate([function(values[start:start + BATCH_SIZE], *args)
+                           for start in range(0, len(values), BATCH_SIZE)])
+
+
+def batch_forward_kinematics(joints, tcp=None):
+    """
+        Same as ``forward_kinematics``, computing batches larger than BATCH_SIZE in chunks.
+    """
+    return _run_batched(forward_kinematics, joints, tcp)
+
+
+def batch_inverse_kinematics(poses, tcp=None):
+    """
+        Same as ``inverse_kinematics``, computing batches larger than BATCH_SIZE in chunks.
+    """
+    return _run_batched(inverse_kinematics, poses, tcp)
@@ -1,18 +1,30 @@
-import json
+import functools
+import hashlib
 import os
+import time
+import uuid
 from logging.config import dictConfig
 
 from dotenv import load_dotenv
-from flask import Flask, request
+from flask import Flask, g, request
 from flask_cors import CORS, cross_origin
 from marshmallow import ValidationError
 from waitress import serve
 
+from codec import dumps
+from idempotency import IdempotencyKeyConflictError
 from logger import FlaskLogger, ColorFormatter
+from motion_dispatcher import MotionCancelledError, MotionRejectedError
+from program_cache import CachedProgram, ProgramNotFoundError
+from robot_owner import connect as connect_robot_owner, create_shared_objects
 from schemas import PartialGripperRequestSchema, SetConfigRequestSchema, MoveJRequestSchema, \
-    MoveLRequestSchema, MoveLSRequestSchema, MoveRequestSchema
-from urx_service import DefaultUrxEService, MockUrxEService
-from utils import ApiResponse, validate_json_structure
+    MoveLRequestSchema, MoveLSRequestSchema, MoveRequestSchema, ForwardKinematicsRequestSchema, \
+    InverseKinematicsRequestSchema, SequenceRequestSchema, RegisterProgramRequestSchema, RunProgramRequestSchema, \
+    StateHistoryRequestSchema, StopRequestSchema, TimelineRequestSchema, PipelineRequestSchema, \
+    TrajectoryStreamRequestSchema
+from trajectory import TrajectoryValidator, TrajectoryValidationError, simplify_path, DEFAULT_ANGULAR_TOLERANCE
+from trajectory_stream import STREAM_FORMATS, read_waypoints, spool_trajectory
+from utils import ApiResponse, load_request_body, parse_client_settings, CORRELATION_ID_PATTERN, JSON_HEADERS
 
 load_dotenv()
 
@@ -40,26 +52,112 @@ BOT_NAME = os.getenv("BOT_NAME")
 cors = CORS(app)
 app.config['CORS_HEADERS'] = 'Content-Type'
 
+ROBOT_OWNER_ADDRESS = os.getenv("ROBOT_OWNER_ADDRESS")
+
 try:
-    if os.getenv("ENVIRONMENT") == "dev":
-        urx_service = MockUrxEService()
+    if ROBOT_OWNER_ADDRESS:
+        # Worker of robot_owner.py: the robot and the caches are shared by the workers through the robot owner.
+        urx_service, idempotency_cache, program_cache = connect_robot_owner(ROBOT_OWNER_ADDRESS)
     else:
-        urx_service = DefaultUrxEService(logger=logger)
+        urx_service, idempotency_cache, program_cache = create_shared_objects(logger)
 except Exception as e:
     logger.error(f"Failed to initialize UrxEService: {e}")
     exit(1)
 
+STATUS_OK = dumps({"status": "ok"})
+
+trajectory_validator = TrajectoryValidator()
+
+# API keys identifying the clients, as key=client. When set, the X-Client-Id header is ignored.
+API_KEYS = parse_client_settings(os.getenv("API_KEYS"), convert=str)
+# The clients told apart by their X-Client-Id header without API keys, the ones given a weight or a quota.
+CONFIGURED_CLIENTS = set(parse_client_settings(os.getenv("CLIENT_WEIGHTS"))) | \
+    set(parse_client_settings(os.getenv("CLIENT_QUOTAS")))
+
+MOVE_AXES = {"up": 2, "down": 2, "left": 0, "right": 0, "forward": 1, "backward": 1, "roll": 3, "pitch": 4, "yaw": 5}
+
+
+def get_client():
+    """
+        Get the client of the request the robot time is charged to, from its X-API-Key header if API keys are set,
+        or else from its X-Client-Id header if the client has a weight or a quota. Other requests are charged to the
+        anonymous client, so a caller cannot get a fresh share of the robot time with every new client ID.
+    """
+    if API_KEYS:
+        return API_KEYS.get(request.headers.get("X-API-Key"))
+    client = request.headers.get("X-Client-Id")
+    return client if client in CONFIGURED_CLIENTS else None
+
+
+def get_correlation_id():
+    """
+        Get the correlation ID of the request from its X-Correlation-Id header, or a new one if the header is missing
+        or not made of up to 64 letters, digits, dots, underscores and dashes.
+    """
+    header = request.headers.get("X-Correlation-Id", "")
+    return header if CORRELATION_ID_PATTERN.fullmatch(header) else uuid.uuid4().hex
+
+
+def correlated(view):
+    """
+        Give a motion route a correlation ID and record the timeline of its requests.
+
+        The route passes the ID to the robot service and it is sent back in the X-Correlation-Id header.
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.correlation_id = get_correlation_id()
+        urx_service.record_timeline(g.correlation_id, "received", route=request.path, client=get_client())
+        body, status, headers = view(*args, **kwargs)
+        urx_service.record_timeline(g.correlation_id, "responded", status=status)
+        return body, status, {**headers, "X-Correlation-Id": g.correlation_id}
+
+    return wrapper
+
+
+def idempotent(view):
+    """
+        Make a route honor the Idempotency-Key header.
+
+        Requests without the header are executed as usual. A retry with the same key and body attaches to the
+        original execution or gets its stored response, marked with the Idempotency-Replayed header.
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return view(*args, **kwargs)
+        fingerprint = (request.path, hashlib.blake2b(request.get_data(), digest_size=16).digest())
+        try:
+            # A request shed under load did not run and a server error may be transient, a retry with its key
+            # must run it.
+            response, replayed = idempotency_cache.execute(key, fingerprint, lambda: view(*args, **kwargs),
+                                                           store=lambda response: response[1] != 429
+                                                           and response[1] < 500)
+        except IdempotencyKeyConflictError as e:
+            logger.error(f'Error: {str(e)}')
+            return ApiResponse(422, {"status": f"Error: {e}"}).to_json()
+        if replayed:
+            logger.info(f'Replaying stored response for Idempotency-Key {key}')
+            body, status, headers = response
+            return body, status, {**headers, "Idempotency-Replayed": "true"}
+        return response
+
+    return wrapper
+
 
 @app.route("/")
 @cross_origin()
 def root_path():
-    return json.loads('{"status": "ok"}'), 200
+    return STATUS_OK, 200, JSON_HEADERS
 
 
 @app.route('/health', methods=['GET'])
 @cross_origin()
 def health():
-    return json.loads('{"status": "ok"}'), 200
+    return STATUS_OK, 200, JSON_HEADERS
 
 
 @app.route(f'/{BOT_NAME}/health-connection', methods=['GET'])
@@ -73,20 +171,28 @@ def health_check():
 
 @app.route(f'/{BOT_NAME}/gripper/partial', methods=['POST'])
 @cross_origin()
+@correlated
+@idempotent
 def partial_gripper():
     try:
-        validate_json_structure(request)
-        data = PartialGripperRequestSchema().load(request.json)
+        data = load_request_body(request, PartialGripperRequestSchema)
         logger.info(f'Entered POST /{BOT_NAME}/gripper/partial')
         amount = data['amount']
-        urx_service.partial_gripper(amount=amount)
-        return ApiResponse(200, {"status": f"Gripper partially moved to {amount}"}).to_json()
+        state = urx_service.partial_gripper(amount=amount, client=get_client(), correlation_id=g.correlation_id)
+        return ApiResponse(200, {"status": f"Gripper partially moved to {amount}", **state}).to_json()
     except ValidationError as e:
         logger.error(f'Error: {str(e)}')
         return ApiResponse(400, {"status": f"Error: {e.messages}"}).to_json()
     except AttributeError as e:
         logger.error(f'Error: {str(e)}')
         return ApiResponse(400, {"status": str(e)}).to_json()
+    except MotionRejectedError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(429, {"status": f"Error: {e}", "retry_after": e.retry_after},
+                           {"Retry-After": str(e.retry_after)}).to_json()
+    except MotionCancelledError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(409, {"status": f"Error: {e}"}).to_json()
     except Exception as e:
         logger.error(f'Error: {str(e)}')
         return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
@@ -94,11 +200,20 @@ def partial_gripper():
 
 @app.route(f'/{BOT_NAME}/gripper/open', methods=['POST'])
 @cross_origin()
+@correlated
+@idempotent
 def open_gripper():
     try:
         logger.info(f'Entered POST /{BOT_NAME}/gripper/open')
-        urx_service.open_gripper()
-        return ApiResponse(200, {"status": "Gripper fully open"}).to_json()
+        state = urx_service.open_gripper(client=get_client(), correlation_id=g.correlation_id)
+        return ApiResponse(200, {"status": "Gripper fully open", **state}).to_json()
+    except MotionRejectedError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(429, {"status": f"Error: {e}", "retry_after": e.retry_after},
+                           {"Retry-After": str(e.retry_after)}).to_json()
+    except MotionCancelledError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(409, {"status": f"Error: {e}"}).to_json()
     except Exception as e:
         logger.error(f'Error: {str(e)}')
         return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
@@ -106,11 +221,20 @@ def open_gripper():
 
 @app.route(f'/{BOT_NAME}/gripper/close', methods=['POST'])
 @cross_origin()
+@correlated
+@idempotent
 def close_gripper():
     try:
         logger.info(f'Entered POST /{BOT_NAME}/gripper/close')
-        urx_service.close_gripper()
-        return ApiResponse(200, {"status": "Gripper fully closed"}).to_json()
+        state = urx_service.close_gripper(client=get_client(), correlation_id=g.correlation_id)
+        return ApiResponse(200, {"status": "Gripper fully closed", **state}).to_json()
+    except MotionRejectedError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(429, {"status": f"Error: {e}", "retry_after": e.retry_after},
+                           {"Retry-After": str(e.retry_after)}).to_json()
+    except MotionCancelledError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(409, {"status": f"Error: {e}"}).to_json()
     except Exception as e:
         logger.error(f'Error: {str(e)}')
         return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
@@ -118,24 +242,41 @@ def close_gripper():
 
 @app.route(f'/{BOT_NAME}/movej', methods=['POST'])
 @cross_origin()
+@correlated
+@idempotent
 def movej():
     try:
-        validate_json_structure(request)
-        data = MoveJRequestSchema().load(request.json)
+        data = load_request_body(request, MoveJRequestSchema)
         logger.info(f'Entered POST /{BOT_NAME}/movej')
         joint_positions = data['joint_positions']
         acceleration = data.get('acceleration', None)
         velocity = data.get('velocity', None)
         pose_object = data.get('pose_object', True)
         relative = data.get('relative', False)
-        moved_to = urx_service.movej(joint_positions, acceleration, velocity, pose_object, relative)
-        return ApiResponse(200, {"status": moved_to}).to_json()
+        trajectory_validator.validate_movej(joint_positions, acceleration, velocity, pose_object, relative)
+        report = {}
+        moved_to = urx_service.movej(joint_positions, acceleration, velocity, pose_object, relative,
+                                     gripper=data.get('gripper', None), report=report,
+                                     completion=data.get('completion', 'program'),
+                                     completion_tolerance=data.get('completion_tolerance', None), client=get_client(),
+                                     correlation_id=g.correlation_id)
+        return ApiResponse(200, {"status": moved_to, **report}).to_json()
     except ValidationError as e:
         logger.error(f'Error: {str(e)}')
         return ApiResponse(400, {"status": f"Error: {e.messages}"}).to_json()
+    except TrajectoryValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e}", "violations": e.violations}).to_json()
     except AttributeError as e:
         logger.error(f'Error: {str(e)}')
         return ApiResponse(400, {"status": str(e)}).to_json()
+    except MotionRejectedError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(429, {"status": f"Error: {e}", "retry_after": e.retry_after},
+                           {"Retry-After": str(e.retry_after)}).to_json()
+    except MotionCancelledError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(409, {"status": f"Error: {e}"}).to_json()
     except Exception as e:
         logger.error(f'Error: {str(e)}')
         return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
@@ -143,24 +284,41 @@ def movej():
 
 @app.route(f'/{BOT_NAME}/movel', methods=['POST'])
 @cross_origin()
+@correlated
+@idempotent
 def movel():
     try:
-        validate_json_structure(request)
-        data = MoveLRequestSchema().load(request.json)
+        data = load_request_body(request, MoveLRequestSchema)
         logger.info(f'Entered POST /{BOT_NAME}/movel')
         coordinates_and_angles = data['coordinates_and_angles']
         acceleration = data.get('acceleration', None)
         velocity = data.get('velocity', None)
         pose_object = data.get('pose_object', True)
         relative = data.get('relative', False)
-        moved_to = urx_service.movel(coordinates_and_angles, acceleration, velocity, pose_object, relative)
-        return ApiResponse(200, {"status": moved_to}).to_json()
+        trajectory_validator.validate_movel(coordinates_and_angles, acceleration, velocity, pose_object, relative)
+        report = {}
+        moved_to = urx_service.movel(coordinates_and_angles, acceleration, velocity, pose_object, relative,
+                                     gripper=data.get('gripper', None), report=report,
+                                     completion=data.get('completion', 'program'),
+                                     completion_tolerance=data.get('completion_tolerance', None), client=get_client(),
+                                     correlation_id=g.correlation_id)
+        return ApiResponse(200, {"status": moved_to, **report}).to_json()
     except ValidationError as e:
         logger.error(f'Error: {str(e)}')
         return ApiResponse(400, {"status": f"Error: {e.messages}"}).to_json()
+    except TrajectoryValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e}", "violations": e.violations}).to_json()
     except AttributeError as e:
         logger.error(f'Error: {str(e)}')
         return ApiResponse(400, {"status": str(e)}).to_json()
+    except MotionRejectedError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(429, {"status": f"Error: {e}", "retry_after": e.retry_after},
+                           {"Retry-After": str(e.retry_after)}).to_json()
+    except MotionCancelledError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(409, {"status": f"Error: {e}"}).to_json()
     except Exception as e:
         logger.error(f'Error: {str(e)}')
         return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
@@ -168,46 +326,320 @@ def movel():
 
 @app.route(f'/{BOT_NAME}/movels', methods=['POST'])
 @cross_origin()
+@correlated
+@idempotent
 def movels():
     try:
-        validate_json_structure(request)
-        data = MoveLSRequestSchema().load(request.json)
+        data = load_request_body(request, MoveLSRequestSchema)
         logger.info(f'Entered POST /{BOT_NAME}/movels')
         coordinates_list = data['coordinates_list']
         acceleration = data.get('acceleration', None)
         velocity = data.get('velocity', None)
-        moved_to = urx_service.movels(coordinates_list, acceleration, velocity)
-        return ApiResponse(200, {"status": moved_to}).to_json()
+        tolerance = data.get('tolerance', None)
+        angular_tolerance = data.get('angular_tolerance', DEFAULT_ANGULAR_TOLERANCE)
+        trajectory_validator.validate_movels(coordinates_list, acceleration, velocity)
+        simplification = None
+        if tolerance is not None:
+            coordinates_list, simplification = simplify_path(coordinates_list, tolerance, angular_tolerance)
+        report = {}
+        moved_to = urx_service.movels(coordinates_list, acceleration, velocity, gripper=data.get('gripper', None),
+                                      report=report, completion=data.get('completion', 'program'),
+                                      completion_tolerance=data.get('completion_tolerance', None),
+                                      client=get_client(), correlation_id=g.correlation_id)
+        response = {"status": moved_to, **report}
+        if simplification is not None:
+            response["simplification"] = simplification
+        return ApiResponse(200, response).to_json()
+    except ValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e.messages}"}).to_json()
+    except TrajectoryValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e}", "violations": e.violations}).to_json()
+    except AttributeError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": str(e)}).to_json()
+    except MotionRejectedError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(429, {"status": f"Error: {e}", "retry_after": e.retry_after},
+                           {"Retry-After": str(e.retry_after)}).to_json()
+    except MotionCancelledError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(409, {"status": f"Error: {e}"}).to_json()
+    except Exception as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
+
+
+@app.route(f'/{BOT_NAME}/trajectory', methods=['POST'])
+@cross_origin()
+@correlated
+def stream_trajectory():
+    path = None
+    try:
+        data = TrajectoryStreamRequestSchema().load(request.args)
+        logger.info(f'Entered POST /{BOT_NAME}/trajectory')
+        stream_format = STREAM_FORMATS.get(request.mimetype)
+        if stream_format is None:
+            raise AttributeError(f"Invalid body, must be one of: {', '.join(STREAM_FORMATS)}")
+        acceleration = data.get('acceleration', None)
+        velocity = data.get('velocity', None)
+        path, count = spool_trajectory(read_waypoints(request.stream, stream_format), trajectory_validator,
+                                       acceleration, velocity)
+        logger.info(f'Spooled trajectory of {count} waypoints')
+        report = {}
+        moved_to = urx_service.stream_trajectory(path, acceleration, velocity, report=report,
+                                                 completion=data.get('completion', 'program'),
+                                                 completion_tolerance=data.get('completion_tolerance', None),
+                                                 client=get_client(), correlation_id=g.correlation_id)
+        return ApiResponse(200, {"status": moved_to, **report}).to_json()
     except ValidationError as e:
         logger.error(f'Error: {str(e)}')
         return ApiResponse(400, {"status": f"Error: {e.messages}"}).to_json()
+    except TrajectoryValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e}", "violations": e.violations}).to_json()
     except AttributeError as e:
         logger.error(f'Error: {str(e)}')
         return ApiResponse(400, {"status": str(e)}).to_json()
+    except MotionRejectedError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(429, {"status": f"Error: {e}", "retry_after": e.retry_after},
+                           {"Retry-After": str(e.retry_after)}).to_json()
+    except MotionCancelledError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(409, {"status": f"Error: {e}"}).to_json()
     except Exception as e:
         logger.error(f'Error: {str(e)}')
         return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
+    finally:
+        if path is not None:
+            os.remove(path)
 
 
 @app.route(f'/{BOT_NAME}/move', methods=["POST"])
 @cross_origin()
+@correlated
+@idempotent
 def move():
     try:
-        validate_json_structure(request)
-        data = MoveRequestSchema().load(request.json)
+        data = load_request_body(request, MoveRequestSchema)
         logger.info(f'Entered POST /{BOT_NAME}/move')
         direction = data["direction"]
         distance = data.get("distance", None)
         acceleration = data.get("acceleration", None)
         velocity = data.get("velocity", None)
-        moved_to = getattr(urx_service, direction)(distance, acceleration, velocity)
-        return ApiResponse(200, {"status": moved_to}).to_json()
+        trajectory_validator.validate_move(MOVE_AXES[direction], distance, acceleration, velocity)
+        report = {}
+        moved_to = getattr(urx_service, direction)(distance, acceleration, velocity, report=report,
+                                                   completion=data.get('completion', 'program'),
+                                                   completion_tolerance=data.get('completion_tolerance', None),
+                                                   client=get_client(), correlation_id=g.correlation_id)
+        return ApiResponse(200, {"status": moved_to, **report}).to_json()
+    except ValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e.messages}"}).to_json()
+    except TrajectoryValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e}", "violations": e.violations}).to_json()
+    except AttributeError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": str(e)}).to_json()
+    except MotionRejectedError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(429, {"status": f"Error: {e}", "retry_after": e.retry_after},
+                           {"Retry-After": str(e.retry_after)}).to_json()
+    except MotionCancelledError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(409, {"status": f"Error: {e}"}).to_json()
+    except Exception as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
+
+
+@app.route(f'/{BOT_NAME}/sequence', methods=['POST'])
+@cross_origin()
+@correlated
+@idempotent
+def sequence():
+    try:
+        data = load_request_body(request, SequenceRequestSchema)
+        logger.info(f'Entered POST /{BOT_NAME}/sequence')
+        steps = data['steps']
+        trajectory_validator.validate_sequence(steps)
+        report = {}
+        moved_to = urx_service.run_sequence(steps, report=report, client=get_client(), correlation_id=g.correlation_id)
+        return ApiResponse(200, {"status": moved_to, **report}).to_json()
+    except ValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e.messages}"}).to_json()
+    except TrajectoryValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e}", "violations": e.violations}).to_json()
+    except AttributeError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": str(e)}).to_json()
+    except MotionRejectedError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(429, {"status": f"Error: {e}", "retry_after": e.retry_after},
+                           {"Retry-After": str(e.retry_after)}).to_json()
+    except MotionCancelledError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(409, {"status": f"Error: {e}"}).to_json()
+    except Exception as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
+
+
+@app.route(f'/{BOT_NAME}/programs', methods=['POST'])
+@cross_origin()
+def register_program():
+    try:
+        data = load_request_body(request, RegisterProgramRequestSchema)
+        logger.info(f'Entered POST /{BOT_NAME}/programs')
+        name = data['name']
+        trajectory_validator.validate_sequence(data['steps'])
+        steps, body, path_estimate = urx_service.compile_program(data['steps'])
+        program = CachedProgram(name, steps, body, trajectory_validator.get_envelope(steps), path_estimate)
+        evicted = program_cache.register(program)
+        return ApiResponse(200, {"status": f"Program {name} registered", "evicted": evicted}).to_json()
+    except ValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e.messages}"}).to_json()
+    except TrajectoryValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e}", "violations": e.violations}).to_json()
+    except AttributeError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": str(e)}).to_json()
+    except Exception as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
+
+
+@app.route(f'/{BOT_NAME}/programs', methods=['GET'])
+@cross_origin()
+def list_programs():
+    try:
+        logger.info(f'Entered GET /{BOT_NAME}/programs')
+        return ApiResponse(200, {"programs": program_cache.list_programs()}).to_json()
+    except Exception as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
+
+
+@app.route(f'/{BOT_NAME}/programs/<name>', methods=['DELETE'])
+@cross_origin()
+def delete_program(name):
+    try:
+        logger.info(f'Entered DELETE /{BOT_NAME}/programs/{name}')
+        program_cache.delete(name)
+        return ApiResponse(200, {"status": f"Program {name} deleted"}).to_json()
+    except ProgramNotFoundError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(404, {"status": f"Error: {e}"}).to_json()
+    except Exception as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
+
+
+@app.route(f'/{BOT_NAME}/programs/<name>/run', methods=['POST'])
+@cross_origin()
+@correlated
+@idempotent
+def run_program(name):
+    try:
+        data = load_request_body(request, RunProgramRequestSchema) if request.content_length else {}
+        logger.info(f'Entered POST /{BOT_NAME}/programs/{name}/run')
+        program = program_cache.get(name)
+        offset = data.get('offset', [0.0, 0.0, 0.0])
+        speed = data.get('speed', 1.0)
+        trajectory_validator.validate_parameters(program.envelope, offset, speed)
+        report = {}
+        moved_to = urx_service.run_program(program, offset, speed, report=report, client=get_client(),
+                                           correlation_id=g.correlation_id)
+        return ApiResponse(200, {"status": moved_to, **report}).to_json()
+    except ProgramNotFoundError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(404, {"status": f"Error: {e}"}).to_json()
+    except ValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e.messages}"}).to_json()
+    except TrajectoryValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e}", "violations": e.violations}).to_json()
+    except AttributeError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": str(e)}).to_json()
+    except MotionRejectedError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(429, {"status": f"Error: {e}", "retry_after": e.retry_after},
+                           {"Retry-After": str(e.retry_after)}).to_json()
+    except MotionCancelledError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(409, {"status": f"Error: {e}"}).to_json()
+    except Exception as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
+
+
+@app.route(f'/{BOT_NAME}/pipeline', methods=['POST'])
+@cross_origin()
+@idempotent
+def queue_motion():
+    try:
+        data = load_request_body(request, PipelineRequestSchema)
+        logger.info(f'Entered POST /{BOT_NAME}/pipeline')
+        trajectory_validator.validate_sequence([data])
+        correlation_id = get_correlation_id()
+        urx_service.record_timeline(correlation_id, "received", route=request.path, client=get_client())
+        queued = urx_service.queue_motion(data, client=get_client(), correlation_id=correlation_id)
+        return ApiResponse(202, {"status": "Motion queued", "correlation_id": correlation_id, **queued},
+                           {"X-Correlation-Id": correlation_id}).to_json()
     except ValidationError as e:
         logger.error(f'Error: {str(e)}')
         return ApiResponse(400, {"status": f"Error: {e.messages}"}).to_json()
+    except TrajectoryValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e}", "violations": e.violations}).to_json()
     except AttributeError as e:
         logger.error(f'Error: {str(e)}')
         return ApiResponse(400, {"status": str(e)}).to_json()
+    except MotionRejectedError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(429, {"status": f"Error: {e}", "retry_after": e.retry_after},
+                           {"Retry-After": str(e.retry_after)}).to_json()
+    except Exception as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
+
+
+@app.route(f'/{BOT_NAME}/pipeline', methods=['GET'])
+@cross_origin()
+def get_pipeline():
+    try:
+        logger.info(f'Entered GET /{BOT_NAME}/pipeline')
+        return ApiResponse(200, urx_service.get_pipeline_stats()).to_json()
+    except Exception as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
+
+
+@app.route(f'/{BOT_NAME}/stop', methods=['POST'])
+@cross_origin()
+def stop():
+    received = time.perf_counter()
+    try:
+        data = load_request_body(request, StopRequestSchema) if request.content_length else {}
+        logger.info(f'Entered POST /{BOT_NAME}/stop')
+        stopped = urx_service.stop(data.get('mode', 'joint'), data.get('deceleration', None))
+        # From the request reaching its handler to the stop command written to the robot socket and the motions
+        # cancelled.
+        latency = time.perf_counter() - received
+        return ApiResponse(200, {"status": "Robot stopped", **stopped, "latency": latency}).to_json()
+    except ValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e.messages}"}).to_json()
     except Exception as e:
         logger.error(f'Error: {str(e)}')
         return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
@@ -243,8 +675,7 @@ def get_config():
 @cross_origin()
 def set_config():
     try:
-        validate_json_structure(request)
-        data = SetConfigRequestSchema().load(request.json)
+        data = load_request_body(request, SetConfigRequestSchema)
         logger.info(f'Entered POST /{BOT_NAME}/config')
         velocity = data.get('velocity', None)
         acceleration = data.get('acceleration', None)
@@ -345,6 +776,103 @@ def get_current_tool_position():
         return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
 
 
+@app.route(f'/{BOT_NAME}/state/history', methods=['GET'])
+@cross_origin()
+def get_state_history():
+    try:
+        data = StateHistoryRequestSchema().load(request.args)
+        logger.info(f'Entered GET /{BOT_NAME}/state/history')
+        history = urx_service.get_state_history(data.get('start', None), data.get('end', None),
+                                                data.get('max_points', 1000), data.get('method', 'lttb'))
+        return ApiResponse(200, history).to_json()
+    except ValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e.messages}"}).to_json()
+    except Exception as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
+
+
+@app.route(f'/{BOT_NAME}/timeline/<correlation_id>', methods=['GET'])
+@cross_origin()
+def get_timeline(correlation_id):
+    try:
+        data = TimelineRequestSchema().load(request.args)
+        logger.info(f'Entered GET /{BOT_NAME}/timeline/{correlation_id}')
+        timeline = urx_service.get_timeline(correlation_id, data.get('max_points', 100))
+        if timeline is None:
+            return ApiResponse(404, {"status": f"Error: No timeline for correlation ID {correlation_id}"}).to_json()
+        return ApiResponse(200, timeline).to_json()
+    except ValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e.messages}"}).to_json()
+    except Exception as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
+
+
+@app.route(f'/{BOT_NAME}/fk', methods=['POST'])
+@cross_origin()
+def forward_kinematics():
+    try:
+        data = load_request_body(request, ForwardKinematicsRequestSchema)
+        logger.info(f'Entered POST /{BOT_NAME}/fk')
+        poses = urx_service.forward_kinematics(data['joint_positions_list'])
+        return ApiResponse(200, {"poses": poses}).to_json()
+    except ValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e.messages}"}).to_json()
+    except AttributeError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": str(e)}).to_json()
+    except Exception as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
+
+
+@app.route(f'/{BOT_NAME}/ik', methods=['POST'])
+@cross_origin()
+def inverse_kinematics():
+    try:
+        data = load_request_body(request, InverseKinematicsRequestSchema)
+        logger.info(f'Entered POST /{BOT_NAME}/ik')
+        poses = data['poses']
+        reference_joint_positions = data.get('reference_joint_positions', None)
+        all_solutions = data.get('all_solutions', False)
+        joint_positions_list = urx_service.inverse_kinematics(poses, reference_joint_positions, all_solutions)
+        return ApiResponse(200, {"joint_positions_list": joint_positions_list}).to_json()
+    except ValidationError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": f"Error: {e.messages}"}).to_json()
+    except AttributeError as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(400, {"status": str(e)}).to_json()
+    except Exception as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
+
+
+@app.route(f'/{BOT_NAME}/metrics', methods=['GET'])
+@cross_origin()
+def get_metrics():
+    try:
+        return ApiResponse(200,
+                           {
+                               "idempotency": idempotency_cache.get_stats(),
+                               "program_cache": program_cache.get_stats(),
+                               "duration_estimator": urx_service.get_estimator_stats(),
+                               "state_history": urx_service.get_history_stats(),
+                               "startup": urx_service.get_startup_timings(),
+                               "motion": urx_service.get_motion_stats(),
+                               "timeline": urx_service.get_timeline_stats(),
+                               "pipeline": urx_service.get_pipeline_stats()
+                           }
+                           ).to_json()
+    except Exception as e:
+        logger.error(f'Error: {str(e)}')
+        return ApiResponse(500, {"status": f"Error: {e}"}).to_json()
+
+
 if __name__ == "__main__":
     logger.info(f"Flask server starting at {os.getenv('FLASK_HOST')}:{os.getenv('FLASK_PORT')}")
     serve(app, host=os.getenv("FLASK_HOST"), port=os.getenv("FLASK_PORT"))
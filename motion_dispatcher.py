@@ -0,0 +1,420 @@
+import functools
+import math
+import threading
+import time
+from collections import deque
+
+# Weight of the last motion in the average duration the wait of queued motions is estimated from.
+DURATION_SMOOTHING = 0.2
+# Duration assumed for the motions of a client before any motion completed.
+DEFAULT_DURATION = 1.0
+# Scheduling decisions kept for the metrics.
+DECISIONS_KEPT = 32
+DEFAULT_CLIENT = "anonymous"
+# Clients whose state is kept. Beyond it the idle clients without a weight or quota are forgotten, and new clients are
+# charged to the anonymous client while every kept client is active.
+MAX_CLIENTS = 256
+
+
+class MotionCancelledError(Exception):
+    """
+        Raised when a motion is stopped while running, or flushed before it started.
+    """
+
+
+class MotionRejectedError(Exception):
+    """
+        Raised when a motion is not admitted because the queue is too long or its client used up its quota, so the
+        client retries later instead of holding a request open.
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def __reduce__(self):
+        return self.__class__, (str(self), self.retry_after)
+
+
+class _Ticket:
+    __slots__ = ("client", "thread", "cost", "virtual_arrival", "start", "finish", "arrived_at", "cancelled",
+                 "rejected")
+
+    def __init__(self, client, thread, cost, virtual_arrival, arrived_at):
+        self.client = client
+        self.thread = thread
+        self.virtual_arrival = virtual_arrival
+        self.tag(cost, client.finish)
+        self.arrived_at = arrived_at
+        self.cancelled = False
+        self.rejected = None
+
+    def tag(self, cost, previous_finish):
+        # A client idle for a while starts from the virtual time of its arrival, it gets no credit for the idle time.
+        self.cost = cost
+        self.start = max(self.virtual_arrival, previous_finish)
+        self.finish = self.start + cost / self.client.weight
+
+
+class _Client:
+    __slots__ = ("name", "weight", "quota", "charged", "finish", "duration", "queued", "usage", "robot_seconds",
+                 "wait", "completed", "cancelled", "flushed", "rejected", "evicted")
+
+    def __init__(self, name, weight, quota):
+        self.name = name
+        self.weight = weight
+        self.quota = quota
+        # The virtual finish of the started motions of the client, and of its queued ones.
+        self.charged = 0.0
+        self.finish = 0.0
+        self.duration = None
+        self.queued = 0
+        self.usage = deque()
+        self.robot_seconds = 0.0
+        self.wait = 0.0
+        self.completed = 0
+        self.cancelled = 0
+        self.flushed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def get_usage(self, now, window):
+        while self.usage and self.usage[0][0] <= now - window:
+            self.usage.popleft()
+        return sum(duration for _, duration in self.usage)
+
+
+class MotionDispatcher:
+    """
+        Runs the motions of a robot one at a time, shares the robot time between clients and stops the motions on
+        demand.
+
+        Queued motions are started by weighted fair queueing: every motion gets a virtual finish time, its expected
+        duration divided by the weight of its client after the finish of the previous motion of the client, and the
+        queued motion finishing first starts next. A client sending more motions than another of the same weight
+        delays its own motions rather than the other's. The actual duration of a motion is charged to its client
+        when it completes, so clients share robot-seconds rather than motions.
+
+        Stopping never waits for the running motion: it marks the running motion as cancelled, which its wait loop
+        checks, and removes the queued motions, which raise MotionCancelledError instead of starting.
+
+        Motions arriving when the queue is full, or when they would wait too long, are rejected right away, as well
+        as the motions of a client that used its quota of robot-seconds. When the queue is full, a motion of a client
+        below its share of the queue takes the place of the last motion of the client most above it.
+    """
+
+    def __init__(self, max_depth=None, max_wait=None, weights=None, quotas=None, quota_window=3600.0):
+        """
+            Parameters
+            ----------
+            max_depth : int, optional
+                The maximum number of motions waiting behind the running one. Default is no limit.
+            max_wait : float, optional
+                The maximum estimated wait of a motion before it starts, in seconds. Default is no limit.
+            weights : dict, optional
+                The weight of every client, 1 for the clients not listed.
+            quotas : dict, optional
+                The robot-seconds every client can use per quota window, no limit for the clients not listed.
+            quota_window : float, optional
+                The period of the quotas in seconds. Default is an hour.
+        """
+        self._max_depth = max_depth
+        self._max_wait = max_wait
+        self._weights = weights or {}
+        self._quotas = quotas or {}
+        self._quota_window = quota_window
+        self._condition = threading.Condition()
+        self._clients = {}
+        self._queue = []
+        self._current = None
+        self._started_at = None
+        self._virtual_time = 0.0
+        self._duration = None
+        self._decisions = deque(maxlen=DECISIONS_KEPT)
+        self._completed = 0
+        self._cancelled = 0
+        self._flushed = 0
+        self._rejected = 0
+        self._stops = 0
+        self._forgotten = 0
+
+    def run(self, function, client=None):
+        """
+            Run a motion once the scheduler picks it.
+
+            A motion started from the running motion, like a relative move calling movel, runs right away as part
+            of it.
+
+            Parameters
+            ----------
+            function : callable
+                Runs the motion.
+            client : str, optional
+                The client the robot time is charged to. Default is the anonymous client.
+
+            Raises
+            ------
+            MotionRejectedError
+                If the queue is full, the motion would wait longer than the maximum wait or the client used its quota.
+            MotionCancelledError
+                If the motion is flushed by a stop before it starts.
+        """
+        thread = threading.get_ident()
+        with self._condition:
+            if self._current is not None and self._current.thread == thread:
+                nested = True
+            else:
+                nested = False
+                now = time.monotonic()
+                state = self.__get_client(DEFAULT_CLIENT if client is None else client)
+                self.__admit(state, now)
+                ticket = _Ticket(state, thread, self.__expect(state), self._virtual_time, now)
+                state.finish = ticket.finish
+                state.queued += 1
+                self._queue.append(ticket)
+                while self._current is not None or self.__next() is not ticket:
+                    self._condition.wait()
+                    if ticket.rejected is not None:
+                        raise ticket.rejected
+                    if ticket.cancelled:
+                        raise MotionCancelledError("Motion flushed by a stop before it started")
+                self.__start(ticket)
+        if nested:
+            return function()
+        try:
+            return function()
+        finally:
+            with self._condition:
+                self.__finish(ticket)
+
+    def __get_client(self, name):
+        state = self._clients.get(name)
+        if state is None:
+            if name != DEFAULT_CLIENT and len(self._clients) >= MAX_CLIENTS:
+                self.__forget_idle_clients()
+                if len(self._clients) >= MAX_CLIENTS:
+                    return self.__get_client(DEFAULT_CLIENT)
+            state = self._clients[name] = _Client(name, self._weights.get(name, 1.0), self._quotas.get(name))
+        return state
+
+    def __forget_idle_clients(self):
+        for name, state in list(self._clients.items()):
+            if name == DEFAULT_CLIENT or name in self._weights or name in self._quotas:
+                continue
+            # An idle client comes back without credit for its idle time anyway, like a new one.
+            if state.queued or (self._current is not None and self._current.client is state):
+                continue
+            del self._clients[name]
+            self._forgotten += 1
+
+    def __expect(self, state):
+        return state.duration or self._duration or DEFAULT_DURATION
+
+    def __retag(self, state):
+        state.finish = state.charged
+        for queued in sorted((queued for queued in self._queue if queued.client is state),
+                             key=lambda queued: queued.arrived_at):
+            queued.tag(self.__expect(state), state.finish)
+            state.finish = queued.finish
+
+    def __next(self):
+        return min(self._queue, key=lambda ticket: (ticket.finish, ticket.arrived_at)) if self._queue else None
+
+    def __start(self, ticket):
+        self._queue.remove(ticket)
+        ticket.client.queued -= 1
+        self._current = ticket
+        self._started_at = time.monotonic()
+        self._virtual_time = ticket.start
+        ticket.client.charged = ticket.finish
+        wait = self._started_at - ticket.arrived_at
+        ticket.client.wait += wait
+        # The motions that arrived earlier but start later, because their clients used more than their share.
+        passed = [other.client.name for other in self._queue if other.arrived_at < ticket.arrived_at]
+        self._decisions.append({"client": ticket.client.name, "wait": wait, "finish": ticket.finish, "passed": passed})
+
+    def __finish(self, ticket):
+        now = time.monotonic()
+        duration = now - self._started_at
+        state = ticket.client
+        self._current = None
+        state.usage.append((now, duration))
+        state.get_usage(now, self._quota_window)
+        state.robot_seconds += duration
+        if ticket.cancelled:
+            self._cancelled += 1
+            state.cancelled += 1
+        else:
+            self._completed += 1
+            state.completed += 1
+            self._duration = self.__smooth(self._duration, duration)
+            state.duration = self.__smooth(state.duration, duration)
+        # Charge the actual duration instead of the expected one, and expect the new average durations from the
+        # queued motions.
+        state.charged = ticket.start + duration / state.weight
+        for client in {queued.client for queued in self._queue} | {state}:
+            self.__retag(client)
+        self._condition.notify_all()
+
+    @staticmethod
+    def __smooth(average, duration):
+        return duration if average is None else DURATION_SMOOTHING * duration + (1 - DURATION_SMOOTHING) * average
+
+    def __estimate_wait(self):
+        if self._duration is None:
+            return 0.0
+        remaining = 0.0
+        if self._current is not None:
+            remaining = max(self._duration - (time.monotonic() - self._started_at), 0.0)
+        return remaining + len(self._queue) * self._duration
+
+    def __admit(self, state, now):
+        if state.quota is not None:
+            used = state.get_usage(now, self._quota_window)
+            if used >= state.quota:
+                # The quota frees up as the oldest motions of the client leave the window.
+                retry_after = self._quota_window
+                for completed_at, duration in state.usage:
+                    used -= duration
+                    if used < state.quota:
+                        retry_after = completed_at + self._quota_window - now
+                        break
+                self.__reject(state, f"client {state.name} used its quota of {state.quota} robot-seconds",
+                              retry_after)
+        depth = len(self._queue)
+        wait = self.__estimate_wait()
+        if self._max_depth is not None and depth >= self._max_depth:
+            if not self.__evict(state):
+                self.__reject(state, f"{depth} motions already queued", wait)
+        elif self._max_wait is not None and wait > self._max_wait:
+            self.__reject(state, f"estimated wait of {wait:.1f} s is over {self._max_wait} s", wait)
+
+    def __evict(self, state):
+        heaviest = max(self._clients.values(), key=lambda client: client.queued / client.weight)
+        if heaviest is state or (state.queued + 1) / state.weight >= heaviest.queued / heaviest.weight:
+            return False
+        ticket = max((ticket for ticket in self._queue if ticket.client is heaviest),
+                     key=lambda ticket: ticket.arrived_at)
+        self._queue.remove(ticket)
+        heaviest.queued -= 1
+        self.__retag(heaviest)
+        heaviest.evicted += 1
+        heaviest.rejected += 1
+        self._rejected += 1
+        ticket.rejected = MotionRejectedError(f"Motion rejected, replaced by a motion of client {state.name}",
+                                              max(1, math.ceil(self.__estimate_wait())))
+        self._condition.notify_all()
+        return True
+
+    def __reject(self, state, reason, wait):
+        state.rejected += 1
+        self._rejected += 1
+        raise MotionRejectedError(f"Motion rejected, {reason}", max(1, math.ceil(wait)))
+
+    def is_cancelled(self):
+        """
+            Check whether the running motion was stopped, for its wait loop to return early.
+        """
+        current = self._current
+        return current is not None and current.cancelled
+
+    def stop(self):
+        """
+            Cancel the running motion and flush the queued ones.
+
+            Returns
+            -------
+            tuple
+                Whether a motion was running, and the number of queued motions flushed.
+        """
+        with self._condition:
+            self._stops += 1
+            running = self._current is not None
+            if running:
+                self._current.cancelled = True
+            flushed = len(self._queue)
+            for ticket in self._queue:
+                ticket.cancelled = True
+                ticket.client.queued -= 1
+                ticket.client.flushed += 1
+            self._queue.clear()
+            for client in self._clients.values():
+                client.finish = client.charged
+            self._flushed += flushed
+            self._condition.notify_all()
+        return running, flushed
+
+    def has_queued(self):
+        """
+            Tell whether motions wait for the running one.
+        """
+        with self._condition:
+            return bool(self._queue)
+
+    def get_stats(self):
+        """
+            Get the number of running, queued, completed, cancelled, flushed and rejected motions and of stops, the
+            average duration of a motion and estimated wait of a new one in seconds, the same per client with the
+            robot-seconds it used, and the last scheduling decisions.
+        """
+        with self._condition:
+            now = time.monotonic()
+            return {
+                "running": self._current is not None,
+                "queued": len(self._queue),
+                "completed": self._completed,
+                "cancelled": self._cancelled,
+                "flushed": self._flushed,
+                "rejected": self._rejected,
+                "stops": self._stops,
+                "forgotten_clients": self._forgotten,
+                "average_duration": self._duration,
+                "estimated_wait": self.__estimate_wait(),
+                "max_depth": self._max_depth,
+                "max_wait": self._max_wait,
+                "clients": {
+                    name: {
+                        "weight": client.weight,
+                        "running": self._current is not None and self._current.client is client,
+                        "queued": client.queued,
+                        "completed": client.completed,
+                        "cancelled": client.cancelled,
+                        "flushed": client.flushed,
+                        "rejected": client.rejected,
+                        "evicted": client.evicted,
+                        "robot_seconds": client.robot_seconds,
+                        "quota": client.quota,
+                        "quota_used": client.get_usage(now, self._quota_window),
+                        "average_duration": client.duration,
+                        "average_wait": client.wait / max(client.completed + client.cancelled, 1)
+                    } for name, client in self._clients.items()
+                },
+                "decisions": list(self._decisions)
+            }
+
+
+def dispatched(method):
+    """
+        Run a motion method of a service through the dispatcher of the service, charging the robot time to the client
+        given as the client keyword argument.
+
+        The correlation ID given as the correlation_id keyword argument is the one of the motion while it runs, and
+        its dispatch is recorded in the timeline of the service.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, client=None, correlation_id=None, **kwargs):
+        def run():
+            # Motions made of other motions run them directly, keeping the correlation ID of the outer one.
+            outer = self._correlation_id
+            if correlation_id is not None:
+                self._correlation_id = correlation_id
+                self._timeline.record(correlation_id, "dispatched", method=method.__name__)
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self._correlation_id = outer
+
+        return self._dispatcher.run(run, client)
+
+    return wrapper
@@ -0,0 +1,227 @@
+import math
+import threading
+
+import numpy as np
+
+from kinematics import closest_solutions, forward_kinematics, inverse_kinematics
+from trajectory import rotation_vectors_to_quaternions
+
+
+def trapezoidal_duration(distance, velocity, acceleration):
+    """
+        Duration of a rest-to-rest move along a trapezoidal (or triangular) velocity profile.
+
+        Parameters
+        ----------
+        distance : float
+            The distance to travel in meters or radians.
+        velocity : float
+            The maximum velocity in m/s or rad/s.
+        acceleration : float
+            The acceleration and deceleration in m/s^2 or rad/s^2.
+
+        Returns
+        -------
+        float
+            The duration in seconds.
+    """
+    if distance <= 0:
+        return 0.0
+    if velocity <= 0 or acceleration <= 0:
+        return math.inf
+    if distance >= velocity * velocity / acceleration:
+        return distance / velocity + velocity / acceleration
+    return 2 * math.sqrt(distance / acceleration)
+
+
+def _rotation_angle(rotation_from, rotation_to):
+    quaternions = rotation_vectors_to_quaternions(np.asarray([rotation_from, rotation_to], dtype=float))
+    return 2 * math.acos(min(1.0, abs(float(quaternions[0] @ quaternions[1]))))
+
+
+class DurationEstimator:
+    """
+        Predicts the execution time of movej, movel and movels motions and derives their timeouts.
+
+        The physical estimate follows a trapezoidal velocity profile over the path length. For each motion kind
+        a correction factor, the ratio between observed and estimated durations, is learned with an exponential
+        moving average so that controller overhead and blending are accounted for over time.
+
+        Timeouts derived from the estimate are never shorter than the default timeout until ``min_samples`` durations
+        of the motion kind were observed, and a motion that timed out raises the factor to at least its observed
+        ratio, so a controller much slower than estimated, like one with its speed slider down, is learned as well.
+    """
+
+    def __init__(self, tcp=None, smoothing=0.2, timeout_margin=1.5, timeout_slack=2.0, min_samples=3):
+        self._tcp = tcp
+        self._smoothing = smoothing
+        self._timeout_margin = timeout_margin
+        self._timeout_slack = timeout_slack
+        self._min_samples = min_samples
+        self._factors = {}
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def estimate_movej(self, current_joints, joint_positions, acceleration, velocity, pose_object=True,
+                       relative=False):
+        """
+            Estimate a movej from the largest joint displacement, which is the one that leads the motion.
+
+            Returns
+            -------
+            float or None
+                The estimated duration in seconds, or None if the target cannot be resolved to joint positions.
+        """
+        target = np.asarray(joint_positions, dtype=float)
+        current = np.asarray(current_joints, dtype=float)
+        if relative:
+            displacement = target
+        elif pose_object:
+            target = closest_solutions(inverse_kinematics(target, self._tcp), current)[0]
+            if np.isnan(target).any():
+                return None
+            displacement = target - current
+        else:
+            displacement = target - current
+        return trapezoidal_duration(float(np.max(np.abs(displacement))), velocity, acceleration)
+
+    def estimate_movel(self, current_pose, coordinates_and_angles, acceleration, velocity, pose_object=True,
+                       relative=False):
+        """
+            Estimate a movel from the tool displacement, taking the slower of translation and rotation.
+
+            Returns
+            -------
+            float
+                The estimated duration in seconds.
+        """
+        target = np.asarray(coordinates_and_angles, dtype=float)
+        current = np.asarray(current_pose, dtype=float)
+        if relative:
+            distance = float(np.linalg.norm(target[:3]))
+            angle = float(np.linalg.norm(target[3:]))
+        else:
+            if not pose_object:
+                target = forward_kinematics(target, self._tcp)[0]
+            distance = float(np.linalg.norm(target[:3] - current[:3]))
+            angle = _rotation_angle(current[3:], target[3:])
+        return max(trapezoidal_duration(distance, velocity, acceleration),
+                   trapezoidal_duration(angle, velocity, acceleration))
+
+    def estimate_movels(self, current_pose, coordinates_list, acceleration, velocity):
+        """
+            Estimate a blended movels as a single profile over the whole path length.
+
+            Returns
+            -------
+            float
+                The estimated duration in seconds.
+        """
+        positions = np.vstack((np.asarray(current_pose, dtype=float)[:3],
+                               np.asarray(coordinates_list, dtype=float).reshape(-1, 6)[:, :3]))
+        length = float(np.linalg.norm(np.diff(positions, axis=0), axis=1).sum())
+        return trapezoidal_duration(length, velocity, acceleration)
+
+    def estimate_sequence(self, current_joints, steps):
+        """
+            Estimate a sequence as the sum of its arm steps and waits, following the joint positions from step to
+            step. Gripper steps are not estimated, their time is learned through the correction factor.
+
+            Returns
+            -------
+            float or None
+                The estimated duration in seconds, or None if a pose target is unreachable.
+        """
+        joints = np.asarray(current_joints, dtype=float)
+        total = 0.0
+        for step in steps:
+            if step["type"] == "wait":
+                total += step["seconds"]
+                continue
+            if step["type"] not in ("movej", "movel"):
+                continue
+            pose_object = step.get("pose_object", True)
+            if step["type"] == "movej":
+                target = step["joint_positions"]
+                estimate = self.estimate_movej(joints, target, step["acceleration"], step["velocity"], pose_object)
+            else:
+                target = step["coordinates_and_angles"]
+                estimate = self.estimate_movel(forward_kinematics(joints, self._tcp)[0], target,
+                                               step["acceleration"], step["velocity"], pose_object)
+            if estimate is None:
+                return None
+            total += estimate
+            if pose_object:
+                joints = closest_solutions(inverse_kinematics(np.asarray(target, dtype=float), self._tcp), joints)[0]
+                if np.isnan(joints).any():
+                    return None
+            else:
+                joints = np.asarray(target, dtype=float)
+        return total
+
+    def predict(self, kind, estimate):
+        """
+            Apply the learned correction factor of a motion kind to a physical estimate.
+        """
+        if estimate is None:
+            return None
+        with self._lock:
+            return estimate * self._factors.get(kind, 1.0)
+
+    def get_timeout(self, kind, estimate, default_timeout):
+        """
+            Get the timeout of a motion from its estimate.
+
+            Parameters
+            ----------
+            kind : str
+                The motion kind (movej, movel, movels).
+            estimate : float or None
+                The physical estimate in seconds.
+            default_timeout : float
+                The timeout to use when there is no estimate.
+
+            Returns
+            -------
+            float
+                The timeout in seconds.
+        """
+        predicted = self.predict(kind, estimate)
+        if predicted is None or math.isinf(predicted):
+            return default_timeout
+        timeout = predicted * self._timeout_margin + self._timeout_slack
+        with self._lock:
+            if self._samples.get(kind, 0) < self._min_samples:
+                return max(timeout, default_timeout)
+        return timeout
+
+    def observe(self, kind, estimate, duration):
+        """
+            Learn from the observed duration of a motion.
+        """
+        if estimate is None or duration is None or not 0 < estimate < math.inf:
+            return
+        ratio = min(max(duration / estimate, 0.1), 10.0)
+        with self._lock:
+            factor = self._factors.get(kind)
+            self._factors[kind] = ratio if factor is None else factor + self._smoothing * (ratio - factor)
+            self._samples[kind] = self._samples.get(kind, 0) + 1
+
+    def observe_timeout(self, kind, estimate, elapsed):
+        """
+            Learn from a motion that timed out, whose duration is at least the time waited for it.
+        """
+        if estimate is None or not 0 < estimate < math.inf:
+            return
+        ratio = min(elapsed / estimate, 10.0)
+        with self._lock:
+            self._factors[kind] = max(self._factors.get(kind, 1.0), ratio)
+
+    def get_stats(self):
+        """
+            Get the learned correction factors and the number of observations per motion kind.
+        """
+        with self._lock:
+            # A kind whose motions only timed out has a factor without timed samples.
+            return {kind: {"correction_factor": factor, "samples": self._samples.get(kind, 0)}
+                    for kind, factor in self._factors.items()}
@@ -0,0 +1,304 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from motion_dispatcher import DEFAULT_CLIENT, MotionCancelledError, MotionRejectedError
+
+# Gaps kept for the idle time percentiles.
+GAPS_KEPT = 256
+# Longest wait of the worker before retrying the motions of a client the dispatcher rejected.
+MAX_RETRY_WAIT = 5.0
+
+
+class _Item:
+    __slots__ = ("step", "client", "correlation_id", "queued_at")
+
+    def __init__(self, step, client, correlation_id):
+        self.step = step
+        self.client = client
+        self.correlation_id = correlation_id
+        self.queued_at = time.time()
+
+
+class MotionPipeline:
+    """
+        A queue of motions accepted ahead of time, so the robot does not wait for the round trip of a request
+        between two motions.
+
+        A worker thread hands the queued motions to a runner, which is given the client of the first of them and
+        takes the motions of that client with take until none is left. The runner goes through the dispatcher like
+        any motion and gives the robot back to the other clients between motions.
+
+        When the dispatcher rejects the motions of a client, like a client that used its quota, they stay queued and
+        the motions of the other clients go ahead of them until the client is retried.
+    """
+
+    def __init__(self, depth, logger):
+        """
+            Parameters
+            ----------
+            depth : int
+                The number of motions accepted ahead of the running ones.
+            logger : Logger
+                Logs the failures of the runner.
+        """
+        self._depth = depth
+        self._logger = logger
+        self._items = deque()
+        self._condition = threading.Condition()
+        self._runner = None
+        # The clients rejected by the dispatcher, with the time they are retried at.
+        self._deferred = {}
+        self._queued = 0
+        self._taken = 0
+        self._flushed = 0
+        self._rejected = 0
+        self._batches = 0
+        self._failed = 0
+
+    def start(self, runner):
+        """
+            Start the worker thread.
+
+            Parameters
+            ----------
+            runner : callable
+                Takes the client of the first queued motion and runs the queued motions of that client.
+        """
+        self._runner = runner
+        threading.Thread(target=self.__work, name="motion-pipeline", daemon=True).start()
+
+    def submit(self, step, client=None, correlation_id=None):
+        """
+            Queue a motion.
+
+            Parameters
+            ----------
+            step : dict
+                The motion, a movej or movel sequence step.
+            client : str, optional
+                The client the robot time is charged to. Default is the anonymous client.
+            correlation_id : str, optional
+                The correlation ID of the request of the motion.
+
+            Returns
+            -------
+            dict
+                The position of the motion in the queue, 0 being the next one, and the depth of the queue.
+
+            Raises
+            ------
+            MotionRejectedError
+                If the queue is full.
+        """
+        with self._condition:
+            if len(self._items) >= self._depth:
+                self._rejected += 1
+                raise MotionRejectedError(f"The motion pipeline is full with {len(self._items)} motions", 1)
+            self._items.append(_Item(step, DEFAULT_CLIENT if client is None else client, correlation_id))
+            self._queued += 1
+            self._condition.notify()
+            return {"position": len(self._items) - 1, "depth": self._depth}
+
+    def take(self, client):
+        """
+            Take the next motions of a client, up to the first motion of another client. Only the motions of the
+            deferred clients are passed over.
+
+            Returns
+            -------
+            list
+                The taken motions, empty if the next motion belongs to another client or the queue is empty.
+        """
+        with self._condition:
+            self.__expire_deferrals(time.monotonic())
+            index = 0
+            while index < len(self._items) and self._items[index].client != client \
+                    and self._items[index].client in self._deferred:
+                index += 1
+            items = []
+            while index < len(self._items) and self._items[index].client == client:
+                items.append(self._items[index])
+                del self._items[index]
+            self._taken += len(items)
+            self._batches += 1 if items else 0
+            return items
+
+    def flush(self):
+        """
+            Drop the queued motions.
+
+            Returns
+            -------
+            list
+                The dropped motions.
+        """
+        with self._condition:
+            items = list(self._items)
+            self._items.clear()
+            self._flushed += len(items)
+            return items
+
+    def get_stats(self):
+        """
+            Get the number of queued motions and the counters of the pipeline.
+        """
+        with self._condition:
+            return {
+                "queued": len(self._items),
+                "depth": self._depth,
+                "accepted": self._queued,
+                "started": self._taken,
+                "batches": self._batches,
+                "flushed": self._flushed,
+                "rejected": self._rejected,
+                "failed": self._failed,
+                "deferred": sorted(self._deferred)
+            }
+
+    def __work(self):
+        while True:
+            with self._condition:
+                client = self.__next_client()
+                while client is None:
+                    self._condition.wait(self.__next_retry())
+                    client = self.__next_client()
+            try:
+                self._runner(client)
+            except MotionRejectedError as e:
+                # The queue of the dispatcher is full or this client used its quota, its motions stay queued and
+                # the other clients go ahead meanwhile.
+                with self._condition:
+                    self._deferred[client] = time.monotonic() + min(e.retry_after, MAX_RETRY_WAIT)
+            except MotionCancelledError as e:
+                self._logger.info(f"Pipelined motions stopped: {e}")
+            except Exception as e:
+                with self._condition:
+                    self._failed += 1
+                self._logger.error(f"Pipelined motions failed: {e}")
+
+    def __next_client(self):
+        self.__expire_deferrals(time.monotonic())
+        return next((item.client for item in self._items if item.client not in self._deferred), None)
+
+    def __next_retry(self):
+        if not self._deferred:
+            return None
+        return max(min(self._deferred.values()) - time.monotonic(), 0.0)
+
+    def __expire_deferrals(self, now):
+        for client in [client for client, retry_at in self._deferred.items() if retry_at <= now]:
+            del self._deferred[client]
+
+
+class IdleTracker:
+    """
+        Measures the idle time of the robot between motions, from the end of a motion to the start of the next one.
+
+        Gaps longer than the horizon are the robot having nothing to do rather than waiting for its next motion,
+        they are counted apart and left out of the statistics.
+    """
+
+    def __init__(self, horizon):
+        """
+            Parameters
+            ----------
+            horizon : float
+                The longest gap in seconds counted as idle time.
+        """
+        self._horizon = horizon
+        self._gaps = deque(maxlen=GAPS_KEPT)
+        self._lock = threading.Lock()
+        self._finished_at = None
+        self._count = 0
+        self._total = 0.0
+        self._unused = 0
+
+    def start(self, timestamp):
+        """
+            Record the start of a motion.
+        """
+        with self._lock:
+            if self._finished_at is None:
+                return
+            gap = max(timestamp - self._finished_at, 0.0)
+            self._finished_at = None
+            if gap > self._horizon:
+                self._unused += 1
+                return
+            self._gaps.append(gap)
+            self._count += 1
+            self._total += gap
+
+    def finish(self, timestamp):
+        """
+            Record the end of a motion.
+        """
+        with self._lock:
+            self._finished_at = timestamp
+
+    def reset(self):
+        """
+            Forget the end of the last motion, after a stop, so the gap to the next motion is not counted.
+        """
+        with self._lock:
+            self._finished_at = None
+
+    def get_stats(self):
+        """
+            Get the number of gaps, their total and mean in seconds and the percentiles of the last ones.
+        """
+        with self._lock:
+            gaps = np.asarray(self._gaps, dtype=float)
+            stats = {
+                "gaps": self._count,
+                "total": self._total,
+                "mean": self._total / self._count if self._count else 0.0,
+                "horizon": self._horizon,
+                "unused": self._unused
+            }
+        for name, percentile in (("p50", 50), ("p99", 99)):
+            stats[name] = float(np.percentile(gaps, percentile)) if len(gaps) else None
+        stats["max"] = float(gaps.max()) if len(gaps) else None
+        return stats
+
+
+def assign_blends(steps, start_pose, radius):
+    """
+        Set the blend radius of the arm steps of a batch, so the robot goes through a target without stopping when
+        the next step follows it.
+
+        Only consecutive movel steps with pose targets are blended, the radius being limited to 40% of the
+        segments on either side of the target so that blends never overlap. The last step stops at its target.
+
+        Parameters
+        ----------
+        steps : list
+            The movej and movel steps.
+        start_pose : list
+            The pose of the robot before the first step.
+        radius : float
+            The blend radius in meters.
+
+        Returns
+        -------
+        list
+            The steps, with a blend radius for each blended one.
+    """
+    steps = [dict(step) for step in steps]
+    previous = np.asarray(start_pose, dtype=float)[:3]
+    for step, following in zip(steps, steps[1:] + [None]):
+        blendable = step["type"] == "movel" and step.get("pose_object", True)
+        position = np.asarray(step["coordinates_and_angles"], dtype=float)[:3] if blendable else None
+        if blendable and radius > 0 and not np.isnan(previous).any() and following is not None \
+                and following["type"] == "movel" and following.get("pose_object", True):
+            after = np.asarray(following["coordinates_and_angles"], dtype=float)[:3]
+            blend = min(radius, 0.4 * float(np.linalg.norm(position - previous)),
+                        0.4 * float(np.linalg.norm(after - position)))
+            if blend > 0:
+                step["blend"] = blend
+        # A movej or joint target leaves the tool position unknown without kinematics, it is never blended into.
+        previous = position if blendable else np.full(3, np.nan)
+    return steps
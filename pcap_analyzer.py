@@ -0,0 +1,710 @@
+"""
+Offline analyzer of the latency between the URScript commands sent to a robot and the program runs they cause.
+
+Reads captures of the traffic between the API and the robot on the robot ports (30001 to 30004), reassembles the TCP
+streams and matches every URScript command sent on 30001, 30002 or 30003 to the next start and end of a program
+reported by the robot: the isProgramRunning flag of the robot state messages of 30001 and 30002, or the runtime state
+of an RTDE output recipe on 30004. Captures are read packet by packet, so their size is not limited by the memory.
+
+Usage: python pcap_analyzer.py capture.pcap [capture.pcap ...] [--json]
+"""
+import argparse
+import ipaddress
+import re
+import struct
+import sys
+from collections import deque
+
+import numpy as np
+from scapy.utils import RawPcapReader
+
+from codec import dumps
+
+ROBOT_PORTS = (30001, 30002, 30003, 30004)
+# Ports the robot runs the URScript received on.
+SCRIPT_PORTS = (30001, 30002, 30003)
+# Ports the robot sends its state on, with the priority of the state: RTDE samples the state much more often.
+STATE_PORTS = {30001: 1, 30002: 1, 30004: 2}
+RTDE_PORT = 30004
+# Seconds after which a command that did not start a program is counted as unmatched.
+COMMAND_TIMEOUT = 10.0
+# Out of order segments kept per direction before the missing one is considered lost by the capture.
+MAX_PENDING_SEGMENTS = 256
+# Longest URScript line, longer ones are binary data sent to a script port.
+MAX_LINE = 1 << 20
+HISTOGRAM_WIDTH = 40
+
+SEQUENCE_MASK = 0xFFFFFFFF
+FIN, SYN, RST = 0x01, 0x02, 0x04
+
+DLT_NULL, DLT_EN10MB, DLT_RAW, DLT_LOOP, DLT_LINUX_SLL, DLT_LINUX_SLL2 = 0, 1, 101, 108, 113, 276
+RAW_LINKTYPES = {DLT_RAW, 12, 14, 228, 229}
+ETHERTYPE_IPV4, ETHERTYPE_IPV6, ETHERTYPE_VLAN = 0x0800, 0x86DD, (0x8100, 0x88A8)
+
+# Primary and secondary client interface, message header: length and type.
+MESSAGE_ROBOT_STATE = 16
+MESSAGE_TYPES = {MESSAGE_ROBOT_STATE, 20, 25}
+PACKAGE_ROBOT_MODE = 0
+# Offset of isProgramRunning in the robot mode data package: length, type, timestamp and five flags before it.
+PROGRAM_RUNNING_OFFSET = 18
+MAX_MESSAGE = 1 << 16
+
+RTDE_VERSION, RTDE_SETUP_OUTPUTS, RTDE_DATA = ord("V"), ord("O"), ord("U")
+RTDE_SIZES = {"BOOL": 1, "UINT8": 1, "UINT32": 4, "INT32": 4, "UINT64": 8, "DOUBLE": 8, "VECTOR3D": 24,
+              "VECTOR6D": 48, "VECTOR6INT32": 24, "VECTOR6UINT32": 24}
+# Runtime states of a program that runs, from playing to resuming: stopping and stopped end it.
+RTDE_RUNNING_STATES = (2, 3, 4, 5)
+
+BLOCK_OPENER = re.compile(rb"^(def|sec|thread|if|while)\b.*:$")
+BLOCK_NAME = re.compile(rb"^(?:def|sec)\s+(\w+)")
+CALL_NAME = re.compile(rb"^(\w+)")
+
+
+def read_segments(path):
+    """
+        Read the TCP segments of a capture, one at a time.
+
+        Parameters
+        ----------
+        path : str
+            A pcap or pcapng file.
+
+        Yields
+        ------
+        tuple
+            The timestamp, source address, source port, destination address, destination port, sequence number, flags
+            and payload of every TCP segment over IPv4 or IPv6.
+    """
+    reader = RawPcapReader(path)
+    try:
+        nano = getattr(reader, "nano", False)
+        for data, metadata in reader:
+            if hasattr(metadata, "tshigh"):
+                timestamp = ((metadata.tshigh << 32) | metadata.tslow) / metadata.tsresol
+                linktype = metadata.linktype
+            else:
+                timestamp = metadata.sec + metadata.usec / (1e9 if nano else 1e6)
+                linktype = reader.linktype
+            segment = _parse_packet(linktype, data)
+            if segment is not None:
+                yield (timestamp,) + segment
+    finally:
+        reader.close()
+
+
+def _parse_packet(linktype, data):
+    try:
+        if linktype == DLT_EN10MB:
+            ethertype, = struct.unpack_from("!H", data, 12)
+            offset = 14
+            while ethertype in ETHERTYPE_VLAN:
+                ethertype, = struct.unpack_from("!H", data, offset + 2)
+                offset += 4
+        elif linktype == DLT_LINUX_SLL:
+            ethertype, = struct.unpack_from("!H", data, 14)
+            offset = 16
+        elif linktype == DLT_LINUX_SLL2:
+            ethertype, = struct.unpack_from("!H", data, 0)
+            offset = 20
+        elif linktype in (DLT_NULL, DLT_LOOP) or linktype in RAW_LINKTYPES:
+            offset = 4 if linktype in (DLT_NULL, DLT_LOOP) else 0
+            ethertype = {4: ETHERTYPE_IPV4, 6: ETHERTYPE_IPV6}.get(data[offset] >> 4)
+        else:
+            return None
+        if ethertype == ETHERTYPE_IPV4:
+            header = (data[offset] & 0x0F) * 4
+            total, = struct.unpack_from("!H", data, offset + 2)
+            if data[offset + 9] != 6 or struct.unpack_from("!H", data, offset + 6)[0] & 0x1FFF:
+                return None
+            source, destination = data[offset + 12:offset + 16], data[offset + 16:offset + 20]
+            end = offset + total
+            offset += header
+        elif ethertype == ETHERTYPE_IPV6:
+            length, = struct.unpack_from("!H", data, offset + 4)
+            if data[offset + 6] != 6:
+                return None
+            source, destination = data[offset + 8:offset + 24], data[offset + 24:offset + 40]
+            end = offset + 40 + length
+            offset += 40
+        else:
+            return None
+        source_port, destination_port, sequence = struct.unpack_from("!HHI", data, offset)
+        header = (data[offset + 12] >> 4) * 4
+        flags = data[offset + 13]
+        # The end from the IP header excludes the Ethernet padding of short frames.
+        return source, source_port, destination, destination_port, sequence, flags, data[offset + header:end]
+    except (IndexError, struct.error):
+        return None
+
+
+class _Flow:
+    """
+        Reassembles one direction of a TCP connection and hands the bytes in order to a parser.
+    """
+
+    __slots__ = ("parser", "next_sequence", "pending", "bytes", "gaps", "closed")
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.next_sequence = None
+        self.pending = {}
+        self.bytes = 0
+        self.gaps = 0
+        self.closed = False
+
+    def feed(self, timestamp, sequence, flags, payload):
+        if flags & SYN:
+            self.next_sequence = (sequence + 1) & SEQUENCE_MASK
+            return
+        if flags & (FIN | RST):
+            self.closed = True
+        if not payload:
+            return
+        if self.next_sequence is None:
+            # The capture started after the connection.
+            self.next_sequence = sequence
+        delta = (sequence - self.next_sequence) & SEQUENCE_MASK
+        if delta & 0x80000000:
+            # A retransmission, of which only the part after the delivered bytes is new.
+            overlap = (self.next_sequence - sequence) & SEQUENCE_MASK
+            if overlap >= len(payload):
+                return
+            payload = payload[overlap:]
+        elif delta:
+            self.pending.setdefault(sequence, payload)
+            if len(self.pending) > MAX_PENDING_SEGMENTS:
+                self.__skip_gap(timestamp)
+            return
+        self.__deliver(timestamp, payload)
+        self.__drain(timestamp)
+
+    def __deliver(self, timestamp, payload):
+        self.next_sequence = (self.next_sequence + len(payload)) & SEQUENCE_MASK
+        self.bytes += len(payload)
+        if self.parser is not None:
+            self.parser.feed(timestamp, payload)
+
+    def __drain(self, timestamp):
+        while self.pending:
+            payload = self.pending.pop(self.next_sequence, None)
+            if payload is None:
+                return
+            self.__deliver(timestamp, payload)
+
+    def __skip_gap(self, timestamp):
+        # The capture lost a segment: resume at the first segment after the hole.
+        self.next_sequence = min(self.pending, key=lambda sequence: (sequence - self.next_sequence) & SEQUENCE_MASK)
+        self.gaps += 1
+        if self.parser is not None:
+            self.parser.gap()
+        self.__drain(timestamp)
+
+
+class UrScriptParser:
+    """
+        Splits the URScript sent to a robot into commands: single lines like movel(...), or programs from def or sec
+        to their end. A command is sent when its last byte is.
+    """
+
+    def __init__(self, on_command):
+        self._on_command = on_command
+        self._buffer = bytearray()
+        self._depth = 0
+        self._name = None
+        self._size = 0
+
+    def feed(self, timestamp, data):
+        self._buffer += data
+        start = 0
+        while True:
+            end = self._buffer.find(b"\n", start)
+            if end < 0:
+                break
+            self.__line(timestamp, bytes(self._buffer[start:end]))
+            start = end + 1
+        del self._buffer[:start]
+        if len(self._buffer) > MAX_LINE:
+            self.gap()
+
+    def gap(self):
+        self._buffer.clear()
+        self._depth = 0
+        self._name = None
+
+    def __line(self, timestamp, line):
+        self._size += len(line) + 1
+        line = line.strip()
+        if not line or line.startswith(b"#"):
+            if self._depth == 0:
+                self._size = 0
+            return
+        if BLOCK_OPENER.match(line):
+            if self._depth == 0:
+                match = BLOCK_NAME.match(line)
+                self._name = (match.group(1) if match else line.split()[0]).decode("latin-1")
+            self._depth += 1
+            return
+        if self._depth > 0:
+            if line == b"end" or line.startswith(b"end ") or line.startswith(b"end#"):
+                self._depth -= 1
+                if self._depth == 0:
+                    self._on_command(timestamp, self._name, self._size)
+                    self._size = 0
+            return
+        match = CALL_NAME.match(line)
+        self._on_command(timestamp, match.group(1).decode("latin-1") if match else "unknown", self._size)
+        self._size = 0
+
+
+class PrimaryStateParser:
+    """
+        Reads whether a program runs from the robot state messages of the primary and secondary interfaces.
+    """
+
+    def __init__(self, on_state):
+        self._on_state = on_state
+        self._buffer = bytearray()
+        self.resyncs = 0
+
+    def feed(self, timestamp, data):
+        buffer = self._buffer
+        buffer += data
+        offset = 0
+        while len(buffer) - offset >= 5:
+            length, kind = struct.unpack_from("!iB", buffer, offset)
+            if length < 5 or length > MAX_MESSAGE or kind not in MESSAGE_TYPES:
+                # Not at a message boundary, after a gap or at the start of the capture.
+                offset += 1
+                self.resyncs += 1
+                continue
+            if len(buffer) - offset < length:
+                break
+            if kind == MESSAGE_ROBOT_STATE:
+                self.__robot_state(timestamp, buffer, offset + 5, offset + length)
+            offset += length
+        del buffer[:offset]
+
+    def gap(self):
+        self._buffer.clear()
+
+    def __robot_state(self, timestamp, buffer, offset, end):
+        while offset + 5 <= end:
+            length, kind = struct.unpack_from("!iB", buffer, offset)
+            if length < 5:
+                return
+            if kind == PACKAGE_ROBOT_MODE and length > PROGRAM_RUNNING_OFFSET:
+                self._on_state(timestamp, buffer[offset + PROGRAM_RUNNING_OFFSET] != 0)
+                return
+            offset += length
+
+
+class RtdeSession:
+    """
+        Reads the runtime state of the program from the RTDE output recipes that include runtime_state, pairing the
+        recipes the client sets up with the types the robot answers.
+    """
+
+    def __init__(self, on_state):
+        self._on_state = on_state
+        self._version = 2
+        self._requested = deque()
+        self._recipes = {}
+        self.client = _RtdeDirection(self.__client_message)
+        self.robot = _RtdeDirection(self.__robot_message)
+
+    def __client_message(self, timestamp, kind, payload):
+        if kind == RTDE_VERSION and len(payload) >= 2:
+            self._version, = struct.unpack_from("!H", payload)
+        elif kind == RTDE_SETUP_OUTPUTS:
+            names = payload[8:] if self._version >= 2 else payload
+            self._requested.append(bytes(names).decode("latin-1").split(","))
+
+    def __robot_message(self, timestamp, kind, payload):
+        if kind == RTDE_SETUP_OUTPUTS and self._requested:
+            names = self._requested.popleft()
+            if self._version >= 2:
+                recipe, types = payload[0], payload[1:]
+            else:
+                recipe, types = None, payload
+            types = bytes(types).decode("latin-1").split(",")
+            if "runtime_state" not in names or len(types) != len(names) or \
+                    any(name not in RTDE_SIZES for name in types):
+                return
+            index = names.index("runtime_state")
+            self._recipes[recipe] = sum(RTDE_SIZES[name] for name in types[:index])
+        elif kind == RTDE_DATA:
+            recipe, offset = (payload[0], 1) if self._version >= 2 else (None, 0)
+            position = self._recipes.get(recipe)
+            if position is not None and len(payload) >= offset + position + 4:
+                state, = struct.unpack_from("!I", payload, offset + position)
+                self._on_state(timestamp, state in RTDE_RUNNING_STATES)
+
+
+class _RtdeDirection:
+
+    def __init__(self, on_message):
+        self._on_message = on_message
+        self._buffer = bytearray()
+
+    def feed(self, timestamp, data):
+        buffer = self._buffer
+        buffer += data
+        offset = 0
+        while len(buffer) - offset >= 3:
+            size, kind = struct.unpack_from("!HB", buffer, offset)
+            if size < 3:
+                offset += 1
+                continue
+            if len(buffer) - offset < size:
+                break
+            self._on_message(timestamp, kind, bytes(buffer[offset + 3:offset + size]))
+            offset += size
+        del buffer[:offset]
+
+    def gap(self):
+        self._buffer.clear()
+
+
+class _Command:
+    __slots__ = ("sent_at", "kind", "size", "started_at", "interrupted")
+
+    def __init__(self, sent_at, kind, size):
+        self.sent_at = sent_at
+        self.kind = kind
+        self.size = size
+        self.started_at = None
+        self.interrupted = False
+
+
+class _Robot:
+
+    def __init__(self, address):
+        self.address = address
+        self.source = None
+        self.source_priority = 0
+        self.running = None
+        self.pending = deque()
+        self.current = None
+        self.state_samples = 0
+        self.first_state = None
+        self.last_state = None
+        self.counts = {"commands": 0, "completed": 0, "replaced": 0, "interrupted": 0, "unmatched": 0,
+                       "incomplete": 0, "unattributed_programs": 0}
+        self.latencies = {"command_to_start": [], "start_to_end": [], "command_to_end": []}
+        self.kinds = {}
+
+
+class _Connection:
+    __slots__ = ("robot", "port", "to_robot", "to_client")
+
+    def __init__(self, robot, port, to_robot, to_client):
+        self.robot = robot
+        self.port = port
+        self.to_robot = to_robot
+        self.to_client = to_client
+
+
+class PcapAnalyzer:
+    """
+        Matches the commands sent to the robots of a capture to the program runs that follow them.
+
+        A program start is matched to the last command sent before it: the robot replaces the program it was about
+        to run by a newer one, and the older commands are counted as replaced. A program is matched to its end,
+        unless a command interrupted it, in which case it is counted as interrupted and left out of the durations.
+        The start and end of a program are only seen at the rate the robot sends its state, 10 Hz on 30001 and 30002
+        and the recipe frequency on 30004, so programs shorter than a state period can go unseen and their commands
+        count as unmatched.
+    """
+
+    def __init__(self, ports=ROBOT_PORTS, command_timeout=COMMAND_TIMEOUT):
+        self._ports = set(ports)
+        self._command_timeout = command_timeout
+        self._robots = {}
+        self._connections = {}
+        self._port_stats = {}
+        self.packets = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def analyze(self, path):
+        """
+            Add the TCP segments of a capture, captures split in several files are added in order.
+        """
+        for segment in read_segments(path):
+            self.feed(*segment)
+
+    def feed(self, timestamp, source, source_port, destination, destination_port, sequence, flags, payload):
+        """
+            Add a TCP segment.
+        """
+        if destination_port in self._ports:
+            key, to_robot = (destination, destination_port, source, source_port), True
+        elif source_port in self._ports:
+            key, to_robot = (source, source_port, destination, destination_port), False
+        else:
+            return
+        self.packets += 1
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+        connection = self._connections.get(key)
+        if connection is None:
+            connection = self._connections[key] = self.__connect(key)
+        flow = connection.to_robot if to_robot else connection.to_client
+        flow.feed(timestamp, sequence, flags, payload)
+        if flags & RST or (connection.to_robot.closed and connection.to_client.closed):
+            self.__disconnect(key, connection)
+
+    def __connect(self, key):
+        address, port = key[0], key[1]
+        robot = self._robots.get(address)
+        if robot is None:
+            robot = self._robots[address] = _Robot(address)
+        stats = self._port_stats.setdefault(port, {"connections": 0, "to_robot_bytes": 0, "to_client_bytes": 0,
+                                                   "gaps": 0})
+        stats["connections"] += 1
+        connection = _Connection(robot, port, None, None)
+        to_robot_parser = to_client_parser = None
+        if port in SCRIPT_PORTS:
+            to_robot_parser = UrScriptParser(
+                lambda timestamp, kind, size: self.__on_command(robot, timestamp, kind, size))
+        if port == RTDE_PORT:
+            session = RtdeSession(lambda timestamp, running: self.__on_state(connection, timestamp, running))
+            to_robot_parser, to_client_parser = session.client, session.robot
+        elif port in STATE_PORTS:
+            to_client_parser = PrimaryStateParser(
+                lambda timestamp, running: self.__on_state(connection, timestamp, running))
+        connection.to_robot = _Flow(to_robot_parser)
+        connection.to_client = _Flow(to_client_parser)
+        return connection
+
+    def __disconnect(self, key, connection):
+        del self._connections[key]
+        stats = self._port_stats[connection.port]
+        for flow, name in ((connection.to_robot, "to_robot_bytes"), (connection.to_client, "to_client_bytes")):
+            stats[name] += flow.bytes
+            stats["gaps"] += flow.gaps + (1 if flow.pending else 0)
+        if connection.robot.source is connection:
+            connection.robot.source = None
+            connection.robot.source_priority = 0
+
+    def __on_command(self, robot, timestamp, kind, size):
+        robot.counts["commands"] += 1
+        self.__expire(robot, timestamp)
+        if robot.current is not None:
+            robot.current.interrupted = True
+        robot.pending.append(_Command(timestamp, kind, size))
+
+    def __expire(self, robot, now):
+        while robot.pending and now - robot.pending[0].sent_at > self._command_timeout:
+            robot.pending.popleft()
+            robot.counts["unmatched"] += 1
+
+    def __on_state(self, connection, timestamp, running):
+        robot = connection.robot
+        priority = STATE_PORTS[connection.port]
+        if robot.source is None or (robot.source is not connection and priority > robot.source_priority):
+            robot.source, robot.source_priority = connection, priority
+        if robot.source is not connection:
+            return
+        robot.state_samples += 1
+        if robot.first_state is None:
+            robot.first_state = timestamp
+        robot.last_state = timestamp
+        if robot.running is None or running == robot.running:
+            robot.running = running
+            return
+        robot.running = running
+        if running:
+            self.__on_start(robot, timestamp)
+        else:
+            self.__on_end(robot, timestamp)
+
+    def __on_start(self, robot, timestamp):
+        self.__expire(robot, timestamp)
+        if not robot.pending:
+            robot.counts["unattributed_programs"] += 1
+            robot.current = None
+            return
+        command = robot.pending.pop()
+        robot.counts["replaced"] += len(robot.pending)
+        robot.pending.clear()
+        command.started_at = timestamp
+        robot.current = command
+        latency = timestamp - command.sent_at
+        robot.latencies["command_to_start"].append(latency)
+        self.__kind(robot, command.kind)["command_to_start"].append(latency)
+
+    def __on_end(self, robot, timestamp):
+        command, robot.current = robot.current, None
+        if command is None:
+            return
+        if command.interrupted:
+            robot.counts["interrupted"] += 1
+            return
+        robot.counts["completed"] += 1
+        robot.latencies["start_to_end"].append(timestamp - command.started_at)
+        robot.latencies["command_to_end"].append(timestamp - command.sent_at)
+        self.__kind(robot, command.kind)["start_to_end"].append(timestamp - command.started_at)
+
+    @staticmethod
+    def __kind(robot, kind):
+        stats = robot.kinds.get(kind)
+        if stats is None:
+            stats = robot.kinds[kind] = {"command_to_start": [], "start_to_end": []}
+        return stats
+
+    def get_report(self):
+        """
+            Get the latency and throughput report, once every segment is added. The commands still waiting for a
+            program are counted as unmatched, and the programs still running as incomplete.
+
+            Returns
+            -------
+            dict
+                The capture duration and packets, the bytes per robot port, and for every robot the command counts,
+                the state sample rate, the latency statistics and histograms of command to program start, program
+                start to end and command to end in seconds, and the latencies per command kind.
+        """
+        for key, connection in list(self._connections.items()):
+            self.__disconnect(key, connection)
+        duration = (self.last_timestamp - self.first_timestamp) if self.packets else 0.0
+        robots = {}
+        for robot in self._robots.values():
+            robot.counts["unmatched"] += len(robot.pending)
+            robot.pending.clear()
+            if robot.current is not None:
+                robot.counts["incomplete"] += 1
+                robot.current = None
+            state_period = (robot.last_state - robot.first_state) if robot.state_samples > 1 else 0.0
+            robots[str(ipaddress.ip_address(robot.address))] = {
+                **robot.counts,
+                "commands_per_second": robot.counts["commands"] / duration if duration else None,
+                "programs_per_second": robot.counts["completed"] / duration if duration else None,
+                "state_rate": (robot.state_samples - 1) / state_period if state_period else None,
+                "latency": {name: summarize(values) for name, values in robot.latencies.items()},
+                "histograms": {name: histogram(values) for name, values in robot.latencies.items()},
+                "kinds": {kind: {"count": len(stats["command_to_start"]),
+                                 "command_to_start": summarize(stats["command_to_start"]),
+                                 "start_to_end": summarize(stats["start_to_end"])}
+                          for kind, stats in sorted(robot.kinds.items())}
+            }
+        return {
+            "capture": {"packets": self.packets, "start": self.first_timestamp, "end": self.last_timestamp,
+                        "duration": duration},
+            "ports": {str(port): {**stats,
+                             "to_robot_bytes_per_second": stats["to_robot_bytes"] / duration if duration else None,
+                             "to_client_bytes_per_second": stats["to_client_bytes"] / duration if duration else None}
+                      for port, stats in sorted(self._port_stats.items())},
+            "robots": robots
+        }
+
+
+def summarize(values):
+    """
+        Get the count, mean, median, 90th and 99th percentiles and maximum of latencies in seconds.
+    """
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p90": None, "p99": None, "max": None}
+    values = np.asarray(values)
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {"count": len(values), "mean": float(values.mean()), "p50": float(p50), "p90": float(p90),
+            "p99": float(p99), "max": float(values.max())}
+
+
+def histogram(values):
+    """
+        Count latencies in buckets doubling from 1 ms, from the first bucket holding a latency.
+
+        Returns
+        -------
+        dict
+            The upper edges of the buckets in milliseconds and the number of latencies in each.
+    """
+    if not values:
+        return {"edges_ms": [], "counts": []}
+    milliseconds = np.asarray(values) * 1000
+    top = max(int(np.ceil(np.log2(max(milliseconds.max(), 1)))), 0)
+    edges = np.concatenate(([-np.inf], 2.0 ** np.arange(0, top + 1)))
+    counts, _ = np.histogram(milliseconds, bins=edges)
+    first = int(np.argmax(counts > 0))
+    return {"edges_ms": edges[first + 1:].tolist(), "counts": counts[first:].tolist()}
+
+
+def format_report(report):
+    """
+        Format a report as text, with a bar chart per latency histogram.
+    """
+    capture = report["capture"]
+    lines = [f"{capture['packets']} packets over {capture['duration']:.1f} s", ""]
+    lines.append(f"{'port':<8}{'connections':>12}{'to robot (B/s)':>16}{'to client (B/s)':>17}{'gaps':>6}")
+    for port, stats in report["ports"].items():
+        lines.append(f"{port:<8}{stats['connections']:>12}{stats['to_robot_bytes_per_second'] or 0:>16.0f}"
+                     f"{stats['to_client_bytes_per_second'] or 0:>17.0f}{stats['gaps']:>6}")
+    for address, robot in report["robots"].items():
+        lines += ["", f"Robot {address}"]
+        lines.append(", ".join(f"{name.replace('_', ' ')}: {robot[name]}" for name in
+                               ("commands", "completed", "replaced", "interrupted", "unmatched", "incomplete",
+                                "unattributed_programs")))
+        rates = [f"{robot['commands_per_second'] or 0:.2f} commands/s",
+                 f"{robot['programs_per_second'] or 0:.2f} programs/s"]
+        if robot["state_rate"] is not None:
+            rates.append(f"state sampled at {robot['state_rate']:.0f} Hz")
+        lines.append(", ".join(rates))
+        lines.append(f"{'':<24}{'count':>7}{'mean (ms)':>11}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+        for name, stats in robot["latency"].items():
+            lines.append(_format_stats(name.replace("_", " "), stats))
+        for name, buckets in robot["histograms"].items():
+            if buckets["counts"]:
+                lines += ["", name.replace("_", " ")] + _format_histogram(buckets)
+        if robot["kinds"]:
+            lines += ["", "per command kind, command to start and program duration"]
+            for kind, stats in robot["kinds"].items():
+                lines.append(_format_stats(f"{kind} start", stats["command_to_start"]))
+                lines.append(_format_stats(f"{kind} duration", stats["start_to_end"]))
+    return "\n".join(lines)
+
+
+def _format_stats(name, stats):
+    if not stats["count"]:
+        return f"{name:<24}{0:>7}"
+    return (f"{name:<24}{stats['count']:>7}{stats['mean'] * 1000:>11.1f}{stats['p50'] * 1000:>9.1f}"
+            f"{stats['p90'] * 1000:>9.1f}{stats['p99'] * 1000:>9.1f}{stats['max'] * 1000:>9.1f}")
+
+
+def _format_histogram(buckets):
+    peak = max(buckets["counts"]) or 1
+    return [f"  <= {edge:>7.0f} ms {count:>7} {'#' * round(HISTOGRAM_WIDTH * count / peak)}"
+            for edge, count in zip(buckets["edges_ms"], buckets["counts"])]
+
+
+def parse_ports(value):
+    ports = []
+    for item in value.split(","):
+        first, _, last = item.partition("-")
+        ports.extend(range(int(first), int(last or first) + 1))
+    return ports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("captures", nargs="+", help="pcap or pcapng files, in capture order")
+    parser.add_argument("--ports", type=parse_ports, default=ROBOT_PORTS,
+                        help="robot ports, as 30001-30004 or 30002,30004")
+    parser.add_argument("--timeout", type=float, default=COMMAND_TIMEOUT,
+                        help="seconds after which a command that did not start a program is unmatched")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    analyzer = PcapAnalyzer(ports=args.ports, command_timeout=args.timeout)
+    for path in args.captures:
+        analyzer.analyze(path)
+    report = analyzer.get_report()
+    if args.json:
+        sys.stdout.write(dumps(report).decode("utf-8") + "\n")
+    else:
+        print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
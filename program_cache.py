@@ -0,0 +1,183 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sequence import ARM_STEPS, OFFSET_PARAMETER, SPEED_PARAMETER
+
+PROGRAM_HEADER = b"def cachedProg():\n"
+
+
+class ProgramNotFoundError(Exception):
+    """
+        Raised when a program is not registered, or was evicted from the cache.
+    """
+
+
+class CachedProgram:
+    """
+        A validated sequence with its pre-encoded parameterized program body.
+
+        Invoking it only prepends the assignment of its offset and speed parameters to the stored body.
+    """
+
+    __slots__ = ("name", "steps", "body", "envelope", "path_estimate", "gripper_steps", "registered_at",
+                 "invocations")
+
+    def __init__(self, name, steps, body, envelope, path_estimate):
+        """
+            Parameters
+            ----------
+            name : str
+                The name the program is invoked by.
+            steps : list
+                The steps of the program, with their acceleration and velocity resolved.
+            body : bytes
+                The encoded parameterized program body.
+            envelope : dict
+                The envelope of the steps used to check the parameters of an invocation.
+            path_estimate : float or None
+                The estimated duration of the program after its first arm step, at the registered speed.
+        """
+        self.name = name
+        self.steps = steps
+        self.body = body
+        self.envelope = envelope
+        self.path_estimate = path_estimate
+        self.gripper_steps = sum(1 for step in steps if step["type"] == "gripper")
+        self.registered_at = time.time()
+        self.invocations = 0
+
+    def encode(self, offset, speed):
+        """
+            Encode an invocation of the program.
+
+            Parameters
+            ----------
+            offset : list
+                The translation (x, y, z) in meters added to the pose targets.
+            speed : float
+                The factor the velocities are scaled by.
+
+            Returns
+            -------
+            bytes
+                The program to send to the robot.
+        """
+        parameters = (f"  {OFFSET_PARAMETER} = p[{float(offset[0])}, {float(offset[1])}, {float(offset[2])}, "
+                      f"0.0, 0.0, 0.0]\n  {SPEED_PARAMETER} = {float(speed)}\n")
+        return PROGRAM_HEADER + parameters.encode("utf-8") + self.body
+
+    def get_approach_step(self, offset):
+        """
+            Get the first arm step of the program shifted by an offset, or None if the program does not move the arm.
+        """
+        for step in self.steps:
+            if step["type"] not in ARM_STEPS:
+                continue
+            if not step.get("pose_object", True):
+                return step
+            key = "joint_positions" if step["type"] == "movej" else "coordinates_and_angles"
+            target = step[key]
+            return {**step, key: [target[0] + offset[0], target[1] + offset[1], target[2] + offset[2], *target[3:]]}
+        return None
+
+    def describe(self):
+        """
+            Describe the program without its body.
+        """
+        return {
+            "name": self.name,
+            "steps": len(self.steps),
+            "size": len(self.body),
+            "registered_at": self.registered_at,
+            "invocations": self.invocations
+        }
+
+
+class ProgramCache:
+    """
+        A bounded least recently used cache of registered programs.
+
+        Registering a program beyond ``max_entries`` evicts the least recently registered or invoked one.
+    """
+
+    def __init__(self, max_entries=128):
+        self._max_entries = max_entries
+        self._programs = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def register(self, program):
+        """
+            Register a program, replacing any program with the same name.
+
+            Returns
+            -------
+            list
+                The names of the programs evicted to make room for it.
+        """
+        evicted = []
+        with self._lock:
+            self._programs.pop(program.name, None)
+            self._programs[program.name] = program
+            while len(self._programs) > self._max_entries:
+                name, _ = self._programs.popitem(last=False)
+                evicted.append(name)
+                self._evictions += 1
+        return evicted
+
+    def get(self, name):
+        """
+            Get a program to invoke it, marking it as recently used.
+
+            Raises
+            ------
+            ProgramNotFoundError
+                If no program is registered with this name.
+        """
+        with self._lock:
+            program = self._programs.get(name)
+            if program is None:
+                self._misses += 1
+                raise ProgramNotFoundError(f"Program {name} is not registered")
+            self._hits += 1
+            program.invocations += 1
+            self._programs.move_to_end(name)
+            return program
+
+    def delete(self, name):
+        """
+            Delete a program.
+
+            Raises
+            ------
+            ProgramNotFoundError
+                If no program is registered with this name.
+        """
+        with self._lock:
+            if self._programs.pop(name, None) is None:
+                raise ProgramNotFoundError(f"Program {name} is not registered")
+
+    def list_programs(self):
+        """
+            Describe the registered programs, from the least to the most recently used.
+        """
+        with self._lock:
+            return [program.describe() for program in self._programs.values()]
+
+    def get_stats(self):
+        """
+            Get the hit, miss and eviction counters of the cache.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "entries": len(self._programs),
+                "evictions": self._evictions,
+                "max_entries": self._max_entries
+            }
@@ -1,6 +1,9 @@
+import os
+import select
+import socket
+
 import socketio
 from dotenv import load_dotenv
-from scapy.all import *
 
 from logger import Logger
 
@@ -13,6 +16,7 @@ PROXY_HOST = os.getenv("PROXY_HOST")
 PROXY_PORT = int(os.getenv("PROXY_PORT"))
 WEBSOCKET_HOST = os.getenv("WEBSOCKET_HOST")
 WEBSOCKET_PORT = os.getenv("WEBSOCKET_PORT")
+BOT_NAME = os.getenv("BOT_NAME")
 
 logger = Logger("Proxy Server")
 
@@ -32,6 +36,7 @@ try:
 except OSError:
     logger.error(f"Failed to start proxy server at {PROXY_HOST}:{PROXY_PORT}")
     exit(1)
+logger.info(f"Proxy server listening at {PROXY_HOST}:{PROXY_PORT}")
 
 # Accept a connection from the http server
 http_conn, http_addr = proxy.accept()
@@ -73,11 +78,11 @@ logger.info(f"Proxy server successfully started at {PROXY_HOST}:{PROXY_PORT}")
 
 
 # Create a function to forward data from one socket to another
-def forward_data(src, dst):
+def forward_data(src, dst, topic):
     data = src.recv(1024)  # Receive up to 1024 bytes of data from the source socket
     if data:  # If there is any data
         logger.info(f"Forwarding from {src.getpeername()} to {dst.getpeername()} : {data}")
-        sio.send(data)
+        sio.emit("publish", {"topic": topic, "payload": data})  # Publish the raw bytes as a binary frame
         dst.send(data)  # Send the data to the destination socket
         return True  # Return True to indicate success
     else:  # If there is no data
@@ -94,11 +99,11 @@ while True:
     for sock in ready_sockets:  # For each socket that has data
         if sock == http_conn:  # If it is the http server socket
             # Forward data from the http server to the robot
-            if not forward_data(http_conn, robot_conn):
+            if not forward_data(http_conn, robot_conn, f"{BOT_NAME}/command"):
                 break  # Break the loop if the connection is closed
         elif sock == robot_conn:  # If it is the robot socket
             # Forward data from the robot to the http server
-            if not forward_data(robot_conn, http_conn):
+            if not forward_data(robot_conn, http_conn, f"{BOT_NAME}/state"):
                 break  # Break the loop if the connection is closed
 
 # Close the proxy socket
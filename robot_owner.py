@@ -0,0 +1,213 @@
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+from multiprocessing.managers import BaseManager
+
+from dotenv import load_dotenv
+
+from idempotency import IdempotencyCache
+from logger import Logger
+from program_cache import ProgramCache
+from urx_service import DefaultUrxEService, MockUrxEService
+
+load_dotenv()
+BOT_NAME = os.getenv("BOT_NAME")
+API_WORKERS = int(os.getenv("API_WORKERS", 1))
+WORKER_CHECK_INTERVAL = 1.0
+
+
+def get_address():
+    """
+        Get the address the robot owner listens on, a Unix socket or a named pipe on Windows.
+    """
+    address = os.getenv("ROBOT_OWNER_ADDRESS")
+    if address:
+        return address
+    if sys.platform == "win32":
+        return rf"\\.\pipe\{BOT_NAME}-robot-owner"
+    return os.path.join(tempfile.gettempdir(), f"{BOT_NAME}-robot-owner.sock")
+
+
+def create_shared_objects(logger):
+    """
+        Create the robot service and the caches that must be unique per robot.
+
+        Returns
+        -------
+        tuple
+            The robot service, the idempotency cache and the program cache.
+    """
+    if os.getenv("ENVIRONMENT") == "dev":
+        urx_service = MockUrxEService()
+    else:
+        urx_service = DefaultUrxEService(logger=logger)
+    idempotency_cache = IdempotencyCache(max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", 1024)),
+                                         ttl=float(os.getenv("IDEMPOTENCY_TTL", 600)),
+                                         lease=float(os.getenv("IDEMPOTENCY_LEASE", 300)))
+    program_cache = ProgramCache(max_entries=int(os.getenv("PROGRAM_CACHE_MAX_ENTRIES", 128)))
+    return urx_service, idempotency_cache, program_cache
+
+
+class RobotOwnerManager(BaseManager):
+    pass
+
+
+class ServiceEndpoint:
+    """
+        Runs the methods of the robot service for the workers and sends back the report they fill.
+    """
+
+    def __init__(self, service):
+        self._service = service
+
+    def call(self, name, args, kwargs):
+        if name.startswith("_"):
+            raise AttributeError(f"Method {name} is not public")
+        result = getattr(self._service, name)(*args, **kwargs)
+        return result, kwargs.get("report")
+
+
+class RemoteUrxEService:
+    """
+        Calls the robot service of the robot owner, with the same methods as the local service.
+
+        A report passed to a method is filled with the report of the remote call.
+    """
+
+    def __init__(self, endpoint):
+        self._endpoint = endpoint
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            report = kwargs.get("report")
+            result, remote_report = self._endpoint.call(name, args, kwargs)
+            if report is not None and remote_report:
+                report.update(remote_report)
+            return result
+
+        return call
+
+
+class RemoteIdempotencyCache(IdempotencyCache):
+    """
+        The idempotency cache of the robot owner. Requests execute in the worker, only their keys and responses are
+        stored by the robot owner, so a retry is detected whatever worker it reaches.
+    """
+
+    def __init__(self, cache):
+        self._cache = cache
+
+    def begin(self, key, fingerprint):
+        return self._cache.begin(key, fingerprint)
+
+    def complete(self, key, response):
+        self._cache.complete(key, response)
+
+    def abandon(self, key):
+        self._cache.abandon(key)
+
+    def get_stats(self):
+        return self._cache.get_stats()
+
+
+def connect(address):
+    """
+        Connect to the robot owner.
+
+        Returns
+        -------
+        tuple
+            The robot service, the idempotency cache and the program cache of the robot owner.
+    """
+    for name in ("urx_service", "idempotency_cache", "program_cache"):
+        RobotOwnerManager.register(name)
+    manager = RobotOwnerManager(address=address)
+    manager.connect()
+    return (RemoteUrxEService(manager.urx_service()), RemoteIdempotencyCache(manager.idempotency_cache()),
+            manager.program_cache())
+
+
+def run_worker(listener, address):
+    """
+        Serve the REST API on a socket shared with the other workers, backed by the robot owner.
+    """
+    os.environ["ROBOT_OWNER_ADDRESS"] = address
+    from waitress import serve
+
+    import main
+
+    serve(main.app, sockets=[listener])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hold the connection to the robot and serve the REST API from "
+                                                 "several worker processes.")
+    parser.add_argument("--workers", type=int, default=API_WORKERS, help="number of REST API worker processes")
+    args = parser.parse_args()
+    logger = Logger("Robot Owner")
+
+    # Binding the API port first fails fast if another stack already owns the robot.
+    listener = socket.create_server((os.getenv("FLASK_HOST"), int(os.getenv("FLASK_PORT"))))
+    address = get_address()
+    if sys.platform != "win32" and os.path.exists(address):
+        os.unlink(address)
+
+    try:
+        urx_service, idempotency_cache, program_cache = create_shared_objects(logger)
+    except Exception as e:
+        logger.error(f"Failed to initialize UrxEService: {e}")
+        exit(1)
+    endpoint = ServiceEndpoint(urx_service)
+    RobotOwnerManager.register("urx_service", callable=lambda: endpoint)
+    RobotOwnerManager.register("idempotency_cache", callable=lambda: idempotency_cache)
+    RobotOwnerManager.register("program_cache", callable=lambda: program_cache)
+    # The server listens from its creation, so the workers can connect before it serves.
+    server = RobotOwnerManager(address=address).get_server()
+    logger.info(f"Robot owner listening at {address}")
+
+    # Workers are spawned rather than forked, the robot owner already runs threads.
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    stopping = threading.Event()
+
+    def start_worker(index):
+        worker = context.Process(target=run_worker, args=(listener, address), name=f"api-worker-{index}", daemon=True)
+        worker.start()
+        return worker
+
+    def watch_workers():
+        while not stopping.wait(WORKER_CHECK_INTERVAL):
+            for index, worker in enumerate(workers):
+                if not worker.is_alive() and not stopping.is_set():
+                    logger.error(f"Worker {index} exited with code {worker.exitcode}, restarting it")
+                    workers[index] = start_worker(index)
+
+    def handle_signal(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    workers.extend(start_worker(index) for index in range(args.workers))
+    threading.Thread(target=watch_workers, name="watch-workers", daemon=True).start()
+    logger.info(f"Flask server starting at {os.getenv('FLASK_HOST')}:{os.getenv('FLASK_PORT')} "
+                f"with {args.workers} workers")
+    try:
+        server.serve_forever()
+    finally:
+        stopping.set()
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+        listener.close()
+
+
+if __name__ == "__main__":
+    main()
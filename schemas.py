@@ -1,5 +1,7 @@
 from marshmallow import Schema, fields, validate, validates_schema, ValidationError
 
+from convergence import COMPLETION_MODES
+
 
 class PartialGripperRequestSchema(Schema):
     amount = fields.Integer(required=True, validate=lambda x: 0 <= x <= 255)
@@ -11,6 +13,8 @@ class MoveRequestSchema(Schema):
     distance = fields.Float(required=False)
     acceleration = fields.Float(required=False, missing=None, validate=lambda x: x >= 0)
     velocity = fields.Float(required=False, missing=None, validate=lambda x: x >= 0)
+    completion = fields.Str(required=False, validate=validate.OneOf(COMPLETION_MODES))
+    completion_tolerance = fields.Float(required=False, validate=lambda x: 0 < x)
 
     @validates_schema
     def validate_direction(self, data, **kwargs):
@@ -31,6 +35,9 @@ class MoveJRequestSchema(Schema):
     velocity = fields.Float(required=False)
     pose_object = fields.Boolean(required=False)
     relative = fields.Boolean(required=False)
+    gripper = fields.Integer(required=False, validate=lambda x: 0 <= x <= 255)
+    completion = fields.Str(required=False, validate=validate.OneOf(COMPLETION_MODES))
+    completion_tolerance = fields.Float(required=False, validate=lambda x: 0 < x)
 
 
 class MoveLRequestSchema(Schema):
@@ -39,13 +46,28 @@ class MoveLRequestSchema(Schema):
     velocity = fields.Float(required=False)
     pose_object = fields.Boolean(required=False)
     relative = fields.Boolean(required=False)
+    gripper = fields.Integer(required=False, validate=lambda x: 0 <= x <= 255)
+    completion = fields.Str(required=False, validate=validate.OneOf(COMPLETION_MODES))
+    completion_tolerance = fields.Float(required=False, validate=lambda x: 0 < x)
 
 
 class MoveLSRequestSchema(Schema):
     coordinates_list = fields.List(fields.List(fields.Float(), required=True, validate=lambda x: len(x) == 6),
-                                   required=True)
+                                   required=True, validate=lambda x: len(x) > 0)
+    acceleration = fields.Float(required=False)
+    velocity = fields.Float(required=False)
+    tolerance = fields.Float(required=False, validate=lambda x: 0 < x)
+    angular_tolerance = fields.Float(required=False, validate=lambda x: 0 < x)
+    gripper = fields.Integer(required=False, validate=lambda x: 0 <= x <= 255)
+    completion = fields.Str(required=False, validate=validate.OneOf(COMPLETION_MODES))
+    completion_tolerance = fields.Float(required=False, validate=lambda x: 0 < x)
+
+
+class TrajectoryStreamRequestSchema(Schema):
     acceleration = fields.Float(required=False)
     velocity = fields.Float(required=False)
+    completion = fields.Str(required=False, validate=validate.OneOf(COMPLETION_MODES))
+    completion_tolerance = fields.Float(required=False, validate=lambda x: 0 < x)
 
 
 class SetConfigRequestSchema(Schema):
@@ -55,3 +77,75 @@ class SetConfigRequestSchema(Schema):
     program_running_timeout_limit = fields.Float(required=False)
     amount_movement = fields.Float(required=False, validate=lambda x: 0 < x)
     amount_rotation = fields.Float(required=False, validate=lambda x: 0 < x)
+
+
+class ForwardKinematicsRequestSchema(Schema):
+    joint_positions_list = fields.List(fields.List(fields.Float(), required=True, validate=lambda x: len(x) == 6),
+                                       required=True)
+
+
+class InverseKinematicsRequestSchema(Schema):
+    poses = fields.List(fields.List(fields.Float(), required=True, validate=lambda x: len(x) == 6), required=True)
+    reference_joint_positions = fields.List(fields.Float(), required=False, validate=lambda x: len(x) == 6)
+    all_solutions = fields.Boolean(required=False)
+
+
+class SequenceStepSchema(Schema):
+    type = fields.Str(required=True, validate=validate.OneOf(["movej", "movel", "gripper", "wait"]))
+    joint_positions = fields.List(fields.Float(), required=False, validate=lambda x: len(x) == 6)
+    coordinates_and_angles = fields.List(fields.Float(), required=False, validate=lambda x: len(x) == 6)
+    acceleration = fields.Float(required=False)
+    velocity = fields.Float(required=False)
+    pose_object = fields.Boolean(required=False)
+    amount = fields.Integer(required=False, validate=lambda x: 0 <= x <= 255)
+    speed = fields.Integer(required=False, validate=lambda x: 0 <= x <= 255)
+    force = fields.Integer(required=False, validate=lambda x: 0 <= x <= 255)
+    seconds = fields.Float(required=False, validate=lambda x: x >= 0)
+
+    @validates_schema
+    def validate_step(self, data, **kwargs):
+        required = {"movej": "joint_positions", "movel": "coordinates_and_angles", "gripper": "amount",
+                    "wait": "seconds"}[data["type"]]
+        if required not in data:
+            raise ValidationError(f"{required} is required for {data['type']} steps.")
+
+
+class PipelineRequestSchema(SequenceStepSchema):
+    type = fields.Str(required=True, validate=validate.OneOf(["movej", "movel"]))
+
+
+class SequenceRequestSchema(Schema):
+    steps = fields.List(fields.Nested(SequenceStepSchema), required=True, validate=lambda x: len(x) > 0)
+
+
+class RegisterProgramRequestSchema(Schema):
+    name = fields.Str(required=True, validate=validate.Regexp(r"^[A-Za-z0-9_.-]{1,64}$"))
+    steps = fields.List(fields.Nested(SequenceStepSchema), required=True, validate=lambda x: len(x) > 0)
+
+
+class RunProgramRequestSchema(Schema):
+    offset = fields.List(fields.Float(), required=False, validate=lambda x: len(x) == 3)
+    speed = fields.Float(required=False, validate=lambda x: 0 < x)
+
+
+class StopRequestSchema(Schema):
+    mode = fields.Str(required=False, validate=validate.OneOf(["joint", "linear"]))
+    deceleration = fields.Float(required=False, validate=lambda x: 0 < x)
+
+
+class StateHistoryRequestSchema(Schema):
+    start = fields.Float(required=False, data_key="from")
+    end = fields.Float(required=False, data_key="to")
+    max_points = fields.Integer(required=False, validate=lambda x: 3 <= x <= 100000)
+    method = fields.Str(required=False, validate=validate.OneOf(["lttb", "minmax"]))
+
+
+class TimelineRequestSchema(Schema):
+    max_points = fields.Integer(required=False, validate=lambda x: 3 <= x <= 100000)
+
+
+class SubscribeRequestSchema(Schema):
+    topic = fields.Str(required=True, validate=validate.Length(min=1))
+    rate = fields.Float(required=False, allow_none=True, validate=lambda x: x > 0)
+    aggregation = fields.Str(required=False, validate=validate.OneOf(["latest", "mean", "minmax"]))
+    ack = fields.Boolean(required=False)
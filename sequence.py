@@ -0,0 +1,207 @@
+import numpy as np
+
+from gripper import ROBOTIQ_SOCKET_PORT, OBJECT_MOVING
+from trajectory import rotation_vectors_to_quaternions
+
+GRIPPER_SOCKET_NAME = "gripper_socket"
+
+ARM_STEPS = ("movej", "movel")
+
+# Distance to the target below which an arm step is considered complete.
+POSITION_TOLERANCE = 0.001
+ROTATION_TOLERANCE = 0.01
+JOINT_TOLERANCE = 0.001
+
+# Names of the program parameters in parameterized programs.
+OFFSET_PARAMETER = "program_offset"
+SPEED_PARAMETER = "program_speed"
+
+
+def _format_target(target, pose_object, parameterized):
+    values = str([float(value) for value in target])
+    if not pose_object:
+        return values
+    return f"pose_add(p{values}, {OFFSET_PARAMETER})" if parameterized else f"p{values}"
+
+
+def _format_velocity(velocity, parameterized):
+    return f"{velocity} * {SPEED_PARAMETER}" if parameterized else f"{velocity}"
+
+
+def compile_sequence_body(steps, gripper_speed=255, gripper_force=50, parameterized=False):
+    """
+        Compile the body of a program running a sequence of arm and gripper steps, without its def line.
+
+        Gripper steps talk to the Robotiq URCap gripper socket from the controller itself and wait for the gripper
+        to report that it stopped before the next step starts.
+
+        Parameters
+        ----------
+        steps : list
+            The steps, each a dict with a type (movej, movel, gripper or wait) and its parameters. Arm steps must
+            have their acceleration and velocity resolved, and may have a blend radius in meters, blend. A step
+            correlation_id is written in the comment of the step.
+        gripper_speed : int, optional
+            The gripper speed used when a gripper step does not set one. Default is 255.
+        gripper_force : int, optional
+            The gripper force used when a gripper step does not set one. Default is 50.
+        parameterized : bool, optional
+            A flag indicating whether pose targets are shifted by the program offset and velocities scaled by the
+            program speed. Both must then be assigned before the body. Default is False.
+
+        Returns
+        -------
+        bytes
+            The encoded body, ending with the end of the program.
+    """
+    lines = []
+    if any(step["type"] == "gripper" for step in steps):
+        lines.append(f'  socket_open("127.0.0.1", {ROBOTIQ_SOCKET_PORT}, "{GRIPPER_SOCKET_NAME}")')
+    for index, step in enumerate(steps):
+        marker = f", correlation_id: {step['correlation_id']}" if step.get("correlation_id") else ""
+        lines.append(f"  # step {index}: {step['type']}{marker}")
+        if step["type"] in ARM_STEPS:
+            target = step["joint_positions"] if step["type"] == "movej" else step["coordinates_and_angles"]
+            target = _format_target(target, step.get("pose_object", True), parameterized)
+            velocity = _format_velocity(step["velocity"], parameterized)
+            blend = f", r={step['blend']}" if step.get("blend") else ""
+            lines.append(f"  {step['type']}({target}, a={step['acceleration']}, v={velocity}{blend})")
+        elif step["type"] == "gripper":
+            amount = step["amount"]
+            speed = step.get("speed", gripper_speed)
+            force = step.get("force", gripper_force)
+            lines += [
+                f'  socket_send_line("SET POS {amount} SPE {speed} FOR {force} GTO 1", "{GRIPPER_SOCKET_NAME}")',
+                f'  socket_read_string("{GRIPPER_SOCKET_NAME}", timeout=2.0)',
+                f'  while socket_get_var("PRE", "{GRIPPER_SOCKET_NAME}") != {amount}:',
+                "    sync()",
+                "  end",
+                f'  while socket_get_var("OBJ", "{GRIPPER_SOCKET_NAME}") == {OBJECT_MOVING}:',
+                "    sync()",
+                "  end",
+            ]
+        elif step["type"] == "wait":
+            lines.append(f"  sleep({float(step['seconds'])})")
+        else:
+            raise ValueError(f"Unknown sequence step type: {step['type']}")
+    lines.append("end")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def compile_sequence(steps, gripper_speed=255, gripper_force=50):
+    """
+        Compile a sequence of arm and gripper steps into a single URScript program.
+
+        Returns
+        -------
+        bytes
+            The encoded program.
+    """
+    return b"def sequenceProg():\n" + compile_sequence_body(steps, gripper_speed, gripper_force)
+
+
+class SequenceProgress:
+    """
+        Follows the execution of a compiled sequence from the robot state to time each of its steps.
+
+        Steps complete in order: an arm step when the robot reaches its target, a gripper step when the gripper
+        reports that it stopped at the requested position and a wait step after its duration. Gripper steps are
+        not observable without the gripper socket and are skipped, their time being attributed to the next step.
+    """
+
+    def __init__(self, steps, read_pose, read_joints, read_gripper=None, offset=None):
+        """
+            Parameters
+            ----------
+            steps : list
+                The steps of the sequence.
+            read_pose : callable
+                Returns the current pose of the robot.
+            read_joints : callable
+                Returns the current joint positions of the robot.
+            read_gripper : callable, optional
+                Takes a requested gripper position and returns whether the gripper stopped after taking it.
+            offset : list, optional
+                The translation (x, y, z) the pose targets of a parameterized program are shifted by.
+        """
+        self._steps = steps
+        self._read_pose = read_pose
+        self._read_joints = read_joints
+        self._read_gripper = read_gripper
+        self._offset = np.zeros(3) if offset is None else np.asarray(offset, dtype=float)
+        self._completed_at = [None] * len(steps)
+        self._current = 0
+
+    def update(self, elapsed):
+        """
+            Check whether the current step completed and move on to the next ones.
+
+            Parameters
+            ----------
+            elapsed : float
+                The time since the program started in seconds.
+        """
+        while self._current < len(self._steps):
+            step = self._steps[self._current]
+            if step["type"] == "gripper" and self._read_gripper is None:
+                self._current += 1
+                continue
+            if not self.__is_complete(step, elapsed):
+                return
+            self._completed_at[self._current] = elapsed
+            self._current += 1
+
+    def finish(self, elapsed):
+        """
+            Mark every remaining step as completed when the program ends.
+        """
+        self.update(elapsed)
+        for index in range(self._current, len(self._steps)):
+            self._completed_at[index] = elapsed
+        self._current = len(self._steps)
+
+    def get_timings(self):
+        """
+            Get the timing of each step.
+
+            Returns
+            -------
+            list
+                For each step its index, type, completion time since the program start and duration in seconds.
+                Both are None for the steps that were not observed.
+        """
+        timings = []
+        previous = 0.0
+        for index, (step, completed_at) in enumerate(zip(self._steps, self._completed_at)):
+            duration = None
+            if completed_at is not None:
+                duration = completed_at - previous
+                previous = completed_at
+            timings.append({"index": index, "type": step["type"], "completed_at": completed_at,
+                            "duration": duration})
+        return timings
+
+    def __previous_completion(self):
+        for completed_at in reversed(self._completed_at[:self._current]):
+            if completed_at is not None:
+                return completed_at
+        return 0.0
+
+    def __is_complete(self, step, elapsed):
+        if step["type"] == "wait":
+            return elapsed - self.__previous_completion() >= step["seconds"]
+        if step["type"] == "gripper":
+            return self._read_gripper(step["amount"])
+        target = step["joint_positions"] if step["type"] == "movej" else step["coordinates_and_angles"]
+        target = np.asarray(target, dtype=float)
+        if not step.get("pose_object", True):
+            return bool(np.max(np.abs(np.asarray(self._read_joints(), dtype=float) - target)) < JOINT_TOLERANCE)
+        pose = np.asarray(self._read_pose(), dtype=float)
+        # The robot only goes within the blend radius of a blended target, with the orientation half way.
+        if np.linalg.norm(pose[:3] - target[:3] - self._offset) >= POSITION_TOLERANCE + step.get("blend", 0.0):
+            return False
+        if step.get("blend"):
+            return True
+        quaternions = rotation_vectors_to_quaternions(np.vstack((pose[3:], target[3:])))
+        angle = 2 * np.arccos(min(1.0, abs(float(quaternions[0] @ quaternions[1]))))
+        return angle < ROTATION_TOLERANCE
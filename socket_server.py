@@ -1,14 +1,23 @@
 import os
 
 from dotenv import load_dotenv
-from flask import Flask
+from flask import Flask, request
 from flask_socketio import SocketIO, emit
+from marshmallow import ValidationError
 
+from codec import dumps
 from logger import Logger
+from schemas import SubscribeRequestSchema
+from telemetry import TelemetryHub
+from utils import JSON_HEADERS
 
 load_dotenv()
 WEBSOCKET_HOST = os.getenv("WEBSOCKET_HOST")
 WEBSOCKET_PORT = os.getenv("WEBSOCKET_PORT")
+BOT_NAME = os.getenv("BOT_NAME")
+TELEMETRY_QUEUE_SIZE = int(os.getenv("TELEMETRY_QUEUE_SIZE", 128))
+TELEMETRY_WINDOW = int(os.getenv("TELEMETRY_WINDOW", 64))
+TELEMETRY_ACK_TIMEOUT = float(os.getenv("TELEMETRY_ACK_TIMEOUT", 5))
 
 # Create a Flask app object
 app = Flask(__name__)
@@ -19,12 +28,27 @@ socketio = SocketIO(app)
 logger = Logger("Socket Server")
 
 
+def send_frame(sid, topic, payload, callback):
+    socketio.emit('telemetry', (topic, payload), to=sid, callback=callback)
+
+
+hub = TelemetryHub(send_frame, queue_size=TELEMETRY_QUEUE_SIZE, window=TELEMETRY_WINDOW,
+                   ack_timeout=TELEMETRY_ACK_TIMEOUT)
+hub.start()
+
+
 # Define a route for the index page
 @app.route('/')
 def index():
     return "Hello, this is the socket io server"
 
 
+# Define a route for the fan-out statistics
+@app.route('/stats')
+def stats():
+    return dumps(hub.get_stats()), 200, JSON_HEADERS
+
+
 # Define a function to handle socket io connections
 @socketio.on('connect')
 def handle_connect():
@@ -32,20 +56,53 @@ def handle_connect():
     emit('welcome', {'message': 'Welcome to the socket io server'})
 
 
-# Define a function to handle socket io messages
+# Define a function to handle socket io disconnections
+@socketio.on('disconnect')
+def handle_disconnect():
+    hub.unsubscribe(request.sid)
+
+
+# Define a function to handle subscriptions to a topic
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    try:
+        subscription = SubscribeRequestSchema().load(data)
+    except ValidationError as e:
+        return {"status": f"Error: {e.messages}"}
+    topic = subscription['topic']
+    hub.subscribe(request.sid, topic, rate=subscription.get('rate'),
+                  aggregation=subscription.get('aggregation', 'latest'), ack=subscription.get('ack', False))
+    logger.info(f"Client {request.sid} subscribed to {topic}")
+    return {"status": f"Subscribed to {topic}"}
+
+
+# Define a function to handle unsubscriptions from a topic
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    try:
+        topic = SubscribeRequestSchema().load(data)['topic']
+    except ValidationError as e:
+        return {"status": f"Error: {e.messages}"}
+    hub.unsubscribe(request.sid, topic)
+    logger.info(f"Client {request.sid} unsubscribed from {topic}")
+    return {"status": f"Unsubscribed from {topic}"}
+
+
+# Define a function to handle frames published to a topic
+@socketio.on('publish')
+def handle_publish(data):
+    # Frames are checked by hand rather than with a schema, this is the hot path of the server.
+    if not isinstance(data, dict) or not isinstance(data.get('topic'), str) or 'payload' not in data:
+        logger.error("Invalid frame, must have a topic and a payload")
+        return
+    hub.publish(data['topic'], data['payload'])
+
+
+# Define a function to handle socket io messages from clients that do not publish to a topic
 @socketio.on('message')
 def handle_message(data):
     if data is not None:
-        if type(data) is bytes:
-            try:
-                logger.info(f"Message received: {data.decode('utf-8')}")
-                socketio.send('Message received: ' + data.decode('utf-8'))
-            except ValueError:
-                logger.info(f"Message received: {data}")
-                socketio.send('Message received: ' + data)
-        elif type(data) is str:
-            logger.info(f"Message received: {data}")
-            socketio.send('Message received: ' + data)
+        hub.publish(f"{BOT_NAME}/message", data)
 
 
 # Run the socket io server
@@ -1,65 +1,138 @@
+import argparse
 import os
 import platform
+import signal
 import subprocess
+import sys
 
 from dotenv import load_dotenv
 
+from logger import Logger
+from startup_profile import profile_startup
+from supervisor import Component, Supervisor, tcp_probe
+
 load_dotenv()
 
-run_env = []
-to_run = []
+SUPERVISOR_READY_TIMEOUT = float(os.getenv("SUPERVISOR_READY_TIMEOUT", 30))
+SUPERVISOR_MAX_BACKOFF = float(os.getenv("SUPERVISOR_MAX_BACKOFF", 30))
+API_WORKERS = int(os.getenv("API_WORKERS", 1))
+# Logged by proxy_server.py once it listens for the REST server.
+PROXY_READY_OUTPUT = "Proxy server listening at"
+
+
+def get_components():
+    """
+        Get the components of the stack enabled by the environment variables, with their dependencies and probes.
+    """
+    python = [sys.executable, "-u"]
+    components = []
+    proxy = os.environ.get("PROXY") in {"True"}
+    if proxy:
+        components.append(Component("socket_server", python + ["socket_server.py"],
+                                    probe=tcp_probe(os.getenv("WEBSOCKET_HOST"), os.getenv("WEBSOCKET_PORT"))))
+        # The proxy serves the single connection of the REST server, a connecting probe would take its place, so it
+        # is ready once it logs that it listens.
+        components.append(Component("proxy_server", python + ["proxy_server.py"], depends_on=["socket_server"],
+                                    ready_output=PROXY_READY_OUTPUT))
+    # With several workers the robot owner holds the connection to the robot and serves the API from its workers.
+    api = ["robot_owner.py", "--workers", str(API_WORKERS)] if API_WORKERS > 1 else ["main.py"]
+    components.append(Component("main", python + api, depends_on=["proxy_server"] if proxy else [],
+                                probe=tcp_probe(os.getenv("FLASK_HOST"), os.getenv("FLASK_PORT"))))
+    if os.environ.get("LISTENER") in {"True"}:
+        components.append(Component("socket_listener", python + ["socket_listener.py"]))
+    return components
+
+
+def run_supervisor():
+    logger = Logger("Supervisor")
+    supervisor = Supervisor(get_components(), ready_timeout=SUPERVISOR_READY_TIMEOUT,
+                            max_backoff=SUPERVISOR_MAX_BACKOFF, logger=logger)
+
+    def handle_signal(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    supervisor.start()
+    try:
+        supervisor.wait()
+    except KeyboardInterrupt:
+        logger.info("Stopping the stack")
+    finally:
+        supervisor.stop()
+
+
+def run_terminals():
+    run_env = []
+    to_run = []
+
+    system = platform.system()
 
-system = platform.system()
+    if system == "Windows":
+        run_env.append("venv\\Scripts\\activate.bat")
+    else:
+        run_env.append("source")
+        run_env.append("venv/bin/activate")
 
-if system == "Windows":
-    run_env.append("venv\\Scripts\\activate.bat")
-else:
-    run_env.append("source")
-    run_env.append("venv/bin/activate")
+    if os.environ.get("PROXY") in {"True"}:
+        run_start_socket_server = run_env + ["&&", "python", "socket_server.py"]
+        to_run.append(run_start_socket_server)
 
-if os.environ.get("PROXY") in {"True"}:
-    run_start_socket_server = run_env + ["&&", "python", "socket_server.py"]
-    to_run.append(run_start_socket_server)
+        run_start_proxy_server = run_env + ["&&", "python", "proxy_server.py"]
+        to_run.append(run_start_proxy_server)
 
-    run_start_proxy_server = run_env + ["&&", "python", "proxy_server.py"]
-    to_run.append(run_start_proxy_server)
+    run_start_main = run_env + ["&&", "python", "main.py"]
+    to_run.append(run_start_main)
 
-run_start_main = run_env + ["&&", "python", "main.py"]
-to_run.append(run_start_main)
+    if os.environ.get("LISTENER") in {"True"}:
+        run_start_socket_listener = run_env + ["&&", "python", "socket_listener.py"]
+        to_run.append(run_start_socket_listener)
 
-if os.environ.get("LISTENER") in {"True"}:
-    run_start_socket_listener = run_env + ["&&", "python", "socket_listener.py"]
-    to_run.append(run_start_socket_listener)
+    for run in to_run:
+        cmd = " ".join(run)
+        # Add a pause command to the end of the cmd string to keep the terminal open after the script finishes
+        cmd = cmd + " & pause"
 
-for run in to_run:
-    cmd = " ".join(run)
-    # Add a pause command to the end of the cmd string to keep the terminal open after the script finishes
-    cmd = cmd + " & pause"
+        if system == "Windows":
+            from subprocess import CREATE_NEW_CONSOLE
 
-    if system == "Windows":
-        from subprocess import CREATE_NEW_CONSOLE
+            subprocess.Popen(["cmd", "/c", cmd], creationflags=CREATE_NEW_CONSOLE)
+
+            # Alternatively, you can use start to open a new console window and execute the cmd string
+            # subprocess.Popen(["start", "cmd", "/c", cmd], shell=True)
 
-        subprocess.Popen(["cmd", "/c", cmd], creationflags=CREATE_NEW_CONSOLE)
+            # You can also use powershell instead of cmd if you prefer
+            # subprocess.Popen(["powershell", "-Command", cmd], creationflags=CREATE_NEW_CONSOLE)
 
-        # Alternatively, you can use start to open a new console window and execute the cmd string
-        # subprocess.Popen(["start", "cmd", "/c", cmd], shell=True)
+            # Or use start with powershell
+            # subprocess.Popen(["start", "powershell", "-Command", cmd], shell=True)
 
-        # You can also use powershell instead of cmd if you prefer
-        # subprocess.Popen(["powershell", "-Command", cmd], creationflags=CREATE_NEW_CONSOLE)
+        elif system == "Linux":
+            # Use xterm to open a new terminal window and execute the cmd string
+            subprocess.Popen(["xterm", "-hold", "-e", cmd])
 
-        # Or use start with powershell
-        # subprocess.Popen(["start", "powershell", "-Command", cmd], shell=True)
+            # Alternatively, you can use gnome-terminal to open a new terminal window and execute the cmd string
+            # subprocess.Popen(["gnome-terminal", "--", "/bin/bash", "-c", cmd])
 
-    elif system == "Linux":
-        # Use xterm to open a new terminal window and execute the cmd string
-        subprocess.Popen(["xterm", "-hold", "-e", cmd])
+        elif system == "Darwin":
+            directory = os.path.dirname(os.path.abspath(__file__))
+            subprocess.Popen(["open", "-a", "Terminal.app", "--args", "-c", f"cd {directory} && {cmd}"])
 
-        # Alternatively, you can use gnome-terminal to open a new terminal window and execute the cmd string
-        # subprocess.Popen(["gnome-terminal", "--", "/bin/bash", "-c", cmd])
+        else:
+            print(f"Unsupported system: {system}")
 
-    elif system == "Darwin":
-        directory = os.path.dirname(os.path.abspath(__file__))
-        subprocess.Popen(["open", "-a", "Terminal.app", "--args", "-c", f"cd {directory} && {cmd}"])
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start the components of the stack.")
+    parser.add_argument("--terminals", action="store_true",
+                        help="open every component in its own terminal window instead of supervising them headless")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print the import time breakdown of every component instead of starting them")
+    args = parser.parse_args()
+    if args.profile_startup:
+        profile_startup([next(part for part in component.command if part.endswith(".py"))
+                         for component in get_components()])
+    elif args.terminals:
+        run_terminals()
     else:
-        print(f"Unsupported system: {system}")
+        run_supervisor()
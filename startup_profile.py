@@ -0,0 +1,82 @@
+import ast
+import os
+import subprocess
+import sys
+import time
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_import_code(path):
+    """
+        Get the code of the top level imports of a script, without the rest of it.
+
+        Entry points start servers or connect to the robot when run, only their imports are profiled.
+    """
+    with open(path, "r") as file:
+        source = file.read()
+    tree = ast.parse(source, filename=path)
+    imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return "\n".join(ast.get_source_segment(source, node) for node in imports)
+
+
+def time_imports(path, env=None):
+    """
+        Import the top level imports of a script in a new interpreter.
+
+        Parameters
+        ----------
+        path : str
+            The script.
+        env : dict, optional
+            The environment of the interpreter. Default is the current one.
+
+        Returns
+        -------
+        tuple
+            The wall time of the interpreter in seconds, and the ``-X importtime`` output as a list of
+            (self microseconds, cumulative microseconds, depth, module) tuples.
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", get_import_code(path)], cwd=DIRECTORY,
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to import the dependencies of {path}: {result.stderr.strip().splitlines()[-1]}")
+    records = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        records.append((int(self_time), int(cumulative), depth, name.strip()))
+    return elapsed, records
+
+
+def format_profile(path, elapsed, records, top=10):
+    """
+        Format the import time breakdown of a script: its direct imports by cumulative time and the packages
+        by the time spent in their own modules.
+    """
+    direct = sorted((record for record in records if record[2] == 0), key=lambda record: -record[1])
+    packages = {}
+    for self_time, _, _, name in records:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_time
+    heaviest = sorted(packages.items(), key=lambda item: -item[1])
+    lines = [f"{os.path.basename(path)}: {elapsed * 1000:.0f} ms to start an interpreter and import "
+             f"{len(records)} modules ({sum(record[1] for record in direct) / 1000:.0f} ms importing)",
+             f"  {'direct import':<40}{'cumulative (ms)':>16}"]
+    lines += [f"  {name:<40}{cumulative / 1000:>16.1f}" for _, cumulative, _, name in direct[:top]]
+    lines.append(f"  {'package':<40}{'own modules (ms)':>16}")
+    lines += [f"  {package:<40}{self_time / 1000:>16.1f}" for package, self_time in heaviest[:top]]
+    return "\n".join(lines)
+
+
+def profile_startup(paths, top=10):
+    """
+        Print the import time breakdown of scripts.
+    """
+    for path in paths:
+        elapsed, records = time_imports(path)
+        print(format_profile(path, elapsed, records, top=top))
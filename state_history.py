@@ -0,0 +1,244 @@
+import threading
+import time
+
+import numpy as np
+
+# Each sample holds a timestamp, a pose and joint positions.
+SAMPLE_WIDTH = 13
+DOWNSAMPLING_METHODS = ("lttb", "minmax")
+
+
+def _lttb(timestamps, values, max_points):
+    """
+        Select the indexes of the samples kept by Largest Triangle Three Buckets.
+
+        The triangle areas of every channel are added, each channel being normalized by its range so that poses in
+        meters and joints in radians weigh the same.
+    """
+    count = len(timestamps)
+    ranges = np.ptp(values, axis=0)
+    values = values / np.where(ranges > 0, ranges, 1.0)
+    times = timestamps - timestamps[0]
+    edges = np.linspace(1, count - 1, max_points - 1).astype(int)
+    selected = np.empty(max_points, dtype=int)
+    selected[0] = 0
+    selected[-1] = count - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else count
+        next_time = times[end:next_end].mean() if next_end > end else times[-1]
+        next_values = values[end:next_end].mean(axis=0) if next_end > end else values[-1]
+        # Twice the area of the triangle formed with the previous selected sample and the next bucket average.
+        areas = np.abs((times[previous] - next_time) * (values[start:end] - values[previous])
+                       - (times[previous] - times[start:end, None]) * (next_values - values[previous])).sum(axis=1)
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def _minmax(values, max_points):
+    """
+        Select the indexes of the samples holding the minimum and maximum of every channel in each bucket.
+
+        Every channel keeps its envelope, so no peak is lost, and the result never has more than max_points samples.
+        Channels often peak at the same samples, so the number of buckets is the largest one whose extremes fit in
+        max_points, which needs max_points to be at least twice the number of channels.
+    """
+    channels = values.shape[1]
+    low, high = max_points // (2 * channels), max_points // 2
+    selected = _extremes(values, low)
+    while low < high:
+        middle = (low + high + 1) // 2
+        indexes = _extremes(values, middle)
+        if len(indexes) <= max_points:
+            low, selected = middle, indexes
+        else:
+            high = middle - 1
+    return selected
+
+
+def _extremes(values, buckets):
+    count, channels = values.shape
+    size = -(-count // buckets)
+    padded = np.pad(values, ((0, buckets * size - count), (0, 0)), mode="edge").reshape(buckets, size, channels)
+    offsets = np.arange(buckets)[:, None] * size
+    indexes = np.concatenate((padded.argmin(axis=1) + offsets, padded.argmax(axis=1) + offsets), axis=1)
+    return np.unique(np.minimum(indexes, count - 1))
+
+
+class StateHistory:
+    """
+        A fixed-size ring buffer of timestamped robot poses and joint positions.
+
+        The whole buffer is allocated up front, so its memory use is ``capacity * 13 * 8`` bytes whatever happens.
+        Once full, each new sample overwrites the oldest one.
+    """
+
+    def __init__(self, capacity):
+        self._capacity = capacity
+        self._samples = np.zeros((capacity, SAMPLE_WIDTH))
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def append(self, timestamp, pose, joints):
+        """
+            Append a sample.
+
+            Parameters
+            ----------
+            timestamp : float
+                The time of the sample in seconds since the epoch, not before the newest sample.
+            pose : list
+                The pose (x, y, z, rx, ry, rz) of the robot.
+            joints : list
+                The joint positions of the robot.
+
+            Raises
+            ------
+            ValueError
+                If the timestamp is before the newest sample, which would break the time range queries.
+        """
+        with self._lock:
+            if self._count and timestamp < self._samples[(self._head - 1) % self._capacity, 0]:
+                raise ValueError("Sample timestamp is before the newest sample")
+            row = self._samples[self._head]
+            row[0] = timestamp
+            row[1:7] = pose
+            row[7:13] = joints
+            self._head = (self._head + 1) % self._capacity
+            self._count = min(self._count + 1, self._capacity)
+
+    def query(self, start=None, end=None, max_points=1000, method="lttb"):
+        """
+            Get the samples within a time range, downsampled to at most max_points samples.
+
+            Parameters
+            ----------
+            start : float, optional
+                The start of the range in seconds since the epoch. Default is the oldest sample.
+            end : float, optional
+                The end of the range in seconds since the epoch. Default is the newest sample.
+            max_points : int, optional
+                The maximum number of samples returned. Default is 1000.
+            method : str, optional
+                The downsampling method, lttb or minmax. Default is lttb. minmax falls back to lttb for fewer than
+                24 points.
+
+            Returns
+            -------
+            dict
+                The timestamps, poses and joint positions of the samples, and the number of samples in the range.
+        """
+        with self._lock:
+            first = (self._head - self._count) % self._capacity
+            order = (first + np.arange(self._count)) % self._capacity
+            timestamps = self._samples[order, 0]
+            low = 0 if start is None else int(np.searchsorted(timestamps, start, side="left"))
+            high = self._count if end is None else int(np.searchsorted(timestamps, end, side="right"))
+            samples = self._samples[order[low:high]]
+        if len(samples) > max_points:
+            # Below one minimum and one maximum per channel, the envelope cannot be kept and LTTB is used instead.
+            if method == "minmax" and max_points >= 2 * (SAMPLE_WIDTH - 1):
+                samples = samples[_minmax(samples[:, 1:], max_points)]
+            else:
+                samples = samples[_lttb(samples[:, 0], samples[:, 1:], max(max_points, 3))]
+        return {
+            "samples_in_range": max(high - low, 0),
+            "timestamps": samples[:, 0].tolist(),
+            "poses": samples[:, 1:7].tolist(),
+            "joint_positions": samples[:, 7:13].tolist()
+        }
+
+    def get_stats(self):
+        """
+            Get the size, memory use and time span of the history.
+        """
+        with self._lock:
+            first = (self._head - self._count) % self._capacity
+            last = (self._head - 1) % self._capacity
+            return {
+                "capacity": self._capacity,
+                "samples": self._count,
+                "memory_bytes": self._samples.nbytes,
+                "oldest": float(self._samples[first, 0]) if self._count else None,
+                "newest": float(self._samples[last, 0]) if self._count else None
+            }
+
+
+class StateRecorder:
+    """
+        Samples the robot state into a StateHistory at a fixed rate from a background thread.
+    """
+
+    def __init__(self, history, read_state, rate, logger=None, snapshot=None):
+        """
+            Parameters
+            ----------
+            history : StateHistory
+                The history to record into.
+            read_state : callable
+                Returns the current pose and joint positions of the robot.
+            rate : float
+                The sampling rate in Hz.
+            logger : Logger, optional
+                Used to report sampling errors.
+            snapshot : StateSnapshotWriter, optional
+                Also gets every sample, for the local processes reading the latest state.
+        """
+        self._history = history
+        self._snapshot = snapshot
+        self._read_state = read_state
+        self._period = 1.0 / rate
+        self._logger = logger
+        self._stop = threading.Event()
+        self._thread = None
+        self._errors = 0
+        # Timestamps follow the monotonic clock from the wall clock time the recorder was created, so a wall clock
+        # step never makes them go backwards, even across restarts.
+        self._epoch = time.time() - time.monotonic()
+
+    def start(self):
+        """
+            Start sampling.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.__run, name="state-recorder", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+            Stop sampling and wait for the sampling thread to end.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __run(self):
+        # The history may hold samples of a previous recorder created before the wall clock stepped back, the
+        # timestamps then resume from its newest sample.
+        newest = self._history.get_stats()["newest"]
+        if newest is not None:
+            self._epoch = max(self._epoch, newest - time.monotonic())
+        epoch = self._epoch
+        next_sample = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                pose, joints = self._read_state()
+                timestamp = epoch + time.monotonic()
+                self._history.append(timestamp, pose, joints)
+                if self._snapshot is not None:
+                    self._snapshot.publish(timestamp, pose, joints)
+            except Exception as e:
+                # A failed read leaves a gap in the history, the next period samples again.
+                self._errors += 1
+                if self._logger is not None and self._errors == 1:
+                    self._logger.warning(f"Failed to sample the robot state: {e}")
+            next_sample += self._period
+            delay = next_sample - time.monotonic()
+            if delay < 0:
+                next_sample = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
@@ -0,0 +1,161 @@
+import atexit
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# The layout of the shared memory block, a single record.
+SNAPSHOT_DTYPE = np.dtype([("sequence", "<u8"), ("timestamp", "<f8"), ("pose", "<f8", 6), ("joints", "<f8", 6)])
+# Spins of a reader before yielding the processor to a writer in the middle of a write.
+READ_SPINS = 100
+READ_TIMEOUT = 1.0
+
+
+def _attach(name):
+    if sys.platform == "win32":
+        return shared_memory.SharedMemory(name=name)
+    # Attaching registers the block with a resource tracker, which unlinks it when the reader exits although the
+    # writer still uses it. Readers attach without registering it.
+    from multiprocessing import resource_tracker
+
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class StateSnapshotWriter:
+    """
+        Publishes the latest robot state into a shared memory block that local processes read without a connection
+        to the robot or a request to the API.
+
+        The block holds a single record guarded by a sequence counter, a seqlock: the writer makes the counter odd
+        before writing and even again after, and readers retry when the counter is odd or changed while they copied
+        the record. There must be a single writer per block.
+    """
+
+    def __init__(self, name):
+        """
+            Parameters
+            ----------
+            name : str
+                The name of the shared memory block, the readers attach to it by this name.
+        """
+        try:
+            self._block = shared_memory.SharedMemory(name=name, create=True, size=SNAPSHOT_DTYPE.itemsize)
+        except FileExistsError:
+            # Left over by a writer that did not exit cleanly.
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self._block = shared_memory.SharedMemory(name=name, create=True, size=SNAPSHOT_DTYPE.itemsize)
+        self.name = name
+        self._record = np.ndarray((), dtype=SNAPSHOT_DTYPE, buffer=self._block.buf)
+        self._record[...] = 0
+        self._sequence = self._record["sequence"]
+        atexit.register(self.close)
+
+    def publish(self, timestamp, pose, joints):
+        """
+            Publish a state.
+
+            Parameters
+            ----------
+            timestamp : float
+                The time of the state in seconds since the epoch.
+            pose : list
+                The pose (x, y, z, rx, ry, rz) of the robot.
+            joints : list
+                The joint positions of the robot.
+        """
+        sequence = int(self._sequence)
+        self._sequence[...] = sequence + 1
+        self._record["timestamp"] = timestamp
+        self._record["pose"] = pose
+        self._record["joints"] = joints
+        self._sequence[...] = sequence + 2
+
+    def close(self):
+        """
+            Remove the block, readers still attached keep their mapping until they close it.
+        """
+        if self._block is None:
+            return
+        atexit.unregister(self.close)
+        self._record = self._sequence = None
+        self._block.close()
+        self._block.unlink()
+        self._block = None
+
+
+class StateSnapshotReader:
+    """
+        Reads consistent robot states published by a StateSnapshotWriter of another process.
+
+        A read copies the 112 bytes of the record from the shared memory, without any system call unless a write is
+        in progress for longer than a few retries.
+    """
+
+    def __init__(self, name):
+        """
+            Parameters
+            ----------
+            name : str
+                The name of the shared memory block.
+
+            Raises
+            ------
+            FileNotFoundError
+                If no writer created the block.
+        """
+        self._block = _attach(name)
+        self._record = np.ndarray((), dtype=SNAPSHOT_DTYPE, buffer=self._block.buf)
+        self._sequence = self._record["sequence"]
+        self.retries = 0
+
+    def read(self, out=None):
+        """
+            Read the latest state.
+
+            Parameters
+            ----------
+            out : numpy.ndarray, optional
+                A record of SNAPSHOT_DTYPE to copy the state into, which saves an allocation per read.
+
+            Returns
+            -------
+            numpy.ndarray or None
+                The record with the sequence, timestamp, pose and joints fields, or None if no state was published.
+
+            Raises
+            ------
+            TimeoutError
+                If the writer kept the record busy, which happens when it died in the middle of a write.
+        """
+        out = np.empty((), dtype=SNAPSHOT_DTYPE) if out is None else out
+        deadline = None
+        while True:
+            for _ in range(READ_SPINS):
+                before = int(self._sequence)
+                if before == 0:
+                    return None
+                if not before & 1:
+                    out[...] = self._record
+                    if int(self._sequence) == before:
+                        return out
+                self.retries += 1
+            now = time.monotonic()
+            deadline = now + READ_TIMEOUT if deadline is None else deadline
+            if now > deadline:
+                raise TimeoutError("The state snapshot is being written for too long")
+            time.sleep(0)
+
+    def close(self):
+        """
+            Detach from the block.
+        """
+        self._record = self._sequence = None
+        self._block.close()
@@ -0,0 +1,254 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from logger import Logger
+
+PROBE_INTERVAL = 0.05
+PROBE_TIMEOUT = 0.2
+INITIAL_BACKOFF = 1.0
+# A component that stayed up this long before crashing restarts with the initial backoff again.
+STABLE_SECONDS = 30.0
+STOP_TIMEOUT = 5.0
+
+
+def _probe_host(host):
+    return "127.0.0.1" if host in (None, "", "0.0.0.0") else host
+
+
+def tcp_probe(host, port):
+    """
+        Get a readiness probe that succeeds once a TCP connection to the host and port is accepted.
+    """
+    address = (_probe_host(host), int(port))
+
+    def probe():
+        try:
+            with socket.create_connection(address, timeout=PROBE_TIMEOUT):
+                return True
+        except OSError:
+            return False
+
+    return probe
+
+
+class Component:
+    """
+        A process of the stack, with the components it depends on and the probe or output line telling it is ready.
+    """
+
+    def __init__(self, name, command, depends_on=(), probe=None, ready_output=None):
+        """
+            Parameters
+            ----------
+            name : str
+                The name of the component, used to prefix its logs.
+            command : list
+                The command starting the component.
+            depends_on : tuple, optional
+                The names of the components that must be ready before this one starts.
+            probe : callable, optional
+                Returns True once the component is ready. A component without probe is ready once started.
+            ready_output : str, optional
+                Text the component writes to its output once it is ready, for servers that accept a single
+                connection, which a connecting probe would consume.
+        """
+        self.name = name
+        self.command = command
+        self.depends_on = tuple(depends_on)
+        self.probe = probe
+        self.ready_output = None if ready_output is None else ready_output.encode("utf-8")
+        self.process = None
+        self.output_ready = threading.Event()
+        self.ready = threading.Event()
+        self.restarts = 0
+        self.startup_time = None
+        self.cascaded = False
+
+
+class Supervisor:
+    """
+        Starts the components of the stack headless, in dependency order, and keeps them running.
+
+        A component starts as soon as the components it depends on are ready, so independent components start in
+        parallel. A component that exits is restarted with an exponential backoff, and the components depending on it
+        are restarted once it is ready again, since they hold connections to it. The output of every component is
+        written to the standard output, each line prefixed with the name of its component.
+    """
+
+    def __init__(self, components, ready_timeout=30.0, max_backoff=30.0, logger=None):
+        """
+            Parameters
+            ----------
+            components : list
+                The components of the stack.
+            ready_timeout : float, optional
+                The seconds a component has to become ready before it is restarted. Default is 30.
+            max_backoff : float, optional
+                The maximum seconds to wait before restarting a component. Default is 30.
+            logger : Logger, optional
+                Used to report the state of the components.
+        """
+        self._components = {component.name: component for component in components}
+        for component in components:
+            for dependency in component.depends_on:
+                if dependency not in self._components:
+                    raise ValueError(f"Component {component.name} depends on unknown component {dependency}")
+        self._ready_timeout = ready_timeout
+        self._max_backoff = max_backoff
+        self._logger = logger if logger is not None else Logger("Supervisor")
+        self._stopping = threading.Event()
+        self._output_lock = threading.Lock()
+        self._width = max(len(name) for name in self._components)
+        self._threads = []
+        self._started_at = None
+
+    def start(self):
+        """
+            Start every component and report the startup time of the stack once they are all ready.
+        """
+        self._started_at = time.perf_counter()
+        for component in self._components.values():
+            thread = threading.Thread(target=self.__supervise, args=(component,), name=f"supervise-{component.name}",
+                                      daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        threading.Thread(target=self.__report_startup, name="supervise-startup", daemon=True).start()
+
+    def wait(self):
+        """
+            Block until the supervisor is stopped.
+        """
+        while not self._stopping.wait(1.0):
+            pass
+
+    def stop(self):
+        """
+            Stop every component, the dependents before the components they depend on.
+        """
+        self._stopping.set()
+        for component in reversed(self.__dependency_order()):
+            self.__terminate(component)
+        for thread in self._threads:
+            thread.join(STOP_TIMEOUT)
+
+    def __dependency_order(self):
+        ordered = []
+        visited = set()
+
+        def visit(component):
+            if component.name in visited:
+                return
+            visited.add(component.name)
+            for dependency in component.depends_on:
+                visit(self._components[dependency])
+            ordered.append(component)
+
+        for component in self._components.values():
+            visit(component)
+        return ordered
+
+    def __dependents(self, component):
+        return [other for other in self._components.values() if component.name in other.depends_on]
+
+    def __supervise(self, component):
+        failures = 0
+        while not self._stopping.is_set():
+            if not self.__wait_for_dependencies(component):
+                return
+            component.cascaded = False
+            started = time.perf_counter()
+            try:
+                self.__spawn(component)
+            except OSError as e:
+                self._logger.error(f"Failed to start {component.name}: {e}")
+            else:
+                if self.__wait_until_ready(component, started):
+                    component.process.wait()
+                elif component.process.poll() is None:
+                    self._logger.error(f"{component.name} was not ready after {self._ready_timeout} s")
+                    self.__terminate(component)
+            component.ready.clear()
+            if self._stopping.is_set():
+                return
+            # The dependents hold connections to this component, they restart once it is ready again.
+            for dependent in self.__dependents(component):
+                dependent.cascaded = True
+                self.__terminate(dependent)
+            if component.cascaded:
+                self._logger.warning(f"Restarting {component.name} with the components it depends on")
+                continue
+            failures = 1 if time.perf_counter() - started >= STABLE_SECONDS else failures + 1
+            backoff = min(INITIAL_BACKOFF * 2 ** (failures - 1), self._max_backoff)
+            code = component.process.returncode if component.process is not None else None
+            self._logger.error(f"{component.name} exited with code {code}, restarting in {backoff:.0f} s")
+            component.restarts += 1
+            if self._stopping.wait(backoff):
+                return
+
+    def __wait_for_dependencies(self, component):
+        for dependency in component.depends_on:
+            while not self._components[dependency].ready.wait(PROBE_INTERVAL):
+                if self._stopping.is_set():
+                    return False
+        return not self._stopping.is_set()
+
+    def __spawn(self, component):
+        self._logger.info(f"Starting {component.name}")
+        if component.probe is not None and component.probe():
+            self._logger.warning(f"The address of {component.name} is already in use, its probe may pass too early")
+        component.output_ready.clear()
+        component.process = subprocess.Popen(component.command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                             stdin=subprocess.DEVNULL, env={**os.environ, "PYTHONUNBUFFERED": "1"})
+        threading.Thread(target=self.__forward_output, args=(component, component.process),
+                         name=f"output-{component.name}", daemon=True).start()
+
+    def __wait_until_ready(self, component, started):
+        deadline = started + self._ready_timeout
+        while component.process.poll() is None and not self._stopping.is_set():
+            if (component.ready_output is None or component.output_ready.is_set()) and \
+                    (component.probe is None or component.probe()):
+                elapsed = time.perf_counter() - started
+                if component.startup_time is None:
+                    component.startup_time = elapsed
+                self._logger.info(f"{component.name} is ready after {elapsed:.2f} s")
+                component.ready.set()
+                return True
+            if time.perf_counter() >= deadline:
+                return False
+            time.sleep(PROBE_INTERVAL)
+        return False
+
+    def __forward_output(self, component, process):
+        prefix = f"{component.name:<{self._width}} | ".encode("utf-8")
+        for line in iter(process.stdout.readline, b""):
+            if component.ready_output is not None and component.ready_output in line:
+                component.output_ready.set()
+            with self._output_lock:
+                sys.stdout.buffer.write(prefix + line)
+                sys.stdout.buffer.flush()
+        process.stdout.close()
+
+    def __terminate(self, component):
+        process = component.process
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def __report_startup(self):
+        for component in self._components.values():
+            while not component.ready.wait(PROBE_INTERVAL):
+                if self._stopping.is_set():
+                    return
+        elapsed = time.perf_counter() - self._started_at
+        details = ", ".join(f"{component.name} {component.startup_time:.2f} s" for component in
+                            self.__dependency_order())
+        self._logger.info(f"Stack ready in {elapsed:.2f} s ({details})")
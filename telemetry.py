@@ -0,0 +1,371 @@
+import threading
+import time
+from collections import deque
+
+AGGREGATIONS = ("latest", "mean", "minmax")
+
+
+def _numeric(payload):
+    if isinstance(payload, (list, tuple)) and payload and all(
+            isinstance(value, (int, float)) and not isinstance(value, bool) for value in payload):
+        # numpy is only loaded once a client asks for an aggregation, it is not needed to forward frames.
+        import numpy as np
+
+        return np.asarray(payload, dtype=float)
+    return None
+
+
+class RateGroup:
+    """
+        The subscribers of a topic sharing the same rate and aggregation mode.
+
+        Each group aggregates the frames of its topic once, whatever its number of subscribers, and emits the
+        aggregate at most once per period. The latest mode forwards the last frame of the period; mean and minmax
+        reduce numeric frames (lists of numbers) and forward the last frame for any other payload.
+    """
+
+    __slots__ = ("rate", "aggregation", "subscribers", "_period", "_next_emit", "_latest", "_count", "_sum",
+                 "_min", "_max")
+
+    def __init__(self, rate, aggregation):
+        self.rate = rate
+        self.aggregation = aggregation
+        self.subscribers = set()
+        self._period = None if rate is None else 1.0 / rate
+        self._next_emit = None
+        self.__reset()
+
+    def __reset(self):
+        self._latest = None
+        self._count = 0
+        self._sum = None
+        self._min = None
+        self._max = None
+
+    def add(self, payload, values, now):
+        """
+            Add a frame to the group.
+
+            Parameters
+            ----------
+            payload : object
+                The frame as published.
+            values : numpy.ndarray or None
+                The frame as numbers, or None if it is not numeric.
+            now : float
+                The current monotonic time in seconds.
+
+            Returns
+            -------
+            object or None
+                The frame to send to the subscribers of the group, or None if the period is not over.
+        """
+        if self._period is None and self.aggregation == "latest":
+            return payload
+        self._latest = payload
+        self._count += 1
+        if values is not None and self.aggregation != "latest":
+            if self._sum is None or len(self._sum) != len(values):
+                self._sum = values.copy()
+                self._min = values.copy()
+                self._max = values.copy()
+            else:
+                import numpy as np
+
+                self._sum += values
+                np.minimum(self._min, values, out=self._min)
+                np.maximum(self._max, values, out=self._max)
+        if self._period is not None:
+            if self._next_emit is None:
+                self._next_emit = now
+            if now < self._next_emit:
+                return None
+        return self.__emit(now)
+
+    def flush(self, now):
+        """
+            Emit the frames of a period that ended without a new frame, so the last frames of a topic that stops
+            publishing are not held back until its next frame.
+
+            Parameters
+            ----------
+            now : float
+                The current monotonic time in seconds.
+
+            Returns
+            -------
+            object or None
+                The frame to send to the subscribers of the group, or None if there is nothing to emit yet.
+        """
+        if not self._count or self._period is None or now < self._next_emit:
+            return None
+        return self.__emit(now)
+
+    def __emit(self, now):
+        if self._period is not None:
+            # A late frame starts the next period, the group never emits bursts to catch up.
+            self._next_emit = max(self._next_emit + self._period, now)
+        frame = self.__frame()
+        self.__reset()
+        return frame
+
+    def __frame(self):
+        if self.aggregation == "latest" or self._sum is None:
+            return self._latest
+        if self.aggregation == "mean":
+            return {"mean": (self._sum / self._count).tolist(), "count": self._count}
+        return {"min": self._min.tolist(), "max": self._max.tolist(), "count": self._count}
+
+    @property
+    def key(self):
+        return self.rate, self.aggregation
+
+
+class Subscriber:
+    """
+        A client of the telemetry hub with its bounded queue of pending frames, and the send times of the frames it
+        did not acknowledge yet when it acknowledges them.
+    """
+
+    __slots__ = ("sid", "topics", "ack", "queue", "in_flight", "pumping", "lock", "sent", "dropped", "expired")
+
+    def __init__(self, sid, queue_size):
+        self.sid = sid
+        self.topics = {}
+        self.ack = False
+        self.queue = deque(maxlen=queue_size)
+        self.in_flight = deque()
+        self.pumping = False
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.dropped = 0
+        self.expired = 0
+
+
+class TelemetryHub:
+    """
+        Fans out telemetry frames to the clients subscribed to their topic, through the rate groups they share.
+
+        Every client has a bounded queue. A client that asks to acknowledge its frames has at most ``window`` frames
+        sent and not yet acknowledged, and a frame not acknowledged within ``ack_timeout`` seconds is given up on.
+        A slow client stops acknowledging, its queue fills up and the oldest frames are dropped, so it always gets
+        the most recent frames without slowing down the other clients or growing the memory of the server. The
+        other clients are sent their frames as they come.
+    """
+
+    def __init__(self, send, queue_size=128, window=64, ack_timeout=5.0, clock=time.monotonic):
+        """
+            Parameters
+            ----------
+            send : callable
+                Sends a frame to a client, called with the client id, the topic, the payload and a callback to call
+                when the client acknowledges the frame, or None if the client does not acknowledge its frames.
+            queue_size : int, optional
+                The maximum number of frames waiting to be sent to a client. Default is 128.
+            window : int, optional
+                The maximum number of frames sent to a client and not yet acknowledged. Default is 64.
+            ack_timeout : float, optional
+                The seconds after which a frame not acknowledged no longer counts in the window. Default is 5.
+            clock : callable, optional
+                Returns the current time in seconds to pace the rate groups. Default is time.monotonic.
+        """
+        self._send = send
+        self._queue_size = queue_size
+        self._window = window
+        self._ack_timeout = ack_timeout
+        self._clock = clock
+        self._subscribers = {}
+        self._topics = {}
+        self._lock = threading.Lock()
+        self._published = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, interval=0.05):
+        """
+            Start flushing the rate groups whose period ended without a new frame, and the clients waiting for
+            acknowledgements that timed out, every ``interval`` seconds.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.__run, args=(interval,), name="telemetry-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+            Stop flushing and wait for the flushing thread to end.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __run(self, interval):
+        while not self._stop.wait(interval):
+            self.flush()
+
+    def subscribe(self, sid, topic, rate=None, aggregation="latest", ack=False):
+        """
+            Subscribe a client to a topic, replacing its previous subscription to the topic.
+
+            Parameters
+            ----------
+            sid : str
+                The client id.
+            topic : str
+                The topic to subscribe to.
+            rate : float, optional
+                The maximum number of frames per second to send to the client. Default is every frame.
+            aggregation : str, optional
+                How the frames of a period are reduced to one: latest, mean or minmax. Default is latest.
+            ack : bool, optional
+                A flag indicating whether the client acknowledges its frames, for every topic. Default is False.
+        """
+        with self._lock:
+            subscriber = self._subscribers.get(sid)
+            if subscriber is None:
+                subscriber = Subscriber(sid, self._queue_size)
+                self._subscribers[sid] = subscriber
+            subscriber.ack = ack
+            self.__leave(subscriber, topic)
+            groups = self._topics.setdefault(topic, {})
+            group = groups.get((rate, aggregation))
+            if group is None:
+                group = RateGroup(rate, aggregation)
+                groups[group.key] = group
+            group.subscribers.add(subscriber)
+            subscriber.topics[topic] = group.key
+
+    def unsubscribe(self, sid, topic=None):
+        """
+            Unsubscribe a client from a topic, or from every topic if none is given.
+        """
+        with self._lock:
+            subscriber = self._subscribers.get(sid)
+            if subscriber is None:
+                return
+            for name in list(subscriber.topics) if topic is None else [topic]:
+                self.__leave(subscriber, name)
+            if not subscriber.topics:
+                del self._subscribers[sid]
+
+    def __leave(self, subscriber, topic):
+        key = subscriber.topics.pop(topic, None)
+        if key is None:
+            return
+        groups = self._topics[topic]
+        groups[key].subscribers.discard(subscriber)
+        if not groups[key].subscribers:
+            del groups[key]
+            if not groups:
+                del self._topics[topic]
+
+    def publish(self, topic, payload):
+        """
+            Feed a frame to every rate group of its topic, queue the frames they emit for their clients and send
+            what the client windows allow.
+        """
+        deliveries = []
+        with self._lock:
+            self._published += 1
+            groups = self._topics.get(topic)
+            if groups:
+                now = self._clock()
+                values = _numeric(payload) if any(group.aggregation != "latest" for group in groups.values()) \
+                    else None
+                for group in groups.values():
+                    frame = group.add(payload, values, now)
+                    if frame is not None:
+                        deliveries.append((topic, frame, list(group.subscribers)))
+        self.__deliver(deliveries)
+
+    def flush(self):
+        """
+            Send the frames of the rate groups whose period ended without a new frame, and the queued frames of the
+            clients whose unacknowledged frames timed out.
+        """
+        deliveries = []
+        with self._lock:
+            now = self._clock()
+            for topic, groups in self._topics.items():
+                for group in groups.values():
+                    frame = group.flush(now)
+                    if frame is not None:
+                        deliveries.append((topic, frame, list(group.subscribers)))
+            waiting = [subscriber for subscriber in self._subscribers.values()
+                       if subscriber.queue and subscriber.in_flight]
+        self.__deliver(deliveries)
+        for subscriber in waiting:
+            self.__pump(subscriber)
+
+    def __deliver(self, deliveries):
+        for topic, frame, subscribers in deliveries:
+            for subscriber in subscribers:
+                self.__enqueue(subscriber, topic, frame)
+
+    def __enqueue(self, subscriber, topic, payload):
+        with subscriber.lock:
+            if len(subscriber.queue) == subscriber.queue.maxlen:
+                subscriber.dropped += 1
+            subscriber.queue.append((topic, payload))
+        self.__pump(subscriber)
+
+    def __pump(self, subscriber):
+        # A single caller sends the frames of a client at a time, which keeps them in order.
+        with subscriber.lock:
+            if subscriber.pumping:
+                return
+            subscriber.pumping = True
+        while True:
+            with subscriber.lock:
+                if len(subscriber.in_flight) >= self._window:
+                    self.__expire(subscriber)
+                if not subscriber.queue or len(subscriber.in_flight) >= self._window:
+                    subscriber.pumping = False
+                    return
+                topic, payload = subscriber.queue.popleft()
+                callback = None
+                if subscriber.ack:
+                    subscriber.in_flight.append(self._clock())
+                    callback = lambda *args: self.__acknowledge(subscriber)
+                subscriber.sent += 1
+            try:
+                self._send(subscriber.sid, topic, payload, callback)
+            except Exception:
+                with subscriber.lock:
+                    if callback is not None and subscriber.in_flight:
+                        subscriber.in_flight.pop()
+                    subscriber.pumping = False
+                raise
+
+    def __expire(self, subscriber):
+        # Acknowledgements come back in order, a lost one would otherwise hold a slot of the window for good.
+        deadline = self._clock() - self._ack_timeout
+        while subscriber.in_flight and subscriber.in_flight[0] <= deadline:
+            subscriber.in_flight.popleft()
+            subscriber.expired += 1
+
+    def __acknowledge(self, subscriber):
+        with subscriber.lock:
+            if subscriber.in_flight:
+                subscriber.in_flight.popleft()
+        self.__pump(subscriber)
+
+    def get_stats(self):
+        """
+            Get the number of published frames, the subscribers of every rate group and the sent, dropped, expired
+            and pending frames of every client.
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+            topics = {topic: [{"rate": group.rate, "aggregation": group.aggregation,
+                               "subscribers": len(group.subscribers)} for group in groups.values()]
+                      for topic, groups in self._topics.items()}
+            stats = {"published": self._published, "topics": topics}
+        stats["clients"] = {subscriber.sid: {"topics": {topic: {"rate": rate, "aggregation": aggregation}
+                                                        for topic, (rate, aggregation) in subscriber.topics.items()},
+                                             "ack": subscriber.ack, "sent": subscriber.sent,
+                                             "dropped": subscriber.dropped, "expired": subscriber.expired,
+                                             "queued": len(subscriber.queue),
+                                             "in_flight": len(subscriber.in_flight)}
+                            for subscriber in subscribers}
+        return stats
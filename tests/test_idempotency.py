@@ -0,0 +1,68 @@
+import threading
+import time
+
+from idempotency import IdempotencyCache
+
+
+def run_concurrently(cache, function, count, store=None):
+    barrier = threading.Barrier(count)
+    responses = []
+
+    def request():
+        barrier.wait()
+        try:
+            responses.append(cache.execute("key", "fingerprint", function, store=store))
+        except RuntimeError as e:
+            responses.append((e, False))
+
+    threads = [threading.Thread(target=request) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return responses
+
+
+def test_concurrent_requests_execute_once():
+    executions = []
+
+    def motion():
+        executions.append(len(executions))
+        time.sleep(0.1)
+        return "moved", 200
+
+    responses = run_concurrently(IdempotencyCache(), motion, 4)
+
+    assert executions == [0]
+    assert sorted(replayed for _, replayed in responses) == [False, True, True, True]
+
+
+def test_abandoned_claim_is_taken_over_by_a_single_waiter():
+    executions = []
+
+    def motion():
+        executions.append(len(executions))
+        time.sleep(0.1)
+        return ("shed", 429) if len(executions) == 1 else ("moved", 200)
+
+    responses = run_concurrently(IdempotencyCache(), motion, 4, store=lambda response: response[1] != 429)
+
+    assert executions == [0, 1]
+    assert sorted(response for response, _ in responses) == [("moved", 200)] * 3 + [("shed", 429)]
+
+
+def test_failed_claim_is_taken_over_by_a_single_waiter():
+    executions = []
+
+    def motion():
+        executions.append(len(executions))
+        time.sleep(0.1)
+        if len(executions) == 1:
+            raise RuntimeError("Timeout waiting for program to complete")
+        return "moved", 200
+
+    responses = run_concurrently(IdempotencyCache(), motion, 4)
+
+    assert executions == [0, 1]
+    assert [response for response, _ in responses].count(("moved", 200)) == 3
+    assert sum(isinstance(response, RuntimeError) for response, _ in responses) == 1
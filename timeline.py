@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+
+# The events of a request in the order they happen.
+EVENTS = ("received", "dispatched", "sent", "started", "finished", "responded")
+# The spans between events reported as durations, a span is left out while one of its events is missing.
+SPANS = (("queued", "received", "dispatched"), ("dispatch", "dispatched", "sent"), ("controller", "sent", "started"),
+         ("execution", "started", "finished"), ("response", "finished", "responded"),
+         ("total", "received", "responded"))
+
+
+class _Timeline:
+    __slots__ = ("events", "details")
+
+    def __init__(self):
+        self.events = {}
+        self.details = {}
+
+
+class TimelineStore:
+    """
+        A bounded store of the timelines of requests keyed by correlation ID.
+
+        A timeline holds the time of each event of a request, from the API receiving it to the API responding, with
+        details like its route, client and response status. The least recently recorded timelines are evicted once
+        ``max_entries`` is reached.
+    """
+
+    def __init__(self, max_entries=1024):
+        self._max_entries = max_entries
+        self._timelines = OrderedDict()
+        self._lock = threading.Lock()
+        self._evictions = 0
+
+    def record(self, correlation_id, event, timestamp=None, **details):
+        """
+            Record an event of a request.
+
+            An event recorded again for the same correlation ID keeps its first time, so the nested calls of a
+            motion do not move it.
+
+            Parameters
+            ----------
+            correlation_id : str
+                The correlation ID of the request.
+            event : str
+                One of EVENTS.
+            timestamp : float, optional
+                The time of the event in seconds since the epoch. Default is now.
+            **details
+                Details of the request added to its timeline.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            timeline = self._timelines.get(correlation_id)
+            if timeline is None:
+                timeline = self._timelines[correlation_id] = _Timeline()
+                if len(self._timelines) > self._max_entries:
+                    self._timelines.popitem(last=False)
+                    self._evictions += 1
+            else:
+                self._timelines.move_to_end(correlation_id)
+            timeline.events.setdefault(event, timestamp)
+            timeline.details.update(details)
+
+    def annotate(self, correlation_id, **details):
+        """
+            Add details to the timeline of a request, like the error that ended its motion.
+        """
+        with self._lock:
+            timeline = self._timelines.get(correlation_id)
+            if timeline is not None:
+                timeline.details.update(details)
+
+    def get(self, correlation_id):
+        """
+            Get the timeline of a request.
+
+            Returns
+            -------
+            dict or None
+                The details of the request, the time of each of its events and the durations between them, or None
+                if the correlation ID is unknown or was evicted.
+        """
+        with self._lock:
+            timeline = self._timelines.get(correlation_id)
+            if timeline is None:
+                return None
+            events, details = dict(timeline.events), dict(timeline.details)
+        durations = {name: events[end] - events[start] for name, start, end in SPANS
+                     if start in events and end in events}
+        return {
+            "correlation_id": correlation_id,
+            **details,
+            "events": {event: events[event] for event in EVENTS if event in events},
+            "durations": durations
+        }
+
+    def get_stats(self):
+        """
+            Get the size and eviction counter of the store.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._timelines),
+                "evictions": self._evictions,
+                "max_entries": self._max_entries
+            }
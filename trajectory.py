@@ -0,0 +1,502 @@
+import numpy as np
+
+# UR5e limits from the technical specification. Every joint has a +-360 degree working range, the maximum joint
+# speed is 180 degrees/s and the maximum reach from the base axis is 850 mm.
+UR5E_JOINT_MIN = np.full(6, -2 * np.pi)
+UR5E_JOINT_MAX = np.full(6, 2 * np.pi)
+UR5E_REACH = 0.85
+UR5E_MAX_JOINT_VELOCITY = np.pi
+UR5E_MAX_JOINT_ACCELERATION = 15.0
+UR5E_MAX_TOOL_VELOCITY = 1.0
+UR5E_MAX_TOOL_ACCELERATION = 5.0
+
+
+class TrajectoryValidationError(ValueError):
+    """
+        Raised when a trajectory violates the robot limits. Holds every violation found.
+    """
+
+    def __init__(self, violations):
+        self.violations = violations
+        super().__init__(f"Trajectory rejected with {len(violations)} violation(s)")
+
+    def __reduce__(self):
+        # Rebuilt from its violations rather than its message when sent between processes.
+        return self.__class__, (self.violations,)
+
+
+def _violations(check, indexes, values, limit, message, axes=None):
+    violations = []
+    indexes = indexes.tolist()
+    values = values.tolist()
+    axes = [None] * len(indexes) if axes is None else axes.tolist()
+    limits = limit.tolist() if isinstance(limit, np.ndarray) else [limit] * len(indexes)
+    for index, axis, value, limit in zip(indexes, axes, values, limits):
+        violation = {"check": check, "index": index, "value": value, "limit": limit, "message": message}
+        if axis is not None:
+            violation["axis"] = axis
+        violations.append(violation)
+    return violations
+
+
+def rotation_vectors_to_quaternions(rotation_vectors):
+    """
+        Convert an array of rotation vectors to unit quaternions.
+
+        Parameters
+        ----------
+        rotation_vectors : numpy.ndarray
+            An (N, 3) array of rotation vectors (rx, ry, rz) in radians.
+
+        Returns
+        -------
+        numpy.ndarray
+            An (N, 4) array of quaternions (w, x, y, z).
+    """
+    angles = np.linalg.norm(rotation_vectors, axis=1)
+    half = angles / 2
+    # sin(a/2)/a tends to 1/2 as a goes to 0, which keeps the identity rotation well defined.
+    scale = np.where(angles > 1e-12, np.sin(half) / np.where(angles > 1e-12, angles, 1.0), 0.5)
+    return np.column_stack((np.cos(half), rotation_vectors * scale[:, None]))
+
+
+class TrajectoryValidator:
+    """
+        Checks whole trajectories against the robot limits before they are sent to the controller.
+
+        Every check runs over the full trajectory as a NumPy array at once, and every violation is reported with
+        the index of the waypoint (or None for parameters that apply to the whole motion).
+    """
+
+    def __init__(self, joint_min=UR5E_JOINT_MIN, joint_max=UR5E_JOINT_MAX, reach=UR5E_REACH, min_z=None,
+                 max_z=None, max_step=0.5, max_rotation_step=np.pi, max_joint_velocity=UR5E_MAX_JOINT_VELOCITY,
+                 max_joint_acceleration=UR5E_MAX_JOINT_ACCELERATION, max_tool_velocity=UR5E_MAX_TOOL_VELOCITY,
+                 max_tool_acceleration=UR5E_MAX_TOOL_ACCELERATION):
+        self._joint_min = np.asarray(joint_min, dtype=float)
+        self._joint_max = np.asarray(joint_max, dtype=float)
+        self._reach = reach
+        self._min_z = min_z
+        self._max_z = max_z
+        self._max_step = max_step
+        self._max_rotation_step = max_rotation_step
+        self._max_joint_velocity = max_joint_velocity
+        self._max_joint_acceleration = max_joint_acceleration
+        self._max_tool_velocity = max_tool_velocity
+        self._max_tool_acceleration = max_tool_acceleration
+
+    def check_joints(self, joints, relative=False):
+        """
+            Check an array of joint configurations against the joint limits.
+
+            Parameters
+            ----------
+            joints : numpy.ndarray
+                An (N, 6) array of joint positions in radians.
+            relative : bool, optional
+                A flag indicating whether the joints are offsets from the current ones. Offsets are only checked
+                against the maximum step. Default is False.
+
+            Returns
+            -------
+            list
+                The violations found.
+        """
+        violations = self.__check_finite(joints)
+        if violations:
+            return violations
+        if relative:
+            steps = np.abs(joints)
+            rows, axes = np.nonzero(steps > self._max_rotation_step)
+            return _violations("max_joint_step", rows, steps[rows, axes], self._max_rotation_step,
+                               "Joint offset exceeds the maximum step", axes)
+        rows, axes = np.nonzero(joints < self._joint_min)
+        violations += _violations("joint_limit", rows, joints[rows, axes], self._joint_min[axes],
+                                  "Joint position below its limit", axes)
+        rows, axes = np.nonzero(joints > self._joint_max)
+        return violations + _violations("joint_limit", rows, joints[rows, axes], self._joint_max[axes],
+                                        "Joint position above its limit", axes)
+
+    def check_poses(self, poses, relative=False):
+        """
+            Check an array of poses against the workspace bounds and the maximum step between consecutive poses.
+
+            Parameters
+            ----------
+            poses : numpy.ndarray
+                An (N, 6) array of poses (x, y, z, rx, ry, rz) in meters and radians.
+            relative : bool, optional
+                A flag indicating whether the poses are offsets from the current one. Offsets are only checked
+                against the maximum step. Default is False.
+
+            Returns
+            -------
+            list
+                The violations found.
+        """
+        violations = self.__check_finite(poses)
+        if violations:
+            return violations
+        positions = poses[:, :3]
+        if relative:
+            steps = np.linalg.norm(positions, axis=1)
+            rows = np.nonzero(steps > self._max_step)[0]
+            violations += _violations("max_step", rows, steps[rows], self._max_step,
+                                      "Position offset exceeds the maximum step")
+            angles = np.linalg.norm(poses[:, 3:], axis=1)
+            rows = np.nonzero(angles > self._max_rotation_step)[0]
+            return violations + _violations("max_rotation_step", rows, angles[rows], self._max_rotation_step,
+                                            "Rotation offset exceeds the maximum step")
+
+        distances = np.linalg.norm(positions, axis=1)
+        rows = np.nonzero(distances > self._reach)[0]
+        violations += _violations("workspace", rows, distances[rows], self._reach, "Position is out of reach")
+        if self._min_z is not None:
+            rows = np.nonzero(positions[:, 2] < self._min_z)[0]
+            violations += _violations("workspace", rows, positions[rows, 2], self._min_z,
+                                      "Position is below the workspace")
+        if self._max_z is not None:
+            rows = np.nonzero(positions[:, 2] > self._max_z)[0]
+            violations += _violations("workspace", rows, positions[rows, 2], self._max_z,
+                                      "Position is above the workspace")
+
+        if len(poses) > 1:
+            steps = np.linalg.norm(np.diff(positions, axis=0), axis=1)
+            rows = np.nonzero(steps > self._max_step)[0]
+            violations += _violations("max_step", rows + 1, steps[rows], self._max_step,
+                                      "Distance from the previous waypoint exceeds the maximum step")
+            quaternions = rotation_vectors_to_quaternions(poses[:, 3:])
+            dots = np.abs(np.einsum("ij,ij->i", quaternions[:-1], quaternions[1:]))
+            angles = 2 * np.arccos(np.clip(dots, 0.0, 1.0))
+            rows = np.nonzero(angles > self._max_rotation_step)[0]
+            violations += _violations("max_rotation_step", rows + 1, angles[rows], self._max_rotation_step,
+                                      "Rotation from the previous waypoint exceeds the maximum step")
+        return violations
+
+    def check_speed(self, acceleration, velocity, joint_space):
+        """
+            Check the acceleration and velocity of a motion against the caps.
+
+            Parameters
+            ----------
+            acceleration : float or None
+                The acceleration of the motion. None means the service default is used and is not checked.
+            velocity : float or None
+                The velocity of the motion. None means the service default is used and is not checked.
+            joint_space : bool
+                A flag indicating whether the values are joint (rad/s, rad/s^2) or tool (m/s, m/s^2) values.
+
+            Returns
+            -------
+            list
+                The violations found.
+        """
+        max_velocity = self._max_joint_velocity if joint_space else self._max_tool_velocity
+        max_acceleration = self._max_joint_acceleration if joint_space else self._max_tool_acceleration
+        violations = []
+        if velocity is not None and not 0 <= velocity <= max_velocity:
+            violations.append({"check": "velocity", "index": None, "value": velocity, "limit": max_velocity,
+                               "message": "Velocity is out of range"})
+        if acceleration is not None and not 0 <= acceleration <= max_acceleration:
+            violations.append({"check": "acceleration", "index": None, "value": acceleration,
+                               "limit": max_acceleration, "message": "Acceleration is out of range"})
+        return violations
+
+    def validate_movej(self, joint_positions, acceleration, velocity, pose_object=True, relative=False):
+        """
+            Validate a movej request. A pose object target is checked as a pose, otherwise as joint positions.
+
+            Raises
+            ------
+            TrajectoryValidationError
+                If the motion violates any limit.
+        """
+        target = np.asarray([joint_positions], dtype=float)
+        violations = self.check_poses(target, relative) if pose_object else self.check_joints(target, relative)
+        self.__raise_if_any(violations + self.check_speed(acceleration, velocity, joint_space=True))
+
+    def validate_movel(self, coordinates_and_angles, acceleration, velocity, pose_object=True, relative=False):
+        """
+            Validate a movel request. A pose object target is checked as a pose, otherwise as joint positions.
+
+            Raises
+            ------
+            TrajectoryValidationError
+                If the motion violates any limit.
+        """
+        target = np.asarray([coordinates_and_angles], dtype=float)
+        violations = self.check_poses(target, relative) if pose_object else self.check_joints(target, relative)
+        self.__raise_if_any(violations + self.check_speed(acceleration, velocity, joint_space=False))
+
+    def validate_movels(self, coordinates_list, acceleration, velocity):
+        """
+            Validate a movels request.
+
+            Raises
+            ------
+            TrajectoryValidationError
+                If the motion violates any limit.
+        """
+        poses = np.asarray(coordinates_list, dtype=float).reshape(-1, 6)
+        self.__raise_if_any(self.check_poses(poses) + self.check_speed(acceleration, velocity, joint_space=False))
+
+    def validate_movels_chunk(self, poses, acceleration, velocity, previous=None, offset=0):
+        """
+            Validate a chunk of a movels trajectory checked piece by piece, like a streamed one.
+
+            Parameters
+            ----------
+            poses : numpy.ndarray
+                An (N, 6) array of the poses of the chunk.
+            acceleration : float or None
+                The acceleration of the trajectory.
+            velocity : float or None
+                The velocity of the trajectory.
+            previous : numpy.ndarray, optional
+                The last pose of the previous chunk, already validated, for the step into this chunk to be checked.
+            offset : int, optional
+                The index of the first pose of the chunk in the trajectory, violation indexes count from the start
+                of the trajectory. Default is 0.
+
+            Raises
+            ------
+            TrajectoryValidationError
+                If the chunk violates any limit.
+        """
+        if previous is not None:
+            poses = np.vstack((previous, poses))
+            offset -= 1
+        violations = [violation for violation in self.check_poses(poses)
+                      if previous is None or violation["index"] != 0]
+        for violation in violations:
+            violation["index"] += offset
+        self.__raise_if_any(violations + self.check_speed(acceleration, velocity, joint_space=False))
+
+    def validate_move(self, axis, distance, acceleration, velocity):
+        """
+            Validate a relative move along or around one axis of the pose vector.
+
+            Raises
+            ------
+            TrajectoryValidationError
+                If the motion violates any limit.
+        """
+        offset = np.zeros((1, 6))
+        if distance is not None:
+            offset[0, axis] = distance
+        violations = self.check_poses(offset, relative=True)
+        self.__raise_if_any(violations + self.check_speed(acceleration, velocity, joint_space=False))
+
+    def validate_sequence(self, steps):
+        """
+            Validate the arm steps of a sequence. Each violation holds the index of its step.
+
+            Raises
+            ------
+            TrajectoryValidationError
+                If any step violates any limit.
+        """
+        violations = []
+        for index, step in enumerate(steps):
+            if step["type"] not in ("movej", "movel"):
+                continue
+            target = step["joint_positions"] if step["type"] == "movej" else step["coordinates_and_angles"]
+            target = np.asarray([target], dtype=float)
+            step_violations = self.check_poses(target) if step.get("pose_object", True) else self.check_joints(target)
+            step_violations += self.check_speed(step.get("acceleration"), step.get("velocity"),
+                                                joint_space=step["type"] == "movej")
+            for violation in step_violations:
+                violation["step"] = index
+            violations += step_violations
+        self.__raise_if_any(violations)
+
+    def get_envelope(self, steps):
+        """
+            Summarize the validated arm steps of a sequence, so that a translation offset and a speed scale applied
+            to it later can be checked without validating every step again.
+
+            Parameters
+            ----------
+            steps : list
+                The steps of the sequence, with their velocities resolved.
+
+            Returns
+            -------
+            dict
+                The positions of the pose targets with their step indexes, their largest distance from the base,
+                their z range and the largest ratio between a step velocity and its cap.
+        """
+        indexes = []
+        positions = []
+        velocity_ratio = 0.0
+        for index, step in enumerate(steps):
+            if step["type"] not in ("movej", "movel"):
+                continue
+            max_velocity = self._max_joint_velocity if step["type"] == "movej" else self._max_tool_velocity
+            velocity_ratio = max(velocity_ratio, step["velocity"] / max_velocity)
+            if step.get("pose_object", True):
+                target = step["joint_positions"] if step["type"] == "movej" else step["coordinates_and_angles"]
+                indexes.append(index)
+                positions.append(target[:3])
+        positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+        return {
+            "indexes": np.asarray(indexes, dtype=int),
+            "positions": positions,
+            "max_distance": float(np.linalg.norm(positions, axis=1).max()) if len(positions) else 0.0,
+            "min_z": float(positions[:, 2].min()) if len(positions) else None,
+            "max_z": float(positions[:, 2].max()) if len(positions) else None,
+            "velocity_ratio": velocity_ratio
+        }
+
+    def validate_parameters(self, envelope, offset, speed):
+        """
+            Validate a translation offset and a speed scale applied to a sequence summarized by its envelope.
+
+            Most offsets are accepted from the envelope bounds alone; the positions are only checked one by one
+            when the bounds cannot rule out a violation.
+
+            Parameters
+            ----------
+            envelope : dict
+                The envelope of the sequence, from get_envelope.
+            offset : list
+                The translation (x, y, z) in meters added to the pose targets.
+            speed : float
+                The factor the velocities are scaled by.
+
+            Raises
+            ------
+            TrajectoryValidationError
+                If the shifted or scaled sequence violates any limit.
+        """
+        violations = []
+        if envelope["velocity_ratio"] * speed > 1:
+            violations.append({"check": "velocity", "index": None, "value": speed,
+                               "limit": 1 / envelope["velocity_ratio"],
+                               "message": "Speed scale takes a step velocity out of range"})
+        offset = np.asarray(offset, dtype=float)
+        positions = envelope["positions"]
+        if offset.any() and len(positions):
+            within_reach = envelope["max_distance"] + np.linalg.norm(offset) <= self._reach
+            within_min_z = self._min_z is None or envelope["min_z"] + offset[2] >= self._min_z
+            within_max_z = self._max_z is None or envelope["max_z"] + offset[2] <= self._max_z
+            if not (within_reach and within_min_z and within_max_z):
+                shifted = positions + offset
+                distances = np.linalg.norm(shifted, axis=1)
+                rows = np.nonzero(distances > self._reach)[0]
+                offset_violations = _violations("workspace", rows, distances[rows], self._reach,
+                                                "Position is out of reach")
+                if self._min_z is not None:
+                    rows = np.nonzero(shifted[:, 2] < self._min_z)[0]
+                    offset_violations += _violations("workspace", rows, shifted[rows, 2], self._min_z,
+                                                     "Position is below the workspace")
+                if self._max_z is not None:
+                    rows = np.nonzero(shifted[:, 2] > self._max_z)[0]
+                    offset_violations += _violations("workspace", rows, shifted[rows, 2], self._max_z,
+                                                     "Position is above the workspace")
+                for violation in offset_violations:
+                    violation["step"] = int(envelope["indexes"][violation["index"]])
+                    violation["index"] = 0
+                violations += offset_violations
+        self.__raise_if_any(violations)
+
+    @staticmethod
+    def __check_finite(values):
+        rows, axes = np.nonzero(~np.isfinite(values))
+        return _violations("finite", rows, values[rows, axes], None, "Value is not finite", axes)
+
+    @staticmethod
+    def __raise_if_any(violations):
+        if violations:
+            raise TrajectoryValidationError(violations)
+
+
+DEFAULT_ANGULAR_TOLERANCE = 0.01
+
+
+def _segment_deviations(positions, quaternions, start, end):
+    """
+        Deviation of the waypoints strictly between ``start`` and ``end`` from the straight segment joining them.
+
+        The position deviation is the distance to the segment. The angular deviation is the angle between the
+        waypoint orientation and the orientation interpolated (slerp) at the waypoint's projection on the segment.
+    """
+    points = positions[start + 1:end]
+    origin = positions[start]
+    direction = positions[end] - origin
+    length_squared = direction @ direction
+    if length_squared > 0:
+        t = np.clip((points - origin) @ direction / length_squared, 0.0, 1.0)
+    else:
+        t = np.zeros(len(points))
+    position_deviations = np.linalg.norm(points - (origin + t[:, None] * direction), axis=1)
+
+    q0, q1 = quaternions[start], quaternions[end]
+    if q0 @ q1 < 0:
+        q1 = -q1
+    omega = np.arccos(np.clip(q0 @ q1, -1.0, 1.0))
+    if omega > 1e-9:
+        interpolated = (np.sin((1 - t) * omega)[:, None] * q0 + np.sin(t * omega)[:, None] * q1) / np.sin(omega)
+    else:
+        interpolated = np.broadcast_to(q0, (len(points), 4))
+    dots = np.abs(np.einsum("ij,ij->i", quaternions[start + 1:end], interpolated))
+    angular_deviations = 2 * np.arccos(np.clip(dots, 0.0, 1.0))
+    return position_deviations, angular_deviations
+
+
+def simplify_path(coordinates_list, tolerance, angular_tolerance=DEFAULT_ANGULAR_TOLERANCE):
+    """
+        Drop the waypoints of a linear path that lie within a tolerance of the path through the remaining ones.
+
+        Uses the Ramer-Douglas-Peucker algorithm on position and orientation: a segment is split at its worst
+        waypoint until every dropped waypoint is within ``tolerance`` meters and ``angular_tolerance`` radians of
+        the segment that replaces it. The first and last waypoints are always kept.
+
+        Parameters
+        ----------
+        coordinates_list : list
+            The list of poses (x, y, z, rx, ry, rz) in meters and radians.
+        tolerance : float
+            The maximum position deviation in meters.
+        angular_tolerance : float, optional
+            The maximum orientation deviation in radians. Default is DEFAULT_ANGULAR_TOLERANCE.
+
+        Returns
+        -------
+        tuple
+            The simplified list of poses and a dict with the number of original and kept points, the number of
+            dropped points and the maximum position and angular deviation of the dropped points.
+    """
+    poses = np.asarray(coordinates_list, dtype=float).reshape(-1, 6)
+    count = len(poses)
+    keep = np.zeros(count, dtype=bool)
+    keep[[0, -1]] = True
+    max_deviation = 0.0
+    max_angular_deviation = 0.0
+    if count > 2:
+        positions = poses[:, :3]
+        quaternions = rotation_vectors_to_quaternions(poses[:, 3:])
+        stack = [(0, count - 1)]
+        while stack:
+            start, end = stack.pop()
+            if end - start < 2:
+                continue
+            position_deviations, angular_deviations = _segment_deviations(positions, quaternions, start, end)
+            scores = np.maximum(position_deviations / tolerance, angular_deviations / angular_tolerance)
+            worst = int(np.argmax(scores))
+            if scores[worst] > 1.0:
+                split = start + 1 + worst
+                keep[split] = True
+                stack.append((start, split))
+                stack.append((split, end))
+            else:
+                max_deviation = max(max_deviation, float(position_deviations.max()))
+                max_angular_deviation = max(max_angular_deviation, float(angular_deviations.max()))
+    kept = int(keep.sum())
+    simplified = coordinates_list if kept == count else poses[keep].tolist()
+    return simplified, {
+        "original_points": count,
+        "points": kept,
+        "dropped": count - kept,
+        "max_deviation": max_deviation,
+        "max_angular_deviation": max_angular_deviation
+    }
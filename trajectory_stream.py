@@ -0,0 +1,170 @@
+import csv
+import os
+import tempfile
+
+import numpy as np
+from marshmallow import ValidationError
+
+from codec import loads
+
+# The formats a trajectory can be streamed in, by content type.
+STREAM_FORMATS = {"application/x-ndjson": "ndjson", "application/jsonl": "ndjson", "text/csv": "csv"}
+# Longest line of a streamed trajectory in bytes, a waypoint of 6 numbers is far shorter.
+MAX_LINE_LENGTH = 1024
+# Bytes of a waypoint in the spool file, 6 doubles.
+WAYPOINT_SIZE = 6 * 8
+# Waypoints validated and written to the spool file at once.
+SPOOL_BLOCK_SIZE = 4096
+
+
+def _read_lines(stream):
+    number = 0
+    while True:
+        line = stream.readline(MAX_LINE_LENGTH + 1)
+        if not line:
+            return
+        number += 1
+        if len(line) > MAX_LINE_LENGTH:
+            raise ValidationError(f"Line {number}: Longer than {MAX_LINE_LENGTH} bytes.")
+        yield line
+
+
+def _waypoint(number, values):
+    try:
+        waypoint = [float(value) for value in values]
+    except (TypeError, ValueError):
+        waypoint = None
+    if waypoint is None or len(waypoint) != 6:
+        raise ValidationError(f"Line {number}: Must be a waypoint of 6 numbers.")
+    return waypoint
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def read_waypoints(stream, stream_format):
+    """
+        Parse the waypoints of a streamed trajectory one line at a time.
+
+        An NDJSON trajectory has a JSON array of 6 numbers per line. A CSV trajectory has 6 numbers per row, with an
+        optional header row. Blank lines are skipped.
+
+        Parameters
+        ----------
+        stream : file-like
+            The binary stream of the request body.
+        stream_format : str
+            "ndjson" or "csv".
+
+        Yields
+        ------
+        list
+            The waypoints (x, y, z, rx, ry, rz) in meters and radians.
+
+        Raises
+        ------
+        ValidationError
+            If a line is not a waypoint, with its line number.
+    """
+    if stream_format == "ndjson":
+        for number, line in enumerate(_read_lines(stream), 1):
+            if not line.strip():
+                continue
+            try:
+                values = loads(line)
+            except Exception:
+                raise ValidationError(f"Line {number}: Invalid JSON.")
+            yield _waypoint(number, values if isinstance(values, list) else None)
+        return
+    rows = csv.reader(line.decode("utf-8", errors="replace") for line in _read_lines(stream))
+    header = True
+    for row in rows:
+        if not any(cell.strip() for cell in row):
+            continue
+        if header:
+            header = False
+            if not _is_number(row[0]):
+                continue
+        yield _waypoint(rows.line_num, row)
+
+
+def spool_trajectory(waypoints, validator, acceleration, velocity, block_size=SPOOL_BLOCK_SIZE):
+    """
+        Validate the waypoints of a streamed trajectory block by block and write them to a temporary file, so the
+        trajectory never has to be held in memory.
+
+        Every block is checked with the waypoint before it, so the steps between blocks are checked as well, and the
+        first block with violations ends the spooling before anything is sent to the robot.
+
+        Parameters
+        ----------
+        waypoints : iterable
+            The waypoints of the trajectory.
+        validator : TrajectoryValidator
+            Checks the waypoints against the robot limits.
+        acceleration : float or None
+            The acceleration of the trajectory.
+        velocity : float or None
+            The velocity of the trajectory.
+        block_size : int, optional
+            The number of waypoints validated and written at once. Default is SPOOL_BLOCK_SIZE.
+
+        Returns
+        -------
+        tuple
+            The path of the spool file, to be removed by the caller, and the number of waypoints.
+
+        Raises
+        ------
+        ValidationError
+            If a line is not a waypoint or the trajectory is empty.
+        TrajectoryValidationError
+            If the trajectory violates any limit.
+    """
+    descriptor, path = tempfile.mkstemp(prefix="trajectory-", suffix=".bin")
+    count, previous, block = 0, None, []
+    try:
+        with os.fdopen(descriptor, "wb") as spool:
+            for waypoint in waypoints:
+                block.append(waypoint)
+                if len(block) == block_size:
+                    previous = _write_block(spool, block, previous, count, validator, acceleration, velocity)
+                    count, block = count + len(block), []
+            if block:
+                _write_block(spool, block, previous, count, validator, acceleration, velocity)
+                count += len(block)
+        if not count:
+            raise ValidationError("The trajectory has no waypoints.")
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, count
+
+
+def _write_block(spool, block, previous, offset, validator, acceleration, velocity):
+    poses = np.asarray(block, dtype=float)
+    validator.validate_movels_chunk(poses, acceleration, velocity, previous, offset)
+    spool.write(poses.tobytes())
+    return poses[-1]
+
+
+def read_chunks(path, chunk_size):
+    """
+        Read a spooled trajectory one chunk at a time.
+
+        Yields
+        ------
+        numpy.ndarray
+            The next at most chunk_size waypoints, as an (N, 6) array.
+    """
+    with open(path, "rb") as spool:
+        while True:
+            data = spool.read(chunk_size * WAYPOINT_SIZE)
+            if not data:
+                return
+            yield np.frombuffer(data, dtype=float).reshape(-1, 6)
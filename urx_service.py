@@ -1,15 +1,28 @@
+import functools
 import os
+import select
 import socket
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
-import urx
-import urx.urrobot
 from dotenv import load_dotenv
-from urx import robotiq_two_finger_gripper
 
+from convergence import TargetConvergence
+from gripper import RobotiqGripper
+from kinematics import batch_forward_kinematics, solve_inverse_kinematics
 from logger import Logger
-from utils import get_acceleration_and_velocity_to_use, parse_movel_instruction, parse_movej_instruction
+from motion_dispatcher import MotionCancelledError, MotionDispatcher, dispatched
+from motion_estimator import DurationEstimator
+from motion_pipeline import IdleTracker, MotionPipeline, assign_blends
+from sequence import ARM_STEPS, SequenceProgress, compile_sequence, compile_sequence_body
+from state_history import StateHistory, StateRecorder
+from state_snapshot import StateSnapshotWriter
+from timeline import TimelineStore
+from trajectory_stream import read_chunks
+from utils import get_acceleration_and_velocity_to_use, mark_program, parse_client_settings, \
+    parse_movel_instruction, parse_movej_instruction
 
 load_dotenv()
 
@@ -20,6 +33,33 @@ else:
     HOST = os.getenv("URX_HOST")
     PORT = int(os.getenv("URX_PORT"))
 
+GRIPPER_HOST = os.getenv("URX_HOST")
+
+TCP_OFFSET = [float(value) for value in os.getenv("TCP_OFFSET").split(",")] if os.getenv("TCP_OFFSET") else None
+
+STATE_HISTORY_RATE = float(os.getenv("STATE_HISTORY_RATE", 10))
+STATE_HISTORY_SECONDS = float(os.getenv("STATE_HISTORY_SECONDS", 600))
+SOCKET_READY_TIMEOUT = float(os.getenv("SOCKET_READY_TIMEOUT", 2))
+STATE_SNAPSHOT = os.getenv("STATE_SNAPSHOT", "True") == "True"
+STATE_SNAPSHOT_NAME = os.getenv("STATE_SNAPSHOT_NAME", f"{os.getenv('BOT_NAME')}_state")
+STOP_JOINT_DECELERATION = float(os.getenv("STOP_JOINT_DECELERATION", 2.0))
+STOP_LINEAR_DECELERATION = float(os.getenv("STOP_LINEAR_DECELERATION", 1.0))
+MOTION_QUEUE_MAX_DEPTH = int(os.getenv("MOTION_QUEUE_MAX_DEPTH", 2))
+MOTION_QUEUE_MAX_WAIT = float(os.getenv("MOTION_QUEUE_MAX_WAIT", 30))
+CLIENT_WEIGHTS = parse_client_settings(os.getenv("CLIENT_WEIGHTS"))
+CLIENT_QUOTAS = parse_client_settings(os.getenv("CLIENT_QUOTAS"))
+CLIENT_QUOTA_WINDOW = float(os.getenv("CLIENT_QUOTA_WINDOW", 3600))
+TIMELINE_MAX_ENTRIES = int(os.getenv("TIMELINE_MAX_ENTRIES", 1024))
+CONVERGENCE_POSITION_TOLERANCE = float(os.getenv("CONVERGENCE_POSITION_TOLERANCE", 0.001))
+CONVERGENCE_ROTATION_TOLERANCE = float(os.getenv("CONVERGENCE_ROTATION_TOLERANCE", 0.01))
+CONVERGENCE_JOINT_TOLERANCE = float(os.getenv("CONVERGENCE_JOINT_TOLERANCE", 0.001))
+CONVERGENCE_SPEED_TOLERANCE = float(os.getenv("CONVERGENCE_SPEED_TOLERANCE", 0.01))
+PIPELINE_DEPTH = int(os.getenv("PIPELINE_DEPTH", 8))
+PIPELINE_BLEND_RADIUS = float(os.getenv("PIPELINE_BLEND_RADIUS", 0.01))
+IDLE_HORIZON = float(os.getenv("IDLE_HORIZON", 5))
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 500))
+STREAM_BLEND_RADIUS = float(os.getenv("STREAM_BLEND_RADIUS", 0.01))
+
 
 class UrxEService:
 
@@ -29,8 +69,22 @@ class UrxEService:
         self._acceleration = 0.05
         self._wait_timeout_limit = 5
         self._program_running_timeout_limit = 60
+        self._gripper_timeout_limit = 5
         self._amount_movement = 0.05
         self._amount_rotation = np.pi / 32
+        self._tcp = TCP_OFFSET
+        self._estimator = DurationEstimator(tcp=self._tcp)
+        self._history = StateHistory(capacity=int(STATE_HISTORY_RATE * STATE_HISTORY_SECONDS))
+        self._startup_timings = None
+        self._snapshot = StateSnapshotWriter(STATE_SNAPSHOT_NAME) if STATE_SNAPSHOT else None
+        self._dispatcher = MotionDispatcher(max_depth=MOTION_QUEUE_MAX_DEPTH, max_wait=MOTION_QUEUE_MAX_WAIT,
+                                            weights=CLIENT_WEIGHTS, quotas=CLIENT_QUOTAS,
+                                            quota_window=CLIENT_QUOTA_WINDOW)
+        self._timeline = TimelineStore(max_entries=TIMELINE_MAX_ENTRIES)
+        # The correlation ID of the running motion, set by the dispatched decorator.
+        self._correlation_id = None
+        self._pipeline = MotionPipeline(depth=PIPELINE_DEPTH, logger=self._logger)
+        self._idle = IdleTracker(horizon=IDLE_HORIZON)
 
     def get_connection_status(self):
         pass
@@ -44,46 +98,64 @@ class UrxEService:
     def partial_gripper(self, amount):
         pass
 
-    def movej(self, joint_positions, acceleration, velocity, pose_object=True, relative=False):
+    def movej(self, joint_positions, acceleration, velocity, pose_object=True, relative=False, gripper=None,
+              report=None, completion="program", completion_tolerance=None):
+        pass
+
+    def movel(self, coordinates_and_angles, acceleration, velocity, pose_object=True, relative=False, gripper=None,
+              report=None, completion="program", completion_tolerance=None):
+        pass
+
+    def movels(self, coordinates_list, acceleration, velocity, gripper=None, report=None, completion="program",
+               completion_tolerance=None):
+        pass
+
+    def stream_trajectory(self, path, acceleration, velocity, report=None, completion="program",
+                          completion_tolerance=None):
         pass
 
-    def movel(self, coordinates_and_angles, acceleration, velocity, pose_object=True, relative=False):
+    def run_sequence(self, steps, report=None):
         pass
 
-    def movels(self, coordinates_list, acceleration, velocity):
+    def compile_program(self, steps):
         pass
 
-    def __move(self, direction, distance, acceleration, velocity):
+    def run_program(self, program, offset, speed, report=None):
         pass
 
-    def up(self, z, acceleration, velocity):
+    def __move(self, direction, distance, acceleration, velocity, report=None, completion="program",
+               completion_tolerance=None):
         pass
 
-    def down(self, z, acceleration, velocity):
+    def up(self, z, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
         pass
 
-    def left(self, x, acceleration, velocity):
+    def down(self, z, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
         pass
 
-    def right(self, x, acceleration, velocity):
+    def left(self, x, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
         pass
 
-    def forward(self, y, acceleration, velocity):
+    def right(self, x, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
         pass
 
-    def backward(self, y, acceleration, velocity):
+    def forward(self, y, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
         pass
 
-    def __rotate(self, axis, angle, acceleration, velocity):
+    def backward(self, y, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
         pass
 
-    def roll(self, rx, acceleration, velocity):
+    def __rotate(self, axis, angle, acceleration, velocity, report=None, completion="program",
+                 completion_tolerance=None):
         pass
 
-    def pitch(self, ry, acceleration, velocity):
+    def roll(self, rx, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
         pass
 
-    def yaw(self, rz, acceleration, velocity):
+    def pitch(self, ry, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
+        pass
+
+    def yaw(self, rz, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
         pass
 
     def set_velocity(self, velocity):
@@ -122,6 +194,21 @@ class UrxEService:
     def get_current_tool_position(self):
         pass
 
+    def forward_kinematics(self, joint_positions_list):
+        pass
+
+    def inverse_kinematics(self, poses, reference_joint_positions=None, all_solutions=False):
+        pass
+
+    def get_state_history(self, start=None, end=None, max_points=1000, method="lttb"):
+        pass
+
+    def get_history_stats(self):
+        pass
+
+    def get_startup_timings(self):
+        pass
+
     def __start_bot(self):
         pass
 
@@ -131,7 +218,87 @@ class UrxEService:
     def reset(self):
         pass
 
-    def __wait_for_completion(self):
+    def get_estimator_stats(self):
+        pass
+
+    def stop(self, mode="joint", deceleration=None):
+        pass
+
+    def get_motion_stats(self):
+        return self._dispatcher.get_stats()
+
+    def record_timeline(self, correlation_id, event, timestamp=None, **details):
+        """
+            Record an event of the request with the given correlation ID, see TimelineStore.record.
+        """
+        self._timeline.record(correlation_id, event, timestamp, **details)
+
+    def get_timeline(self, correlation_id, max_points=100):
+        """
+            Get the timeline of a request with the robot states recorded while its motion ran.
+
+            Parameters
+            ----------
+            correlation_id : str
+                The correlation ID of the request.
+            max_points : int, optional
+                The maximum number of robot states returned. Default is 100.
+
+            Returns
+            -------
+            dict or None
+                The timeline of the request, with the state history from its motion being sent until it finished,
+                or until now while it runs. None if the correlation ID is unknown.
+        """
+        timeline = self._timeline.get(correlation_id)
+        if timeline is None:
+            return None
+        events = timeline["events"]
+        if "sent" in events:
+            timeline["states"] = self._history.query(events["sent"], events.get("finished", time.time()),
+                                                     max_points)
+        return timeline
+
+    def get_timeline_stats(self):
+        return self._timeline.get_stats()
+
+    def queue_motion(self, step, client=None, correlation_id=None):
+        """
+            Queue a motion to run as soon as the robot is done with the motions queued before it, without waiting
+            for it.
+
+            Parameters
+            ----------
+            step : dict
+                The motion, a movej or movel sequence step.
+            client : str, optional
+                The client the robot time is charged to.
+            correlation_id : str, optional
+                The correlation ID of the request, the timeline of the motion is recorded under it.
+
+            Returns
+            -------
+            dict
+                The position of the motion in the queue and the depth of the queue.
+
+            Raises
+            ------
+            MotionRejectedError
+                If the queue is full.
+        """
+        self._logger.info(f"Queueing pipelined {step['type']}")
+        return self._pipeline.submit(step, client, correlation_id)
+
+    def get_pipeline_stats(self):
+        return {**self._pipeline.get_stats(), "idle": self._idle.get_stats()}
+
+    def __flush_pipeline(self):
+        pass
+
+    def __record(self, event):
+        pass
+
+    def __wait_for_completion(self, timeout=None, progress=None, convergence=None):
         pass
 
 
@@ -139,7 +306,12 @@ class DefaultUrxEService(UrxEService):
 
     def __init__(self, logger: Logger):
         super().__init__(logger)
+        # Motions and stops write to the same socket, a stop must not interleave its bytes with a motion's.
+        self._send_lock = threading.Lock()
+        # Whether the program of the last motion may still run, the motion having completed on convergence.
+        self._lingering_program = False
         self.__start_bot()
+        self._pipeline.start(self.__run_pipeline)
 
     def get_connection_status(self):
         """
@@ -153,26 +325,37 @@ class DefaultUrxEService(UrxEService):
         self._logger.info("Getting connection status")
         return self._s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
 
+    @dispatched
     def open_gripper(self):
         """
             Open the gripper fully.
+
+            Returns
+            -------
+            dict
+                The final position of the gripper, whether it detected an object and its object status code.
         """
         self._logger.info("Opening gripper")
-        self._robotiq_gripper.open_gripper()
-        time.sleep(1)
-        self._logger.info("Gripper opened")
-        return  # TODO. return actual status of gripper
+        state = self.__gripper_action(0)
+        self._logger.info(f"Gripper opened: {state}")
+        return state
 
+    @dispatched
     def close_gripper(self):
         """
             Close the gripper fully.
+
+            Returns
+            -------
+            dict
+                The final position of the gripper, whether it detected an object and its object status code.
         """
         self._logger.info("Closing gripper")
-        self._robotiq_gripper.close_gripper()
-        time.sleep(1)
-        self._logger.info("Gripper closed")
-        return  # TODO. return actual status of gripper
+        state = self.__gripper_action(255)
+        self._logger.info(f"Gripper closed: {state}")
+        return state
 
+    @dispatched
     def partial_gripper(self, amount):
         """
            Open or close the gripper partially to a given amount.
@@ -181,14 +364,42 @@ class DefaultUrxEService(UrxEService):
            ----------
            amount : int
                The amount to open or close the gripper. 0 for fully open, 255 for fully closed.
+
+           Returns
+           -------
+           dict
+               The final position of the gripper, whether it detected an object and its object status code.
         """
         self._logger.info(f"Partially opening/closing gripper to {amount}")
-        self._robotiq_gripper.gripper_action(amount)
-        time.sleep(1)
-        self._logger.info(f"Gripper partially opened/closed to {amount}")
-        return  # TODO. return actual status of gripper
+        state = self.__gripper_action(amount)
+        self._logger.info(f"Gripper partially opened/closed to {amount}: {state}")
+        return state
+
+    def __gripper_action(self, amount):
+        """
+            Move the gripper and return as soon as it stops, reading its status from the gripper socket.
+
+            Without the gripper socket, the action runs as a URScript program that waits a fixed time and the
+            final state is unknown.
+        """
+        self.__record("sent")
+        if self._gripper is None:
+            # The program of urx gripper_action, sent under the send lock so that a stop cancels it like a motion.
+            wait = 2.0
+            urscript = self._robotiq_gripper._get_new_urscript()
+            urscript._set_gripper_position(amount)
+            urscript._sleep(wait)
+            self.__send_with(lambda: self._rob.send_program(urscript()))
+            time.sleep(wait)
+            state = {"position": None, "object_detected": None, "object_status": None}
+        else:
+            state = self._gripper.move_and_wait(amount, self._gripper_timeout_limit)
+        self.__record("finished")
+        return state
 
-    def movej(self, joint_positions, acceleration, velocity, pose_object=True, relative=False):
+    @dispatched
+    def movej(self, joint_positions, acceleration, velocity, pose_object=True, relative=False, gripper=None,
+              report=None, completion="program", completion_tolerance=None):
         """
            Move to a given joint positions with a given acceleration and velocity.
 
@@ -204,6 +415,18 @@ class DefaultUrxEService(UrxEService):
                A flag indicating whether the joint positions are a pose object or a list. Default is True.
            relative : bool, optional
                A flag indicating whether the joint positions are relative to the current ones or absolute. Default is False.
+           gripper : int, optional
+               If given, the gripper is moved to this position (0 to 255) while the arm moves.
+           report : dict, optional
+               If given, filled with the estimated duration, the measured duration, the timeout of the motion and
+               the condition that completed it.
+           completion : str, optional
+               "program" to wait for the program to end, "converged" to return as soon as the robot is still at the
+               target. Default is "program".
+           completion_tolerance : float, optional
+               The distance to the target in meters, or radians for joint positions, below which the robot reached
+               it when completing on convergence. Default is CONVERGENCE_POSITION_TOLERANCE or
+               CONVERGENCE_JOINT_TOLERANCE.
 
            Returns
            -------
@@ -216,13 +439,18 @@ class DefaultUrxEService(UrxEService):
             f"Moving to joint positions: {joint_positions} , with acceleration: {acceleration} and velocity: {velocity}")
         encoded_instruction = parse_movej_instruction(joint_positions, acceleration, velocity, pose_object, relative)
         print(f"Encoded instruction: {encoded_instruction}")
-        self._s.send(encoded_instruction)
-        self.__wait_for_completion()
+        estimate = self._estimator.estimate_movej(self._rob.getj(), joint_positions, acceleration, velocity,
+                                                  pose_object, relative)
+        convergence = self.__convergence(completion, joint_positions, pose_object, relative, completion_tolerance)
+        self.__run_motion("movej", estimate, lambda: self.__send(self.__mark(encoded_instruction)), gripper, report,
+                          convergence=convergence)
         self._logger.info(
             f"Moved to joint positions: {joint_positions}, with acceleration: {acceleration} and velocity: {velocity}")
         return self.get_current_pose()
 
-    def movel(self, coordinates_and_angles, acceleration, velocity, pose_object=True, relative=False):
+    @dispatched
+    def movel(self, coordinates_and_angles, acceleration, velocity, pose_object=True, relative=False, gripper=None,
+              report=None, completion="program", completion_tolerance=None):
         """
             Move to a given coordinates and angles with a given acceleration and velocity.
 
@@ -238,6 +466,18 @@ class DefaultUrxEService(UrxEService):
                 A flag indicating whether the coordinates and angles are a pose object or a list. Default is True.
             relative : bool, optional
                 A flag indicating whether the coordinates and angles are relative to the current ones or absolute. Default is False.
+            gripper : int, optional
+                If given, the gripper is moved to this position (0 to 255) while the arm moves.
+            report : dict, optional
+                If given, filled with the estimated duration, the measured duration, the timeout of the motion and
+                the condition that completed it.
+            completion : str, optional
+                "program" to wait for the program to end, "converged" to return as soon as the robot is still at
+                the target, the last coordinates for movels. Default is "program".
+            completion_tolerance : float, optional
+                The distance to the target in meters, or radians for joint positions, below which the robot reached
+                it when completing on convergence. Default is CONVERGENCE_POSITION_TOLERANCE or
+                CONVERGENCE_JOINT_TOLERANCE.
 
             Returns
             -------
@@ -251,14 +491,20 @@ class DefaultUrxEService(UrxEService):
             f"velocity: {velocity}")
         encoded_instruction = parse_movel_instruction(coordinates_and_angles, acceleration, velocity, pose_object,
                                                       relative)
-        self._s.send(encoded_instruction)
-        self.__wait_for_completion()
+        estimate = self._estimator.estimate_movel(self._rob.getl(), coordinates_and_angles, acceleration, velocity,
+                                                  pose_object, relative)
+        convergence = self.__convergence(completion, coordinates_and_angles, pose_object, relative,
+                                         completion_tolerance)
+        self.__run_motion("movel", estimate, lambda: self.__send(self.__mark(encoded_instruction)), gripper, report,
+                          convergence=convergence)
         self._logger.info(
             f"Moved to coordinates and angles: {coordinates_and_angles}, with acceleration: {acceleration} and "
             f"velocity: {velocity}")
         return self.get_current_pose()
 
-    def movels(self, coordinates_list, acceleration, velocity):
+    @dispatched
+    def movels(self, coordinates_list, acceleration, velocity, gripper=None, report=None, completion="program",
+               completion_tolerance=None):
         """
             Move to a list of coordinates with a given acceleration and velocity.
 
@@ -270,6 +516,18 @@ class DefaultUrxEService(UrxEService):
                 The acceleration to use for the movement in rad/s^2.
             velocity : float
                 The velocity to use for the movement in rad/s.
+            gripper : int, optional
+                If given, the gripper is moved to this position (0 to 255) while the arm moves.
+            report : dict, optional
+                If given, filled with the estimated duration, the measured duration, the timeout of the motion and
+                the condition that completed it.
+            completion : str, optional
+                "program" to wait for the program to end, "converged" to return as soon as the robot is still at
+                the target, the last coordinates for movels. Default is "program".
+            completion_tolerance : float, optional
+                The distance to the target in meters, or radians for joint positions, below which the robot reached
+                it when completing on convergence. Default is CONVERGENCE_POSITION_TOLERANCE or
+                CONVERGENCE_JOINT_TOLERANCE.
 
             Returns
             -------
@@ -280,13 +538,220 @@ class DefaultUrxEService(UrxEService):
                                                                       self._velocity)
         self._logger.info(
             f"Moving to coordinates list: {str(coordinates_list)}, with acceleration: {acceleration} and velocity: {velocity}")
-        self._rob.movels(coordinates_list, acc=acceleration, vel=velocity, wait=False)
-        self.__wait_for_completion()
+        estimate = self._estimator.estimate_movels(self._rob.getl(), coordinates_list, acceleration, velocity)
+        convergence = self.__convergence(completion, coordinates_list[-1], True, False, completion_tolerance)
+        self.__run_motion("movels", estimate,
+                          lambda: self.__send_with(lambda: self._rob.movels(coordinates_list, acc=acceleration,
+                                                                            vel=velocity, wait=False)),
+                          gripper, report, convergence=convergence)
         self._logger.info(
             f"Moved to coordinates list: {str(coordinates_list)}, with acceleration: {acceleration} and velocity: {velocity}")
         return self.get_current_pose()
 
-    def __move(self, direction, distance, acceleration, velocity):
+    @dispatched
+    def stream_trajectory(self, path, acceleration, velocity, report=None, completion="program",
+                          completion_tolerance=None):
+        """
+            Move through a spooled trajectory of any length, sending it to the robot in programs of at most
+            STREAM_CHUNK_SIZE waypoints.
+
+            Only one chunk is on the controller at a time. The next chunk is read and compiled while the robot runs
+            the current one and is sent as soon as the robot settled at its last waypoint, so the robot stops briefly
+            between chunks and the memory used does not grow with the trajectory.
+
+            Parameters
+            ----------
+            path : str
+                The spool file of the trajectory, written by spool_trajectory.
+            acceleration : float
+                The acceleration to use for the movement in m/s^2.
+            velocity : float
+                The velocity to use for the movement in m/s.
+            report : dict, optional
+                If given, filled with the number of waypoints and chunks, the estimated and measured durations and
+                the condition that completed the last chunk.
+            completion : str, optional
+                "program" to wait for the program of the last chunk to end, "converged" to return as soon as the
+                robot is still at the last waypoint. Default is "program".
+            completion_tolerance : float, optional
+                The distance to the last waypoint in meters below which the robot reached it when completing on
+                convergence. Default is CONVERGENCE_POSITION_TOLERANCE.
+
+            Returns
+            -------
+            list
+                The new pose vector after the movement.
+        """
+        acceleration, velocity = get_acceleration_and_velocity_to_use(acceleration, velocity, self._acceleration,
+                                                                      self._velocity)
+        self._logger.info(f"Streaming trajectory in chunks of {STREAM_CHUNK_SIZE} waypoints, with acceleration: "
+                          f"{acceleration} and velocity: {velocity}")
+        # The timeline of the request spans every chunk, it is recorded here rather than by each chunk.
+        correlation_id, self._correlation_id = self._correlation_id, None
+        chunks = read_chunks(path, STREAM_CHUNK_SIZE)
+        chunk, pose = next(chunks), self._rob.getl()
+        compiled = [self.__compile_chunk(chunk, pose, acceleration, velocity, correlation_id)]
+        waypoints, count, estimated_duration, started = 0, 0, 0.0, None
+        try:
+            while chunk is not None:
+                following = next(chunks, None)
+                # The chunks before the last complete on convergence for the next one to follow right away.
+                convergence = self.__convergence(completion if following is None else "converged", chunk[-1], True,
+                                                 False, completion_tolerance)
+                estimate = self._estimator.estimate_movels(pose, chunk.tolist(), acceleration, velocity)
+                send = functools.partial(self.__send_chunk, compiled, following, chunk[-1], acceleration, velocity,
+                                         correlation_id)
+                chunk_report = {}
+                self.__run_motion("movels", estimate, send, report=chunk_report, convergence=convergence)
+                if started is None:
+                    started = time.time() - chunk_report["duration"]
+                    self.__record_stream(correlation_id, "started", started)
+                waypoints, count = waypoints + len(chunk), count + 1
+                estimated_duration += chunk_report["estimated_duration"] or 0.0
+                chunk, pose = following, chunk[-1]
+        finally:
+            self._correlation_id = correlation_id
+        self.__record("finished")
+        if report is not None:
+            report["waypoints"] = waypoints
+            report["chunks"] = count
+            report["estimated_duration"] = estimated_duration
+            report["duration"] = time.time() - started
+            report["completed_by"] = chunk_report["completed_by"]
+        self._logger.info(f"Streamed trajectory of {waypoints} waypoints in {count} chunks")
+        return self.get_current_pose()
+
+    def __compile_chunk(self, chunk, start_pose, acceleration, velocity, correlation_id):
+        steps = [{"type": "movel", "coordinates_and_angles": waypoint, "acceleration": acceleration,
+                  "velocity": velocity} for waypoint in chunk.tolist()]
+        program = compile_sequence(assign_blends(steps, start_pose, STREAM_BLEND_RADIUS))
+        return program if correlation_id is None else mark_program(program, correlation_id)
+
+    def __send_chunk(self, compiled, following, end_pose, acceleration, velocity, correlation_id):
+        self.__send(compiled.pop())
+        self.__record_stream(correlation_id, "sent", time.time())
+        # The robot runs the chunk meanwhile, the next one is ready to send as soon as the robot settles.
+        if following is not None:
+            compiled.append(self.__compile_chunk(following, end_pose, acceleration, velocity, correlation_id))
+
+    def __record_stream(self, correlation_id, event, timestamp):
+        if correlation_id is not None:
+            self._timeline.record(correlation_id, event, timestamp)
+
+    @dispatched
+    def run_sequence(self, steps, report=None):
+        """
+            Run a sequence of arm and gripper steps as a single robot program.
+
+            Parameters
+            ----------
+            steps : list
+                The steps, each a dict with a type (movej, movel, gripper or wait) and its parameters. Arm steps
+                without acceleration or velocity use the configured ones.
+            report : dict, optional
+                If given, filled with the estimated duration, the measured duration, the timeout of the program and
+                the timing of each step.
+
+            Returns
+            -------
+            list
+                The new pose vector after the sequence.
+        """
+        steps = [self.__resolve_step(step) for step in steps]
+        gripper_steps = sum(1 for step in steps if step["type"] == "gripper")
+        self._logger.info(f"Running sequence of {len(steps)} steps")
+        program = compile_sequence(steps)
+        read_gripper = None if self._gripper is None else self._gripper.is_stopped_at
+        progress = SequenceProgress(steps, self._rob.getl, self._rob.getj, read_gripper)
+        estimate = self._estimator.estimate_sequence(self._rob.getj(), steps)
+        self.__run_motion("sequence", estimate, lambda: self.__send(self.__mark(program)), report=report,
+                          progress=progress, extra_timeout=gripper_steps * self._gripper_timeout_limit)
+        if report is not None:
+            report["steps"] = progress.get_timings()
+        self._logger.info(f"Ran sequence of {len(steps)} steps")
+        return self.get_current_pose()
+
+    def __resolve_step(self, step):
+        if step["type"] not in ARM_STEPS:
+            return step
+        acceleration, velocity = get_acceleration_and_velocity_to_use(step.get("acceleration"), step.get("velocity"),
+                                                                      self._acceleration, self._velocity)
+        return {**step, "acceleration": acceleration, "velocity": velocity}
+
+    def compile_program(self, steps):
+        """
+            Compile a sequence into a parameterized program body to run it later with run_program.
+
+            Arm steps without acceleration or velocity use the configured ones at the time of compilation.
+
+            Parameters
+            ----------
+            steps : list
+                The steps, each a dict with a type (movej, movel, gripper or wait) and its parameters.
+
+            Returns
+            -------
+            tuple
+                The resolved steps, the encoded program body and the estimated duration of the program after its
+                first arm step, or None if it cannot be estimated.
+        """
+        steps = [self.__resolve_step(step) for step in steps]
+        self._logger.info(f"Compiling program of {len(steps)} steps")
+        body = compile_sequence_body(steps, parameterized=True)
+        return steps, body, self.__path_estimate(steps, self._rob.getj())
+
+    @dispatched
+    def run_program(self, program, offset, speed, report=None):
+        """
+            Run a compiled program with the given parameters, without validating or encoding its steps again.
+
+            Parameters
+            ----------
+            program : CachedProgram
+                The program to run.
+            offset : list
+                The translation (x, y, z) in meters added to the pose targets of the program.
+            speed : float
+                The factor the velocities of the program are scaled by.
+            report : dict, optional
+                If given, filled with the estimated duration, the measured duration, the timeout of the program and
+                the timing of each step.
+
+            Returns
+            -------
+            list
+                The new pose vector after the program.
+        """
+        self._logger.info(f"Running program {program.name} with offset: {offset} and speed: {speed}")
+        payload = program.encode(offset, speed)
+        estimate = self.__program_estimate(program, offset, speed, self._rob.getj())
+        read_gripper = None if self._gripper is None else self._gripper.is_stopped_at
+        progress = SequenceProgress(program.steps, self._rob.getl, self._rob.getj, read_gripper, offset)
+        self.__run_motion("program", estimate, lambda: self.__send(self.__mark(payload)), report=report,
+                          progress=progress, extra_timeout=program.gripper_steps * self._gripper_timeout_limit)
+        if report is not None:
+            report["steps"] = progress.get_timings()
+        self._logger.info(f"Ran program {program.name}")
+        return self.get_current_pose()
+
+    def __path_estimate(self, steps, current_joints):
+        # The approach to the first arm target depends on where the robot is when the program is invoked.
+        approach_end = next((index + 1 for index, step in enumerate(steps) if step["type"] in ARM_STEPS), 0)
+        total = self._estimator.estimate_sequence(current_joints, steps)
+        approach = self._estimator.estimate_sequence(current_joints, steps[:approach_end])
+        return None if total is None or approach is None else total - approach
+
+    def __program_estimate(self, program, offset, speed, current_joints):
+        approach_step = program.get_approach_step(offset)
+        approach = 0.0
+        if approach_step is not None:
+            approach = self._estimator.estimate_sequence(current_joints, [approach_step])
+        if approach is None or program.path_estimate is None:
+            return None
+        return (approach + program.path_estimate) / speed
+
+    def __move(self, direction, distance, acceleration, velocity, report=None, completion="program",
+               completion_tolerance=None):
         """
         Move in a given direction by a given distance.
 
@@ -311,9 +776,11 @@ class DefaultUrxEService(UrxEService):
                                                                       self._velocity)
         p = self.get_current_pose()
         p[direction] += distance
-        return self.movel(p, acceleration, velocity)
+        return self.movel(p, acceleration, velocity, report=report, completion=completion,
+                          completion_tolerance=completion_tolerance)
 
-    def up(self, z, acceleration, velocity):
+    @dispatched
+    def up(self, z, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
         """
         Move up in csys z.
 
@@ -334,9 +801,10 @@ class DefaultUrxEService(UrxEService):
         acceleration, velocity = get_acceleration_and_velocity_to_use(acceleration, velocity, self._acceleration,
                                                                       self._velocity)
         z = self._amount_movement if z is None else z
-        return self.__move(2, z, acceleration, velocity)
+        return self.__move(2, z, acceleration, velocity, report, completion, completion_tolerance)
 
-    def down(self, z, acceleration, velocity):
+    @dispatched
+    def down(self, z, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
         """
         Move down in csys z.
 
@@ -357,9 +825,10 @@ class DefaultUrxEService(UrxEService):
         acceleration, velocity = get_acceleration_and_velocity_to_use(acceleration, velocity, self._acceleration,
                                                                       self._velocity)
         z = self._amount_movement if z is None else z
-        return self.__move(2, -z, acceleration, velocity)
+        return self.__move(2, -z, acceleration, velocity, report, completion, completion_tolerance)
 
-    def left(self, x, acceleration, velocity):
+    @dispatched
+    def left(self, x, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
         """
         Move left in csys x.
 
@@ -380,9 +849,10 @@ class DefaultUrxEService(UrxEService):
         acceleration, velocity = get_acceleration_and_velocity_to_use(acceleration, velocity, self._acceleration,
                                                                       self._velocity)
         x = self._amount_movement if x is None else x
-        return self.__move(0, -x, acceleration, velocity)
+        return self.__move(0, -x, acceleration, velocity, report, completion, completion_tolerance)
 
-    def right(self, x, acceleration, velocity):
+    @dispatched
+    def right(self, x, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
         """
         Move right in csys x.
 
@@ -403,9 +873,10 @@ class DefaultUrxEService(UrxEService):
         acceleration, velocity = get_acceleration_and_velocity_to_use(acceleration, velocity, self._acceleration,
                                                                       self._velocity)
         x = self._amount_movement if x is None else x
-        return self.__move(0, x, acceleration, velocity)
+        return self.__move(0, x, acceleration, velocity, report, completion, completion_tolerance)
 
-    def forward(self, y, acceleration, velocity):
+    @dispatched
+    def forward(self, y, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
         """
         Move forward in csys y.
 
@@ -426,9 +897,10 @@ class DefaultUrxEService(UrxEService):
         acceleration, velocity = get_acceleration_and_velocity_to_use(acceleration, velocity, self._acceleration,
                                                                       self._velocity)
         y = self._amount_movement if y is None else y
-        return self.__move(1, y, acceleration, velocity)
+        return self.__move(1, y, acceleration, velocity, report, completion, completion_tolerance)
 
-    def backward(self, y, acceleration, velocity):
+    @dispatched
+    def backward(self, y, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
         """
         Move backward in csys y.
 
@@ -449,9 +921,10 @@ class DefaultUrxEService(UrxEService):
         y = self._amount_movement if y is None else y
         acceleration, velocity = get_acceleration_and_velocity_to_use(acceleration, velocity, self._acceleration,
                                                                       self._velocity)
-        return self.__move(1, -y, acceleration, velocity)
+        return self.__move(1, -y, acceleration, velocity, report, completion, completion_tolerance)
 
-    def __rotate(self, axis, angle, acceleration, velocity):
+    def __rotate(self, axis, angle, acceleration, velocity, report=None, completion="program",
+                 completion_tolerance=None):
         """
         Rotate around a given axis by a given angle.
 
@@ -476,9 +949,11 @@ class DefaultUrxEService(UrxEService):
                                                                       self._velocity)
         p = self.get_current_pose()
         p[axis] += angle
-        return self.movel(p, acceleration, velocity)
+        return self.movel(p, acceleration, velocity, report=report, completion=completion,
+                          completion_tolerance=completion_tolerance)
 
-    def roll(self, rx, acceleration, velocity):
+    @dispatched
+    def roll(self, rx, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
         """
         Rotate around csys x axis.
 
@@ -499,9 +974,10 @@ class DefaultUrxEService(UrxEService):
         acceleration, velocity = get_acceleration_and_velocity_to_use(acceleration, velocity, self._acceleration,
                                                                       self._velocity)
         rx = self._amount_rotation if rx is None else rx
-        return self.__rotate(3, rx, acceleration, velocity)
+        return self.__rotate(3, rx, acceleration, velocity, report, completion, completion_tolerance)
 
-    def pitch(self, ry, acceleration, velocity):
+    @dispatched
+    def pitch(self, ry, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
         """
         Rotate around csys y axis.
 
@@ -522,9 +998,10 @@ class DefaultUrxEService(UrxEService):
         acceleration, velocity = get_acceleration_and_velocity_to_use(acceleration, velocity, self._acceleration,
                                                                       self._velocity)
         ry = self._amount_rotation if ry is None else ry
-        return self.__rotate(4, ry, acceleration, velocity)
+        return self.__rotate(4, ry, acceleration, velocity, report, completion, completion_tolerance)
 
-    def yaw(self, rz, acceleration, velocity):
+    @dispatched
+    def yaw(self, rz, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
         """
         Rotate around csys z axis.
 
@@ -545,7 +1022,7 @@ class DefaultUrxEService(UrxEService):
         acceleration, velocity = get_acceleration_and_velocity_to_use(acceleration, velocity, self._acceleration,
                                                                       self._velocity)
         rz = self._amount_rotation if rz is None else rz
-        return self.__rotate(5, rz, acceleration, velocity)
+        return self.__rotate(5, rz, acceleration, velocity, report, completion, completion_tolerance)
 
     def set_velocity(self, velocity):
         """
@@ -779,32 +1256,205 @@ class DefaultUrxEService(UrxEService):
                 The current tool position of the robot.
         """
         self._logger.info(f"Getting current tool position")
-        tool_position_vector = self._rob.get_pos()
-        tool_position = [tool_position_vector.x, tool_position_vector.y, tool_position_vector.z]
+        if self._tcp is not None:
+            # Derived from the joint positions urx keeps from the robot state, without a round trip to the robot.
+            tool_position = batch_forward_kinematics(self._rob.getj(), self._tcp)[0, :3].tolist()
+        else:
+            # The local kinematics only know the TCP of the controller when TCP_OFFSET is set.
+            tool_position_vector = self._rob.get_pos()
+            tool_position = [tool_position_vector.x, tool_position_vector.y, tool_position_vector.z]
         self._logger.info(f"Got current tool position: {tool_position}")
         return tool_position
 
+    def forward_kinematics(self, joint_positions_list):
+        """
+        Compute the poses of a batch of joint configurations locally, without asking the robot.
+
+        Parameters
+        ----------
+        joint_positions_list : list
+            The list of joint positions in radians. Each element is a list of 6 values.
+
+        Returns
+        -------
+        list
+            The pose (x, y, z, rx, ry, rz) of each joint configuration.
+        """
+        self._logger.info(f"Computing forward kinematics of {len(joint_positions_list)} joint positions")
+        return batch_forward_kinematics(joint_positions_list, self._tcp).tolist()
+
+    def inverse_kinematics(self, poses, reference_joint_positions=None, all_solutions=False):
+        """
+        Compute the joint positions of a batch of poses locally, without asking the robot.
+
+        Parameters
+        ----------
+        poses : list
+            The list of poses (x, y, z, rx, ry, rz) in meters and radians. Each element is a list of 6 values.
+        reference_joint_positions : list, optional
+            The joint positions used to pick the closest solution. Default is the current joint positions.
+        all_solutions : bool, optional
+            A flag indicating whether to return every solution instead of the closest one. Default is False.
+
+        Returns
+        -------
+        list
+            The closest joint positions of each pose, or None if it is unreachable. With all_solutions, the list
+            of every solution of each pose.
+        """
+        self._logger.info(f"Computing inverse kinematics of {len(poses)} poses")
+        if reference_joint_positions is None:
+            reference_joint_positions = self._rob.getj()
+        return solve_inverse_kinematics(poses, reference_joint_positions, self._tcp, all_solutions)
+
+    def get_state_history(self, start=None, end=None, max_points=1000, method="lttb"):
+        """
+        Get the recorded poses and joint positions of the robot within a time range.
+
+        Parameters
+        ----------
+        start : float, optional
+            The start of the range in seconds since the epoch. Default is the oldest sample.
+        end : float, optional
+            The end of the range in seconds since the epoch. Default is the newest sample.
+        max_points : int, optional
+            The maximum number of samples returned, larger ranges are downsampled. Default is 1000.
+        method : str, optional
+            The downsampling method, lttb or minmax. Default is lttb.
+
+        Returns
+        -------
+        dict
+            The timestamps, poses and joint positions of the samples, and the number of samples in the range.
+        """
+        self._logger.info(f"Getting state history from {start} to {end} with at most {max_points} points")
+        return self._history.query(start, end, max_points, method)
+
+    def get_history_stats(self):
+        """
+        Get the size, memory use and time span of the state history.
+
+        Returns
+        -------
+        dict
+            The capacity, number of samples, memory use in bytes, sampling rate, oldest and newest timestamps, and
+            the name of the shared memory state snapshot.
+        """
+        return {**self._history.get_stats(), "rate": STATE_HISTORY_RATE,
+                "snapshot": self._snapshot.name if self._snapshot is not None else None}
+
+    def __read_state(self):
+        return self._rob.getl(), self._rob.getj()
+
+    def get_startup_timings(self):
+        """
+            Get the timings of the last connection to the robot.
+
+            Returns
+            -------
+            dict
+                When the connection started, its total duration and the duration of each of its steps, in seconds.
+        """
+        return self._startup_timings
+
     def __start_bot(self):
         """
            Start the robot and the gripper and connect to the socket.
+
+           The robot, the gripper socket and the program socket are independent connections, they are established
+           concurrently so the startup takes as long as the slowest of them.
        """
+        started_at = time.time()
+        start = time.perf_counter()
+        steps = {}
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="start-bot") as executor:
+            futures = {name: executor.submit(self.__timed, steps, name, connect) for name, connect in
+                       (("robot", self.__connect_robot), ("gripper", self.__connect_gripper),
+                        ("socket", self.__connect_socket))}
+        connections, error = {}, None
+        for name, future in futures.items():
+            try:
+                connections[name] = future.result()
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            self.__close_connections(connections)
+            raise error
+        (self._rob, self._robotiq_gripper), self._gripper, self._s = (connections["robot"], connections["gripper"],
+                                                                      connections["socket"])
+        total = time.perf_counter() - start
+        self._startup_timings = {"started_at": started_at, "total": total, "steps": steps}
+        self._logger.info(f"Connected to the robot in {total:.2f} s "
+                          f"({', '.join(f'{name} {seconds:.2f} s' for name, seconds in steps.items())})")
+        self._recorder = StateRecorder(self._history, self.__read_state, STATE_HISTORY_RATE, self._logger,
+                                       snapshot=self._snapshot)
+        self._recorder.start()
+
+    @staticmethod
+    def __timed(steps, name, connect):
+        start = time.perf_counter()
+        try:
+            return connect(steps)
+        finally:
+            steps[name] = time.perf_counter() - start
+
+    def __connect_robot(self, steps):
+        # urx and math3d are only needed with a robot, they are not loaded by the mock service.
+        import urx
+        from urx import robotiq_two_finger_gripper
+
         self._logger.info(f'Establishing IP to: {HOST}')
-        self._rob = urx.Robot(HOST)
-        self._robotiq_gripper = robotiq_two_finger_gripper.Robotiq_Two_Finger_Gripper(self._rob)
+        rob = urx.Robot(HOST)
         self._logger.info(f'Established IP to: {HOST}')
-        self._s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        return rob, robotiq_two_finger_gripper.Robotiq_Two_Finger_Gripper(rob)
+
+    def __connect_gripper(self, steps):
+        gripper = RobotiqGripper(GRIPPER_HOST)
+        try:
+            gripper.connect()
+            self._logger.info(f'Connected to gripper socket at {GRIPPER_HOST}')
+            return gripper
+        except OSError as e:
+            self._logger.warning(f'Gripper socket unavailable, gripper status will not be read: {e}')
+            return None
+
+    def __connect_socket(self, steps):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self._logger.info(f'Connecting to IP: {HOST} and PORT: {PORT} via socket')
-        self._s.connect((HOST, PORT))
-        time.sleep(0.5)
+        try:
+            s.connect((HOST, PORT))
+            connected = time.perf_counter()
+            # The robot streams its state as soon as the interface is ready, the first bytes tell it accepts programs.
+            readable, _, _ = select.select([s], [], [], SOCKET_READY_TIMEOUT)
+            steps["socket_ready"] = time.perf_counter() - connected
+        except Exception:
+            s.close()
+            raise
+        if not readable:
+            self._logger.warning(f'No data from IP: {HOST} and PORT: {PORT} after {SOCKET_READY_TIMEOUT} s, '
+                                 f'sending programs anyway')
         self._logger.info(f'Connected to IP: {HOST} and PORT: {PORT} via socket')
+        return s
+
+    @staticmethod
+    def __close_connections(connections):
+        if "robot" in connections:
+            connections["robot"][0].close()
+        if connections.get("gripper") is not None:
+            connections["gripper"].close()
+        if "socket" in connections:
+            connections["socket"].close()
 
     def __stop_bot(self):
         """
             Stop the robot and the gripper and close the socket.
         """
         self._logger.info(f"Stopping robot")
+        self._recorder.stop()
         self._rob.close()
         self._s.close()
+        if self._gripper is not None:
+            self._gripper.close()
         self._logger.info(f"Stopped robot")
 
     def reset(self, emergency_stopped=False):
@@ -826,27 +1476,287 @@ class DefaultUrxEService(UrxEService):
         self.__start_bot()
         self._logger.info(f"Reset robot")
 
-    def __wait_for_completion(self):
+    def __run_pipeline(self, client):
+        self._dispatcher.run(lambda: self.__stream_pipeline(client), client)
+
+    def __stream_pipeline(self, client):
+        """
+            Run the pipelined motions of a client until none is left or another client waits for the robot.
+
+            The motions queued together run as a single program, blended into each other where possible. The
+            motions queued while it runs are sent as soon as the robot settled at its last target, without waiting
+            for the controller to end it.
+        """
+        while True:
+            items = self._pipeline.take(client)
+            if not items:
+                return
+            self.__run_batch(items)
+            if self._dispatcher.has_queued():
+                return
+
+    def __run_batch(self, items):
+        dispatched = time.time()
+        for item in items:
+            self._timeline.record(item.correlation_id, "dispatched", dispatched, method="pipeline")
+        steps = [{**self.__resolve_step(item.step), "correlation_id": item.correlation_id} for item in items]
+        steps = assign_blends(steps, self._rob.getl(), PIPELINE_BLEND_RADIUS)
+        self._logger.info(f"Running {len(steps)} pipelined motions, {sum('blend' in step for step in steps)} "
+                          f"blended")
+        program = compile_sequence(steps)
+        progress = SequenceProgress(steps, self._rob.getl, self._rob.getj)
+        last = steps[-1]
+        target = last["joint_positions"] if last["type"] == "movej" else last["coordinates_and_angles"]
+        convergence = self.__convergence("converged", target, last.get("pose_object", True), False, None)
+        estimate = self._estimator.estimate_sequence(self._rob.getj(), steps)
+        report = {}
+        try:
+            self.__run_motion("sequence", estimate, lambda: self.__send_batch(program, items), report=report,
+                              progress=progress, convergence=convergence)
+        except Exception as e:
+            for item in items:
+                self._timeline.annotate(item.correlation_id, error=str(e))
+            raise
+        # The motions of the program start and finish one after the other from the start of the program.
+        finished = time.time()
+        started = finished - report["duration"]
+        for item, timing in zip(items, progress.get_timings()):
+            completed_at = finished if timing["completed_at"] is None else started + timing["completed_at"]
+            self._timeline.record(item.correlation_id, "started", started)
+            self._timeline.record(item.correlation_id, "finished", completed_at,
+                                  completed_by=report["completed_by"])
+            started = completed_at
+
+    def __send_batch(self, program, items):
+        self.__send(program)
+        sent = time.time()
+        for item in items:
+            self._timeline.record(item.correlation_id, "sent", sent)
+
+    def __flush_pipeline(self):
+        items = self._pipeline.flush()
+        for item in items:
+            self._timeline.annotate(item.correlation_id, error="Motion stopped before it was sent")
+        return len(items)
+
+    def __run_motion(self, kind, estimate, send, gripper=None, report=None, progress=None, extra_timeout=0.0,
+                     convergence=None):
+        """
+            Send a motion and wait for it with a timeout derived from its estimated duration.
+
+            Parameters
+            ----------
+            kind : str
+                The motion kind (movej, movel, movels) the estimator learns its correction factor for.
+            estimate : float or None
+                The physical duration estimate of the motion in seconds.
+            send : callable
+                Sends the motion to the robot.
+            gripper : int, optional
+                If given, the gripper is moved to this position (0 to 255) while the arm moves, and its final state
+                is added to the report.
+            report : dict, optional
+                If given, filled with the estimated duration, the measured duration and the timeout of the motion.
+            progress : SequenceProgress, optional
+                If given, updated while the program runs and finished when it completes.
+            extra_timeout : float, optional
+                Time added to the timeout for parts of the motion the estimator does not cover. Default is 0.
+            convergence : TargetConvergence, optional
+                If given, the motion completes as soon as the robot settled at its target, without waiting for the
+                program to end.
+        """
+        if gripper is not None and self._gripper is None:
+            raise RuntimeError("The gripper socket is not connected, the gripper cannot move during a motion")
+        estimated_duration = self._estimator.predict(kind, estimate)
+        timeout = self._estimator.get_timeout(kind, estimate, self._program_running_timeout_limit) + extra_timeout
+        self._logger.info(f"Estimated {kind} duration: {estimated_duration} s, timeout: {timeout} s")
+        if convergence is None and self._lingering_program:
+            self.__wait_for_lingering_program()
+        send()
+        self.__record("sent")
+        if gripper is not None:
+            self._gripper.move(gripper)
+        sent_at = time.time()
+        try:
+            duration, completed_by = self.__wait_for_completion(timeout, progress, convergence)
+        except RuntimeError:
+            # The motion is slower than predicted by at least the time waited, the next timeouts of its kind allow
+            # for it.
+            if time.time() - sent_at >= timeout:
+                self._estimator.observe_timeout(kind, estimate, time.time() - sent_at)
+            raise
+        if progress is not None:
+            progress.finish(duration)
+        # The estimator predicts the program durations the timeouts derive from, which convergence cuts short.
+        if completed_by == "program":
+            self._estimator.observe(kind, estimate, duration)
+        gripper_state = None
+        if gripper is not None:
+            gripper_state = self._gripper.wait_for_motion(gripper, self._gripper_timeout_limit)
+        if report is not None:
+            report["estimated_duration"] = estimated_duration
+            report["duration"] = duration
+            report["timeout"] = timeout
+            report["completed_by"] = completed_by
+            if gripper_state is not None:
+                report["gripper"] = gripper_state
+
+    def stop(self, mode="joint", deceleration=None):
+        """
+            Stop the robot, cancel the wait of the running motion and flush the queued motions.
+
+            The stop command is sent before anything else and without waiting for the running motion, which only
+            holds the socket while it sends its own program. A motion that did not send its program yet is cancelled
+            before the socket is released, it never sends it after the stop.
+
+            Parameters
+            ----------
+            mode : str, optional
+                "joint" to decelerate in joint space (stopj), "linear" in tool space (stopl). Default is "joint".
+            deceleration : float, optional
+                The deceleration in rad/s^2 for joint, m/s^2 for linear. Default is STOP_JOINT_DECELERATION or
+                STOP_LINEAR_DECELERATION.
+
+            Returns
+            -------
+            dict
+                Whether a motion was running and the number of queued motions flushed.
+        """
+        command = "stopl" if mode == "linear" else "stopj"
+        if deceleration is None:
+            deceleration = STOP_LINEAR_DECELERATION if mode == "linear" else STOP_JOINT_DECELERATION
+        with self._send_lock:
+            self._s.sendall(f"{command}({deceleration})\n".encode("utf-8"))
+            # The running motion is cancelled before the lock is released, so it cannot send its program after the
+            # stop. The pipeline is flushed first, or its worker would start the next pipelined motions.
+            flushed = self.__flush_pipeline()
+            running, dispatched = self._dispatcher.stop()
+        flushed += dispatched
+        self._idle.reset()
+        self._logger.info(f"Stopped robot with {command}({deceleration}), running motion: {running}, "
+                          f"flushed motions: {flushed}")
+        return {"running": running, "flushed": flushed}
+
+    def __send(self, data):
+        self.__send_with(lambda: self._s.sendall(data))
+
+    def __send_with(self, send):
+        # A stop cancels the running motion while holding the lock, the check and the send happen before or after it.
+        with self._send_lock:
+            if self._dispatcher.is_cancelled():
+                raise MotionCancelledError("Motion stopped before it was sent")
+            send()
+
+    def __convergence(self, completion, target, pose_object, relative, tolerance):
+        if completion != "converged":
+            return None
+        target = np.asarray(target, dtype=float)
+        if relative:
+            target = target + np.asarray(self._rob.getl() if pose_object else self._rob.getj(), dtype=float)
+        position_tolerance = CONVERGENCE_POSITION_TOLERANCE if tolerance is None else tolerance
+        joint_tolerance = CONVERGENCE_JOINT_TOLERANCE if tolerance is None else tolerance
+        return TargetConvergence(target, pose_object, self._rob.getl, self._rob.getj, self.__read_joint_speeds,
+                                 position_tolerance, CONVERGENCE_ROTATION_TOLERANCE, joint_tolerance,
+                                 CONVERGENCE_SPEED_TOLERANCE)
+
+    def __read_joint_speeds(self):
+        joint_data = self._rob.secmon.get_joint_data()
+        return [joint_data[f"qd_actual{joint}"] for joint in range(6)]
+
+    def __wait_for_lingering_program(self):
+        # The program of the last motion completed on convergence. A motion waiting for its own program to end
+        # would take the end of that one for its own, so it is sent once that one ended.
+        self._logger.info("Waiting for the program of the last motion to end")
+        waiting_start_time = time.time()
+        while self._rob.is_program_running() and time.time() - waiting_start_time < self._wait_timeout_limit:
+            if self._dispatcher.is_cancelled():
+                raise MotionCancelledError("Motion stopped before it was sent")
+            time.sleep(0.01)
+        self._lingering_program = False
+
+    def __mark(self, program):
+        return program if self._correlation_id is None else mark_program(program, self._correlation_id)
+
+    def __record(self, event):
+        if self._correlation_id is not None:
+            self._timeline.record(self._correlation_id, event)
+
+    def get_estimator_stats(self):
         """
-            Wait for the robot program to start and complete.
+            Get the correction factors learned by the motion duration estimator.
+
+            Returns
+            -------
+            dict
+                The correction factor and number of observations of each motion kind.
+        """
+        return self._estimator.get_stats()
+
+    def __wait_for_completion(self, timeout=None, progress=None, convergence=None):
+        """
+            Wait for the robot program to start and complete, or for the robot to settle at the target.
+
+            Parameters
+            ----------
+            timeout : float, optional
+                The time limit for the program to complete in seconds. Default is the program running timeout limit.
+            progress : SequenceProgress, optional
+                If given, updated with the running time while waiting.
+            convergence : TargetConvergence, optional
+                If given, the wait ends as soon as the robot settled at the target, while the program may still
+                run.
+
+            Returns
+            -------
+            tuple
+                The time the program was running in seconds, or since it was sent if the robot settled before the
+                program was seen running, and the condition that ended the wait, "program" or "converged".
 
             Raises
             ------
             RuntimeError
                 If the program does not start or complete within the timeout limits.
         """
+        timeout = self._program_running_timeout_limit if timeout is None else timeout
         self._logger.info("Waiting for program to start")
         waiting_start_time = time.time()
-        while not self._rob.is_program_running():
+        # The program of the last motion may still run, this one started once it replaced it and the robot moves.
+        lingering = convergence is not None and self._lingering_program
+        while not self._rob.is_program_running() or (lingering and not convergence.is_moving()):
+            if self._dispatcher.is_cancelled():
+                raise MotionCancelledError("Motion stopped before the program started")
+            if convergence is not None and convergence.is_converged():
+                return self.__converged(waiting_start_time)
             time.sleep(0.1)
             if time.time() - waiting_start_time > self._wait_timeout_limit:
                 raise RuntimeError("Timeout waiting for program to start")
-        else:
-            start_time = time.time()
-            self._logger.info("Waiting for program to complete")
+        start_time = time.time()
+        self._idle.start(start_time)
+        self.__record("started")
+        self._logger.info("Waiting for program to complete")
         while self._rob.is_program_running():
-            if time.time() - start_time > self._program_running_timeout_limit:
-                raise RuntimeError("Timeout waiting for program to complete")
+            if self._dispatcher.is_cancelled():
+                raise MotionCancelledError(f"Motion stopped after {time.time() - start_time:.3f} s")
+            if convergence is not None and convergence.is_converged():
+                return self.__converged(start_time)
+            if progress is not None:
+                progress.update(time.time() - start_time)
+            time.sleep(0.1)
+            if time.time() - start_time > timeout:
+                raise RuntimeError(f"Timeout waiting for program to complete after {timeout} s")
+        finished = time.time()
+        self._lingering_program = False
+        self._idle.finish(finished)
+        self.__record("finished")
+        return finished - start_time, "program"
+
+    def __converged(self, start_time):
+        finished = time.time()
+        self._logger.info("Robot settled at the target, not waiting for the program to end")
+        self._lingering_program = True
+        self._idle.finish(finished)
+        self.__record("finished")
+        return finished - start_time, "converged"
 
 
 class MockUrxEService(UrxEService):
@@ -854,77 +1764,199 @@ class MockUrxEService(UrxEService):
     def __init__(self):
         super().__init__(logger=Logger(__name__))
         self.__start_bot()
+        self._pipeline.start(self.__run_pipeline)
         self._current_position = [0, 0, 0, 0, 0, 0]
+        self._recorder = StateRecorder(self._history, self.__read_state, STATE_HISTORY_RATE, self._logger,
+                                       snapshot=self._snapshot)
+        self._recorder.start()
 
     def get_connection_status(self):
         return 0
 
+    @dispatched
     def open_gripper(self):
-        return "Gripper opened"
+        return self.__gripper_state(0)
 
+    @dispatched
     def close_gripper(self):
-        return "Gripper closed"
+        return self.__gripper_state(255)
 
+    @dispatched
     def partial_gripper(self, amount):
-        return f"Gripper partially opened/closed to {amount}"
+        return self.__gripper_state(amount)
+
+    def __gripper_state(self, amount):
+        self._logger.info(f"Moving gripper to {amount}")
+        return {"position": amount, "object_detected": False, "object_status": 3}
 
-    def movej(self, joint_positions, acceleration, velocity, pose_object=True, relative=False):
+    @dispatched
+    def movej(self, joint_positions, acceleration, velocity, pose_object=True, relative=False, gripper=None,
+              report=None, completion="program", completion_tolerance=None):
         self._logger.info(
             f"Moving to joint positions: {joint_positions}, with acceleration: {self._acceleration if acceleration is None else acceleration} and velocity: {self._velocity if velocity is None else velocity}")
+        acceleration, velocity = get_acceleration_and_velocity_to_use(acceleration, velocity, self._acceleration,
+                                                                      self._velocity)
+        self.__report(report, "movej", self._estimator.estimate_movej(self.get_current_joint_positions(),
+                                                                      joint_positions, acceleration, velocity,
+                                                                      pose_object, relative), gripper, completion)
         return joint_positions
 
-    def movel(self, coordinates_and_angles, acceleration, velocity, pose_object=True, relative=False):
+    @dispatched
+    def movel(self, coordinates_and_angles, acceleration, velocity, pose_object=True, relative=False, gripper=None,
+              report=None, completion="program", completion_tolerance=None):
         self._logger.info(
             f"Moving to coordinates and angles: {coordinates_and_angles}, with acceleration: {self._acceleration if acceleration is None else acceleration} and velocity: {self._velocity if velocity is None else velocity}")
+        acceleration, velocity = get_acceleration_and_velocity_to_use(acceleration, velocity, self._acceleration,
+                                                                      self._velocity)
+        self.__report(report, "movel", self._estimator.estimate_movel(self.get_current_pose(), coordinates_and_angles,
+                                                                      acceleration, velocity, pose_object, relative),
+                      gripper, completion)
         return coordinates_and_angles
 
-    def movels(self, coordinates_list, acceleration, velocity):
+    @dispatched
+    def movels(self, coordinates_list, acceleration, velocity, gripper=None, report=None, completion="program",
+               completion_tolerance=None):
         self._logger.info(
             f"Moving to coordinates and angles: {coordinates_list}, with acceleration: {self._acceleration if acceleration is None else acceleration} and velocity: {self._velocity if velocity is None else velocity}")
+        acceleration, velocity = get_acceleration_and_velocity_to_use(acceleration, velocity, self._acceleration,
+                                                                      self._velocity)
+        self.__report(report, "movels", self._estimator.estimate_movels(self.get_current_pose(), coordinates_list,
+                                                                        acceleration, velocity), gripper, completion)
         return coordinates_list
 
-    def __move(self, direction, distance, acceleration, velocity):
+    @dispatched
+    def stream_trajectory(self, path, acceleration, velocity, report=None, completion="program",
+                          completion_tolerance=None):
+        acceleration, velocity = get_acceleration_and_velocity_to_use(acceleration, velocity, self._acceleration,
+                                                                      self._velocity)
+        self._logger.info(f"Streaming trajectory in chunks of {STREAM_CHUNK_SIZE} waypoints, with acceleration: "
+                          f"{acceleration} and velocity: {velocity}")
+        pose, waypoints, count, estimate = self.get_current_pose(), 0, 0, 0.0
+        for chunk in read_chunks(path, STREAM_CHUNK_SIZE):
+            steps = [{"type": "movel", "coordinates_and_angles": waypoint, "acceleration": acceleration,
+                      "velocity": velocity} for waypoint in chunk.tolist()]
+            compile_sequence(assign_blends(steps, pose, STREAM_BLEND_RADIUS))
+            estimate += self._estimator.estimate_movels(pose, chunk.tolist(), acceleration, velocity)
+            pose, waypoints, count = chunk[-1].tolist(), waypoints + len(chunk), count + 1
+        self._current_position = pose
+        self.__report(report, "movels", estimate, completion=completion)
+        if report is not None:
+            report["waypoints"] = waypoints
+            report["chunks"] = count
+        return pose
+
+    @dispatched
+    def run_sequence(self, steps, report=None):
+        self._logger.info(f"Running sequence of {len(steps)} steps")
+        steps = [self.__resolve_step(step) for step in steps]
+        compile_sequence(steps)
+        self.__report(report, "sequence", self._estimator.estimate_sequence(self.get_current_joint_positions(), steps))
+        if report is not None:
+            report["steps"] = [{"index": index, "type": step["type"], "completed_at": None, "duration": None}
+                               for index, step in enumerate(steps)]
+        return self.get_current_pose()
+
+    def __resolve_step(self, step):
+        if step["type"] not in ARM_STEPS:
+            return step
+        acceleration, velocity = get_acceleration_and_velocity_to_use(step.get("acceleration"), step.get("velocity"),
+                                                                      self._acceleration, self._velocity)
+        return {**step, "acceleration": acceleration, "velocity": velocity}
+
+    def compile_program(self, steps):
+        steps = [self.__resolve_step(step) for step in steps]
+        return steps, compile_sequence_body(steps, parameterized=True), self.__path_estimate(
+            steps, self.get_current_joint_positions())
+
+    @dispatched
+    def run_program(self, program, offset, speed, report=None):
+        self._logger.info(f"Running program {program.name} with offset: {offset} and speed: {speed}")
+        program.encode(offset, speed)
+        self.__report(report, "program", self.__program_estimate(program, offset, speed,
+                                                                 self.get_current_joint_positions()))
+        return self.get_current_pose()
+
+    def __path_estimate(self, steps, current_joints):
+        # The approach to the first arm target depends on where the robot is when the program is invoked.
+        approach_end = next((index + 1 for index, step in enumerate(steps) if step["type"] in ARM_STEPS), 0)
+        total = self._estimator.estimate_sequence(current_joints, steps)
+        approach = self._estimator.estimate_sequence(current_joints, steps[:approach_end])
+        return None if total is None or approach is None else total - approach
+
+    def __program_estimate(self, program, offset, speed, current_joints):
+        approach_step = program.get_approach_step(offset)
+        approach = 0.0
+        if approach_step is not None:
+            approach = self._estimator.estimate_sequence(current_joints, [approach_step])
+        if approach is None or program.path_estimate is None:
+            return None
+        return (approach + program.path_estimate) / speed
+
+    def __move(self, direction, distance, acceleration, velocity, report=None, completion="program",
+               completion_tolerance=None):
         self._logger.info(
             f"Moving {direction} by {distance}, with acceleration: {self._acceleration if acceleration is None else acceleration} and velocity: {self._velocity if velocity is None else velocity}")
+        offset = [0, 0, 0, 0, 0, 0]
+        offset[direction] = distance
+        acceleration, velocity = get_acceleration_and_velocity_to_use(acceleration, velocity, self._acceleration,
+                                                                      self._velocity)
+        self.__report(report, "movel", self._estimator.estimate_movel(self.get_current_pose(), offset, acceleration,
+                                                                      velocity, relative=True), completion=completion)
         temp = self.get_current_pose()
         temp[direction] += distance
         self._current_position = temp
         return self.get_current_pose()
 
-    def up(self, z, acceleration, velocity):
-        return self.__move(2, z, acceleration, velocity)
+    @dispatched
+    def up(self, z, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
+        return self.__move(2, z, acceleration, velocity, report, completion, completion_tolerance)
 
-    def down(self, z, acceleration, velocity):
-        return self.__move(2, -z, acceleration, velocity)
+    @dispatched
+    def down(self, z, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
+        return self.__move(2, -z, acceleration, velocity, report, completion, completion_tolerance)
 
-    def left(self, x, acceleration, velocity):
-        return self.__move(0, -x, acceleration, velocity)
+    @dispatched
+    def left(self, x, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
+        return self.__move(0, -x, acceleration, velocity, report, completion, completion_tolerance)
 
-    def right(self, x, acceleration, velocity):
-        return self.__move(0, x, acceleration, velocity)
+    @dispatched
+    def right(self, x, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
+        return self.__move(0, x, acceleration, velocity, report, completion, completion_tolerance)
 
-    def forward(self, y, acceleration, velocity):
-        return self.__move(1, y, acceleration, velocity)
+    @dispatched
+    def forward(self, y, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
+        return self.__move(1, y, acceleration, velocity, report, completion, completion_tolerance)
 
-    def backward(self, y, acceleration, velocity):
-        return self.__move(1, -y, acceleration, velocity)
+    @dispatched
+    def backward(self, y, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
+        return self.__move(1, -y, acceleration, velocity, report, completion, completion_tolerance)
 
-    def __rotate(self, axis, angle, acceleration, velocity):
+    def __rotate(self, axis, angle, acceleration, velocity, report=None, completion="program",
+                 completion_tolerance=None):
         self._logger.info(
             f"Rotating around {axis} by {angle}, with acceleration: {self._acceleration if acceleration is None else acceleration} and velocity: {self._velocity if velocity is None else velocity}")
+        offset = [0, 0, 0, 0, 0, 0]
+        offset[axis] = angle
+        acceleration, velocity = get_acceleration_and_velocity_to_use(acceleration, velocity, self._acceleration,
+                                                                      self._velocity)
+        self.__report(report, "movel", self._estimator.estimate_movel(self.get_current_pose(), offset, acceleration,
+                                                                      velocity, relative=True), completion=completion)
         temp = self.get_current_pose()
         temp[axis] += angle
         self._current_position = temp
         return self.get_current_pose()
 
-    def roll(self, rx, acceleration, velocity):
-        return self.__rotate(0, rx, acceleration, velocity)
+    @dispatched
+    def roll(self, rx, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
+        return self.__rotate(0, rx, acceleration, velocity, report, completion, completion_tolerance)
 
-    def pitch(self, ry, acceleration, velocity):
-        return self.__rotate(1, ry, acceleration, velocity)
+    @dispatched
+    def pitch(self, ry, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
+        return self.__rotate(1, ry, acceleration, velocity, report, completion, completion_tolerance)
 
-    def yaw(self, rz, acceleration, velocity):
-        return self.__rotate(2, rz, acceleration, velocity)
+    @dispatched
+    def yaw(self, rz, acceleration, velocity, report=None, completion="program", completion_tolerance=None):
+        return self.__rotate(2, rz, acceleration, velocity, report, completion, completion_tolerance)
 
     def set_velocity(self, velocity):
         self._logger.info(f"Setting velocity to: {velocity}")
@@ -971,7 +2003,29 @@ class MockUrxEService(UrxEService):
     def get_current_tool_position(self):
         return [0, 0, 0]
 
+    def forward_kinematics(self, joint_positions_list):
+        return batch_forward_kinematics(joint_positions_list, self._tcp).tolist()
+
+    def inverse_kinematics(self, poses, reference_joint_positions=None, all_solutions=False):
+        if reference_joint_positions is None:
+            reference_joint_positions = self.get_current_joint_positions()
+        return solve_inverse_kinematics(poses, reference_joint_positions, self._tcp, all_solutions)
+
+    def get_state_history(self, start=None, end=None, max_points=1000, method="lttb"):
+        return self._history.query(start, end, max_points, method)
+
+    def get_history_stats(self):
+        return {**self._history.get_stats(), "rate": STATE_HISTORY_RATE,
+                "snapshot": self._snapshot.name if self._snapshot is not None else None}
+
+    def get_startup_timings(self):
+        return self._startup_timings
+
+    def __read_state(self):
+        return self.get_current_pose(), self.get_current_joint_positions()
+
     def __start_bot(self):
+        self._startup_timings = {"started_at": time.time(), "total": 0.0, "steps": {}}
         return "Started bot"
 
     def __stop_bot(self):
@@ -980,5 +2034,59 @@ class MockUrxEService(UrxEService):
     def reset(self):
         return "Reset bot"
 
-    def __wait_for_completion(self):
+    def get_estimator_stats(self):
+        return self._estimator.get_stats()
+
+    def stop(self, mode="joint", deceleration=None):
+        command = "stopl" if mode == "linear" else "stopj"
+        if deceleration is None:
+            deceleration = STOP_LINEAR_DECELERATION if mode == "linear" else STOP_JOINT_DECELERATION
+        flushed = self.__flush_pipeline()
+        running, dispatched = self._dispatcher.stop()
+        flushed += dispatched
+        self._idle.reset()
+        self._logger.info(f"Stopped robot with {command}({deceleration})")
+        return {"running": running, "flushed": flushed}
+
+    def __run_pipeline(self, client):
+        self._dispatcher.run(lambda: self.__stream_pipeline(client), client)
+
+    def __stream_pipeline(self, client):
+        while True:
+            items = self._pipeline.take(client)
+            if not items:
+                return
+            for item in items:
+                self._logger.info(f"Running pipelined {item.step['type']}")
+                now = time.time()
+                self._idle.start(now)
+                for event in ("dispatched", "sent", "started", "finished"):
+                    self._timeline.record(item.correlation_id, event, now, method="pipeline")
+                self._idle.finish(now)
+                if item.step["type"] == "movel" and item.step.get("pose_object", True):
+                    self._current_position = list(item.step["coordinates_and_angles"])
+            if self._dispatcher.has_queued():
+                return
+
+    def __flush_pipeline(self):
+        items = self._pipeline.flush()
+        for item in items:
+            self._timeline.annotate(item.correlation_id, error="Motion stopped before it was sent")
+        return len(items)
+
+    def __report(self, report, kind, estimate, gripper=None, completion="program"):
+        # The mock motions complete as soon as they are sent.
+        now = time.time()
+        self._idle.start(now)
+        self._idle.finish(now)
+        if self._correlation_id is not None:
+            for event in ("sent", "started", "finished"):
+                self._timeline.record(self._correlation_id, event, now)
+        if report is not None:
+            report["estimated_duration"] = self._estimator.predict(kind, estimate)
+            report["completed_by"] = completion
+            if gripper is not None:
+                report["gripper"] = self.__gripper_state(gripper)
+
+    def __wait_for_completion(self, timeout=None, progress=None, convergence=None):
         return "Waited for completion"
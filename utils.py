@@ -1,13 +1,20 @@
-import json
+import re
+
+from codec import compiled_schema, dumps, loads
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+# Correlation IDs are written into the programs sent to the robot, so they are restricted to safe characters.
+CORRELATION_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
 
 
 class ApiResponse:
-    def __init__(self, status, body):
+    def __init__(self, status, body, headers=None):
         self.__status = status
         self.__body = body
+        self.__headers = JSON_HEADERS if headers is None else {**JSON_HEADERS, **headers}
 
     def to_json(self):
-        return json.dumps(self.__body), self.__status
+        return dumps(self.__body), self.__status, self.__headers
 
 
 def parse_movel_instruction(coordinates_and_angles, acceleration, velocity, pose_object, relative):
@@ -25,9 +32,9 @@ def parse_movel_instruction(coordinates_and_angles, acceleration, velocity, pose
 
 def parse_movej_instruction(joint_positions, acceleration, velocity, position, relative):
     if position:
-        instruction = f"movej(p{str(joint_positions)}, {acceleration}, {velocity})\n"
+        instruction = f"movej(p{str(joint_positions)}, {acceleration}, {velocity}"
     else:
-        instruction = f"movej({str(joint_positions)}, {acceleration}, {velocity})\n"
+        instruction = f"movej({str(joint_positions)}, {acceleration}, {velocity}"
     if relative:
         instruction = instruction + ", relative=True)\n"
     else:
@@ -36,17 +43,88 @@ def parse_movej_instruction(joint_positions, acceleration, velocity, position, r
     return encoded_instruction
 
 
+def mark_program(program, correlation_id):
+    """
+        Mark a program with the correlation ID of the request it runs for.
+
+        The mark is a textmsg call, so the ID shows in the log of the controller and in captures of the robot
+        traffic. A program made of instructions without a def line is wrapped in one.
+
+        Parameters
+        ----------
+        program : bytes
+            The encoded program.
+        correlation_id : str
+            The correlation ID, matching CORRELATION_ID_PATTERN.
+
+        Returns
+        -------
+        bytes
+            The encoded marked program.
+    """
+    marker = f'  textmsg("correlation_id: {correlation_id}")\n'.encode("utf-8")
+    if program.startswith((b"def ", b"sec ")):
+        header, _, body = program.partition(b"\n")
+        return header + b"\n" + marker + body
+    body = b"".join(b"  " + line + b"\n" for line in program.splitlines() if line.strip())
+    return b"def correlatedProg():\n" + marker + body + b"end\n"
+
+
 def get_acceleration_and_velocity_to_use(acceleration, velocity, default_acceleration, default_velocity):
     acceleration = default_acceleration if acceleration is None else acceleration
     velocity = default_velocity if velocity is None else velocity
     return acceleration, velocity
 
 
+def parse_client_settings(value, convert=float):
+    """
+        Parse a setting per client written as "name=value,name=value".
+
+        Returns
+        -------
+        dict
+            The converted value of every client, empty if the setting is not set.
+    """
+    if not value:
+        return {}
+    settings = {}
+    for item in value.split(","):
+        name, setting = item.split("=", 1)
+        settings[name.strip()] = convert(setting.strip())
+    return settings
+
+
 def validate_json_structure(request):
     if not request.is_json:
         raise AttributeError("Invalid body, must be a JSON")
     else:
         try:
-            request.json
+            return loads(request.get_data(cache=False))
         except Exception:
             raise AttributeError("Invalid body, must be a JSON")
+
+
+def load_request_body(request, schema_class):
+    """
+        Parse the JSON body of a request once and load it with the compiled version of a schema.
+
+        Parameters
+        ----------
+        request : flask.Request
+            The incoming request.
+        schema_class : type
+            The marshmallow schema class to load the body with.
+
+        Returns
+        -------
+        dict
+            The loaded data.
+
+        Raises
+        ------
+        AttributeError
+            If the body is not a JSON.
+        ValidationError
+            If the body does not match the schema.
+    """
+    return compiled_schema(schema_class).load(validate_json_structure(request))